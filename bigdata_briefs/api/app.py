@@ -1,5 +1,6 @@
 import time
 from functools import partial
+from threading import Thread
 from typing import Annotated
 from uuid import UUID, uuid4
 
@@ -17,6 +18,9 @@ from bigdata_briefs.api.models import (
 )
 from bigdata_briefs.api.secure import query_scheme
 from bigdata_briefs.api.storage import StorageManager
+from bigdata_briefs.cache import SQLiteCache
+from bigdata_briefs.concurrency_limiter import AdaptiveConcurrencyLimiter
+from bigdata_briefs.llm_batch import LLMBatchClient
 from bigdata_briefs.metrics import (
     LLMMetrics,
     Metrics,
@@ -27,17 +31,73 @@ from bigdata_briefs.query_service.api import (
 )
 from bigdata_briefs.service import BriefPipelineService
 from bigdata_briefs.settings import UNSET, settings
+from bigdata_briefs.topic_yield import SQLiteTopicYieldStorage
 from bigdata_briefs.tracing.service import TraceEventName, TracingService
 
 engine = create_engine(settings.DB_STRING, echo=LOG_LEVEL == "DEBUG")
 
 embedding_storage = SQLiteEmbeddingStorage(engine)
-query_service = APIQueryService()
+search_cache = (
+    SQLiteCache(
+        engine,
+        namespace="search",
+        ttl_seconds=settings.SEARCH_CACHE_TTL_SECONDS,
+        max_size_bytes=settings.SEARCH_CACHE_MAX_SIZE_MB * 1024 * 1024,
+    )
+    if settings.SEARCH_CACHE_ENABLED
+    else None
+)
+# Shared by the query service and the pipeline, so both layers follow the same limit
+concurrency_limiter = AdaptiveConcurrencyLimiter.from_settings()
+entity_cache = (
+    SQLiteCache(
+        engine,
+        namespace="entities",
+        ttl_seconds=settings.ENTITY_CACHE_TTL_SECONDS,
+        max_size_bytes=settings.ENTITY_CACHE_MAX_SIZE_MB * 1024 * 1024,
+    )
+    if settings.ENTITY_CACHE_ENABLED
+    else None
+)
+watchlist_cache = (
+    SQLiteCache(
+        engine,
+        namespace="watchlists",
+        ttl_seconds=settings.WATCHLIST_CACHE_TTL_SECONDS,
+        max_size_bytes=settings.WATCHLIST_CACHE_MAX_SIZE_MB * 1024 * 1024,
+    )
+    if settings.WATCHLIST_CACHE_ENABLED
+    else None
+)
+llm_cache = (
+    SQLiteCache(
+        engine,
+        namespace="llm",
+        ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+        max_size_bytes=settings.LLM_CACHE_MAX_SIZE_MB * 1024 * 1024,
+    )
+    if settings.LLM_CACHE_ENABLED
+    else None
+)
+topic_yield_storage = (
+    SQLiteTopicYieldStorage(engine) if settings.TOPIC_YIELD_STATS_ENABLED else None
+)
+llm_batch_client = LLMBatchClient.from_settings(engine)
+query_service = APIQueryService(
+    search_cache=search_cache,
+    concurrency_limiter=concurrency_limiter,
+    entity_cache=entity_cache,
+    watchlist_cache=watchlist_cache,
+)
 tracing_service = TracingService()
 brief_service = BriefPipelineService.factory(
     query_service=query_service,
     tracing_service=tracing_service,
     embedding_storage=embedding_storage,
+    concurrency_limiter=concurrency_limiter,
+    topic_yield_storage=topic_yield_storage,
+    llm_cache=llm_cache,
+    llm_batch_client=llm_batch_client,
 )
 
 
@@ -55,6 +115,24 @@ def get_storage_manager(session: Session = Depends(get_session)) -> StorageManag
     return StorageManager(session)
 
 
+def resume_batch_briefs():
+    """Run again the briefs that were waiting on LLM batches when the service stopped. Their
+    calls already sent in batches are not sent again."""
+    if llm_batch_client is None:
+        return
+    for request_id, request in llm_batch_client.storage.pending_briefs().items():
+        logger.info("Resuming brief waiting on LLM batches", request_id=request_id)
+        storage_manager = StorageManager(Session(engine))
+        storage_manager.update_status(request_id, WorkflowStatus.QUEUED)
+        storage_manager.log_message(request_id, "Resuming brief after a restart")
+        Thread(
+            target=brief_service.generate_brief,
+            args=(BriefCreationRequest.model_validate(request),),
+            kwargs={"request_id": request_id, "storage_manager": storage_manager},
+            daemon=True,
+        ).start()
+
+
 def lifespan(app: FastAPI):
     logger.info("Starting Bigdata briefs service", version=__version__)
     if settings.BIGDATA_API_KEY != UNSET:
@@ -71,6 +149,7 @@ def lifespan(app: FastAPI):
         storage_manager = StorageManager(session)
         storage_manager.initialize_with_example_data()
 
+    resume_batch_briefs()
     yield
     query_service.cleanup()
 
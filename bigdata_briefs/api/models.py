@@ -4,6 +4,7 @@ from enum import Enum, StrEnum
 from pydantic import BaseModel, Field
 
 from bigdata_briefs.models import BriefReport
+from bigdata_briefs.scheduler import Priority
 from bigdata_briefs.settings import settings
 
 
@@ -113,6 +114,22 @@ class BriefCreationRequest(BaseModel):
         le=10,
         examples=[settings.API_FRESHNESS_BOOST],
     )
+    query_unit_budget: float | None = Field(
+        None,
+        description="Maximum query units the brief can consume. When the budget gets close, the brief searches fewer topics, then asks fewer follow-up questions, and finally only uses the results of the pre-screen. Defaults to the `QUERY_UNIT_BUDGET` setting, no limit if unset.",
+        gt=0,
+        examples=[None],
+    )
+    priority: Priority = Field(
+        Priority.INTERACTIVE,
+        description="Scheduling class of the brief. Searches of interactive briefs are served before the ones of batch briefs, briefs of the same class share the search capacity fairly.",
+        examples=[Priority.INTERACTIVE],
+    )
+    llm_batch: bool = Field(
+        False,
+        description="Send the LLM calls of all the entities through the batch API of the LLM provider, at a lower cost and without using the rate limits of the online calls. The brief can take hours to complete, it's resumed if the service restarts. Requires the `LLM_BATCH_ENABLED` setting.",
+        examples=[False],
+    )
 
 
 class BriefAcceptedResponse(BaseModel):
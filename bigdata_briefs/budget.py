@@ -0,0 +1,119 @@
+from contextvars import ContextVar, Token
+from enum import IntEnum
+from threading import Lock
+
+from bigdata_briefs.exceptions import QueryUnitBudgetExceededError
+from bigdata_briefs.models import QueryUnitBudgetUsage
+from bigdata_briefs.settings import settings
+
+
+class DegradationLevel(IntEnum):
+    """Work shed by the pipeline as the budget runs out, each level includes the previous ones"""
+
+    NONE = 0
+    FEWER_TOPICS = 1
+    FEWER_FOLLOW_UP_QUESTIONS = 2
+    PRE_SCREEN_ONLY = 3
+
+
+class QueryUnitBudget:
+    def __init__(
+        self,
+        limit: float | None,
+        *,
+        fewer_topics_at: float = settings.QUERY_UNIT_BUDGET_FEWER_TOPICS_AT,
+        fewer_follow_up_questions_at: float = settings.QUERY_UNIT_BUDGET_FEWER_FOLLOW_UP_QUESTIONS_AT,
+        pre_screen_only_at: float = settings.QUERY_UNIT_BUDGET_PRE_SCREEN_ONLY_AT,
+    ):
+        """Query units a brief is allowed to consume.
+
+        The query service consumes the units of every search sent to the API and rejects new
+        searches once the budget is exhausted. Before that, the pipeline sheds work following
+        the degradation level, which rises as the used fraction of the budget crosses each
+        threshold. A budget without limit only keeps track of the units used.
+        """
+        self.limit = limit
+        self.thresholds = [
+            (pre_screen_only_at, DegradationLevel.PRE_SCREEN_ONLY),
+            (fewer_follow_up_questions_at, DegradationLevel.FEWER_FOLLOW_UP_QUESTIONS),
+            (fewer_topics_at, DegradationLevel.FEWER_TOPICS),
+        ]
+        self._used = 0.0
+        self._usage = QueryUnitBudgetUsage(query_unit_budget=limit)
+        self._lock = Lock()
+
+    @property
+    def used(self) -> float:
+        with self._lock:
+            return self._used
+
+    def is_exhausted(self) -> bool:
+        return self.limit is not None and self.used >= self.limit
+
+    def degradation_level(self) -> DegradationLevel:
+        if self.limit is None:
+            return DegradationLevel.NONE
+        used_fraction = self.used / self.limit
+        for threshold, level in self.thresholds:
+            if used_fraction >= threshold:
+                return level
+        return DegradationLevel.NONE
+
+    def check(self):
+        """Raise if the budget is exhausted, called before sending a search"""
+        if self.is_exhausted():
+            with self._lock:
+                self._usage.rejected_searches += 1
+            raise QueryUnitBudgetExceededError(
+                f"Query unit budget of {self.limit} exhausted, {self.used} used"
+            )
+
+    def consume(self, query_units: float):
+        with self._lock:
+            self._used += query_units
+
+    def record_shed(
+        self,
+        *,
+        topics: int = 0,
+        follow_up_questions: int = 0,
+        pre_screen_only_entities: int = 0,
+    ):
+        with self._lock:
+            self._usage.topics_shed += topics
+            self._usage.follow_up_questions_shed += follow_up_questions
+            self._usage.pre_screen_only_entities += pre_screen_only_entities
+
+    def usage(self) -> QueryUnitBudgetUsage:
+        with self._lock:
+            return self._usage.model_copy(update={"query_units_used": self._used})
+
+
+_query_unit_budget: ContextVar[QueryUnitBudget | None] = ContextVar(
+    "query_unit_budget", default=None
+)
+
+
+def set_query_unit_budget(budget: QueryUnitBudget) -> Token:
+    """Charge the searches sent from the current context, usually a brief, to `budget`.
+
+    Threads started from this context only inherit it if they are submitted with
+    `bigdata_briefs.utils.submit_with_context`.
+    """
+    return _query_unit_budget.set(budget)
+
+
+def reset_query_unit_budget(token: Token):
+    _query_unit_budget.reset(token)
+
+
+def get_query_unit_budget() -> QueryUnitBudget | None:
+    return _query_unit_budget.get()
+
+
+def get_degradation_level() -> DegradationLevel:
+    """Degradation level of the budget of the current context, if any"""
+    budget = get_query_unit_budget()
+    if budget is None:
+        return DegradationLevel.NONE
+    return budget.degradation_level()
@@ -0,0 +1,214 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Any
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, col, delete, func, select, update
+
+from bigdata_briefs import logger
+from bigdata_briefs.sql_models import SQLCacheEntry
+
+# The access time of an entry is only written if it is older than this, so most reads don't write
+ACCESS_TIME_RESOLUTION_SECONDS = 60
+
+
+class Cache(ABC):
+    @abstractmethod
+    def get(self, key: str) -> Any | None: ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, *, ttl_seconds: float | None = None): ...
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """Return the values found for `keys`, missing keys are not included"""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set_many(self, items: dict[str, Any], *, ttl_seconds: float | None = None):
+        for key, value in items.items():
+            self.set(key, value, ttl_seconds=ttl_seconds)
+
+
+class SQLiteCache(Cache):
+    """Persistent key-value cache stored in the service database.
+
+    Entries live in a shared table, isolated by `namespace`, so the same database can hold
+    several caches with their own TTL and size limits. Values must be JSON serializable.
+
+    :param engine: The database engine.
+    :param namespace: The name of the cache, used to isolate entries of different caches.
+    :param ttl_seconds: Time in seconds after which an entry is considered stale and ignored.
+    :param max_size_bytes: When the total size of the namespace exceeds this value, the least
+        recently accessed entries are evicted.
+
+    Reads only write the access time of an entry when it is older than
+    `ACCESS_TIME_RESOLUTION_SECONDS`, so the eviction order is approximate within that
+    resolution. The total size is summed once and then kept up to date on every write, eviction
+    only runs when it goes over `max_size_bytes`. Writes of other processes are only accounted
+    for the next time the cache evicts.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        *,
+        namespace: str,
+        ttl_seconds: float,
+        max_size_bytes: int,
+    ):
+        self.engine = engine
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self._size_lock = Lock()
+        self._size_bytes: int | None = None
+
+    def get(self, key: str) -> Any | None:
+        try:
+            with Session(self.engine) as session:
+                entry = session.get(SQLCacheEntry, (self.namespace, key))
+                if entry is None:
+                    return None
+
+                now = time.time()
+                if entry.expires_at < now:
+                    return None
+
+                value = entry.value
+                self._touch(session, [entry], now)
+                return value
+        except (SQLAlchemyError, ValueError) as e:
+            logger.warning(f"Failed to read from cache {self.namespace}, skipping: {e}")
+            return None
+
+    def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """Same as `get` for several keys, in a single transaction"""
+        if not keys:
+            return {}
+        try:
+            with Session(self.engine) as session:
+                now = time.time()
+                entries = session.exec(
+                    select(SQLCacheEntry).where(
+                        col(SQLCacheEntry.namespace) == self.namespace,
+                        col(SQLCacheEntry.key).in_(keys),
+                        col(SQLCacheEntry.expires_at) >= now,
+                    )
+                ).all()
+                values = {entry.key: entry.value for entry in entries}
+                self._touch(session, entries, now)
+                return values
+        except (SQLAlchemyError, ValueError) as e:
+            logger.warning(f"Failed to read from cache {self.namespace}, skipping: {e}")
+            return {}
+
+    def _touch(self, session: Session, entries: list[SQLCacheEntry], now: float):
+        """Update the access time of the entries, only if it is stale, to keep reads cheap"""
+        stale_keys = [
+            entry.key
+            for entry in entries
+            if now - entry.last_accessed_at >= ACCESS_TIME_RESOLUTION_SECONDS
+        ]
+        if not stale_keys:
+            return
+        session.exec(
+            update(SQLCacheEntry)
+            .where(
+                col(SQLCacheEntry.namespace) == self.namespace,
+                col(SQLCacheEntry.key).in_(stale_keys),
+            )
+            .values(last_accessed_at=now)
+        )
+        session.commit()
+
+    def set(self, key: str, value: Any, *, ttl_seconds: float | None = None):
+        """Store a value, `ttl_seconds` overrides the default TTL of the cache for this entry."""
+        self.set_many({key: value}, ttl_seconds=ttl_seconds)
+
+    def set_many(self, items: dict[str, Any], *, ttl_seconds: float | None = None):
+        """Same as `set` for several values, in a single transaction"""
+        if not items:
+            return
+        now = time.time()
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+        try:
+            sizes = {key: len(json.dumps(value)) for key, value in items.items()}
+            with Session(self.engine) as session:
+                replaced_size = session.exec(
+                    select(func.coalesce(func.sum(SQLCacheEntry.size_bytes), 0)).where(
+                        col(SQLCacheEntry.namespace) == self.namespace,
+                        col(SQLCacheEntry.key).in_(list(items)),
+                    )
+                ).one()
+                for key, value in items.items():
+                    entry = SQLCacheEntry(
+                        namespace=self.namespace,
+                        key=key,
+                        value=value,
+                        size_bytes=sizes[key],
+                        created_at=now,
+                        expires_at=now + ttl_seconds,
+                        last_accessed_at=now,
+                    )
+                    session.merge(entry)
+                session.commit()
+
+                with self._size_lock:
+                    if self._size_bytes is None:
+                        self._size_bytes = self._total_size(session)
+                    else:
+                        self._size_bytes += sum(sizes.values()) - replaced_size
+                    if self._size_bytes > self.max_size_bytes:
+                        self._size_bytes = self._evict(session, now)
+        except (SQLAlchemyError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to write to cache {self.namespace}, skipping: {e}")
+
+    def _total_size(self, session: Session) -> int:
+        return session.exec(
+            select(func.coalesce(func.sum(SQLCacheEntry.size_bytes), 0)).where(
+                SQLCacheEntry.namespace == self.namespace
+            )
+        ).one()
+
+    def _evict(self, session: Session, now: float) -> int:
+        """Remove the expired entries, and the least recently accessed ones until the cache
+        fits `max_size_bytes`. Returns the total size left."""
+        session.exec(
+            delete(SQLCacheEntry).where(
+                col(SQLCacheEntry.namespace) == self.namespace,
+                col(SQLCacheEntry.expires_at) < now,
+            )
+        )
+        total_size = self._total_size(session)
+
+        if total_size > self.max_size_bytes:
+            entries = session.exec(
+                select(SQLCacheEntry.key, SQLCacheEntry.size_bytes)
+                .where(SQLCacheEntry.namespace == self.namespace)
+                .order_by(col(SQLCacheEntry.last_accessed_at))
+            )
+            keys_to_evict = []
+            for key, size_bytes in entries:
+                if total_size <= self.max_size_bytes:
+                    break
+                keys_to_evict.append(key)
+                total_size -= size_bytes
+
+            session.exec(
+                delete(SQLCacheEntry).where(
+                    col(SQLCacheEntry.namespace) == self.namespace,
+                    col(SQLCacheEntry.key).in_(keys_to_evict),
+                )
+            )
+            logger.debug(f"Evicted {len(keys_to_evict)} entries from {self.namespace}")
+
+        session.commit()
+        return total_size
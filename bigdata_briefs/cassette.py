@@ -0,0 +1,228 @@
+import asyncio
+import importlib
+import json
+import time
+from collections import defaultdict
+from enum import StrEnum
+from functools import cache
+from pathlib import Path
+from threading import Lock
+
+import httpx
+import openai
+
+from bigdata_briefs import logger
+from bigdata_briefs.exceptions import CassetteMissError
+from bigdata_briefs.settings import settings
+from bigdata_briefs.utils import canonical_hash
+
+# Response headers that no longer apply once the body has been decoded and stored
+DROPPED_RESPONSE_HEADERS = {
+    "content-encoding",
+    "content-length",
+    "transfer-encoding",
+    "set-cookie",
+}
+
+
+class CassetteMode(StrEnum):
+    RECORD = "record"
+    REPLAY = "replay"
+
+
+class Cassette:
+    def __init__(self, path: str | Path, mode: CassetteMode, *, replay_latency: bool):
+        """HTTP interactions recorded to a local file, to run briefs offline and reproducibly
+
+        Every interaction is keyed on the canonical hash of the request method, path and JSON
+        payload, so the host and the order of the keys don't matter and no credentials are
+        stored. Requests with the same key are replayed in the order they were recorded, the
+        last one is repeated if there are more requests than recordings. With `replay_latency`
+        the replayed responses take as long as the recorded ones.
+
+        The file has a JSON interaction per line, recording appends to it.
+        """
+        self.path = Path(path)
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.lock = Lock()
+        self._interactions: dict[str, list[dict]] = defaultdict(list)
+        self._replayed: dict[str, int] = defaultdict(int)
+        if self.path.exists():
+            with self.path.open() as f:
+                for line in f:
+                    interaction = json.loads(line)
+                    self._interactions[interaction["key"]].append(interaction)
+
+    @classmethod
+    def from_settings(cls) -> "Cassette | None":
+        if settings.CASSETTE_PATH is None:
+            return None
+        logger.info(
+            f"Using cassette {settings.CASSETTE_PATH} in {settings.CASSETTE_MODE} mode"
+        )
+        return cls(
+            settings.CASSETTE_PATH,
+            CassetteMode(settings.CASSETTE_MODE),
+            replay_latency=settings.CASSETTE_REPLAY_LATENCY,
+        )
+
+    @staticmethod
+    def request_key(request: httpx.Request) -> str:
+        body = request.content.decode()
+        try:
+            body = json.loads(body) if body else None
+        except json.JSONDecodeError:
+            pass
+        return canonical_hash(
+            {
+                "method": request.method,
+                "path": request.url.raw_path.decode(),
+                "body": body,
+            }
+        )
+
+    def replay(self, request: httpx.Request) -> tuple[httpx.Response, float]:
+        """Return the recorded response to `request` and the latency it had"""
+        key = self.request_key(request)
+        with self.lock:
+            recordings = self._interactions.get(key)
+            if not recordings:
+                raise CassetteMissError(
+                    f"No recording of {request.method} {request.url.path} in {self.path}"
+                )
+            interaction = recordings[min(self._replayed[key], len(recordings) - 1)]
+            self._replayed[key] += 1
+
+        response = http_module(request).Response(
+            interaction["status_code"],
+            headers=interaction["headers"],
+            content=interaction["content"].encode(),
+            request=request,
+        )
+        return response, interaction["latency"] if self.replay_latency else 0.0
+
+    def record(self, request: httpx.Request, response: httpx.Response, latency: float):
+        interaction = {
+            "key": self.request_key(request),
+            "method": request.method,
+            "path": request.url.path,
+            "status_code": response.status_code,
+            "headers": {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() not in DROPPED_RESPONSE_HEADERS
+            },
+            "content": response.text,
+            "latency": latency,
+        }
+        with self.lock:
+            self._interactions[interaction["key"]].append(interaction)
+            with self.path.open("a") as f:
+                f.write(json.dumps(interaction) + "\n")
+
+
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(
+        self, cassette: Cassette, transport: httpx.BaseTransport | None = None
+    ):
+        """Transport recording the interactions of `transport` to the cassette, or replaying them"""
+        self.cassette = cassette
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        if self.cassette.mode == CassetteMode.REPLAY:
+            response, latency = self.cassette.replay(request)
+            if latency:
+                time.sleep(latency)
+            return response
+
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        response.read()
+        self.cassette.record(request, response, time.perf_counter() - start)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self, cassette: Cassette, transport: httpx.AsyncBaseTransport | None = None
+    ):
+        """Same as `CassetteTransport` for async clients"""
+        self.cassette = cassette
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.cassette.mode == CassetteMode.REPLAY:
+            response, latency = self.cassette.replay(request)
+            if latency:
+                await asyncio.sleep(latency)
+            return response
+
+        start = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        self.cassette.record(request, response, time.perf_counter() - start)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+@cache
+def get_cassette() -> Cassette | None:
+    """Cassette configured in the settings, shared by every client of the process"""
+    return Cassette.from_settings()
+
+
+def cassette_transport() -> CassetteTransport | None:
+    cassette = get_cassette()
+    return CassetteTransport(cassette) if cassette is not None else None
+
+
+def async_cassette_transport() -> AsyncCassetteTransport | None:
+    cassette = get_cassette()
+    return AsyncCassetteTransport(cassette) if cassette is not None else None
+
+
+def build_openai_client(**kwargs) -> openai.OpenAI:
+    """OpenAI client using the configured cassette, if any. `kwargs` are passed to the client"""
+    cassette = get_cassette()
+    if cassette is None:
+        return openai.OpenAI(**kwargs)
+    transport = CassetteTransport(cassette, openai_http_module().HTTPTransport())
+    return openai.OpenAI(
+        http_client=openai.DefaultHttpxClient(transport=transport), **kwargs
+    )
+
+
+def build_async_openai_client(**kwargs) -> openai.AsyncOpenAI:
+    """Same as `build_openai_client` for the async client"""
+    cassette = get_cassette()
+    if cassette is None:
+        return openai.AsyncOpenAI(**kwargs)
+    transport = AsyncCassetteTransport(
+        cassette, openai_http_module().AsyncHTTPTransport()
+    )
+    return openai.AsyncOpenAI(
+        http_client=openai.DefaultAsyncHttpxClient(transport=transport), **kwargs
+    )
+
+
+def openai_http_module():
+    # Recent versions of the SDK are built on a fork of httpx with the same API, the transport
+    # doing the actual requests must come from the module the SDK uses
+    return importlib.import_module(
+        openai.DefaultHttpxClient.__mro__[1].__module__.partition(".")[0]
+    )
+
+
+def http_module(request: httpx.Request):
+    """Module of `request`, either httpx or the fork used by the OpenAI SDK, responses must be
+    built with the same module as the request"""
+    return importlib.import_module(type(request).__module__.partition(".")[0])
@@ -0,0 +1,138 @@
+import statistics
+from collections.abc import Callable
+from math import sqrt
+from threading import Lock
+
+from bigdata_briefs import logger
+from bigdata_briefs.scheduler import FairShareScheduler
+from bigdata_briefs.settings import settings
+
+LATENCY_WINDOW_SIZE = 20  # Number of latency samples used to compute each p50
+LIMIT_SMOOTHING = (
+    0.2  # Weight of the new limit on every update, lower values = slower changes
+)
+BASELINE_SMOOTHING = 0.05  # Weight of every p50 on the long-term baseline latency
+LATENCY_TOLERANCE = (
+    1.5  # p50 can grow up to this factor over the baseline before shrinking
+)
+MIN_GRADIENT = 0.5  # Bounds how much the limit can shrink on a single update
+DROP_DECREASE_FACTOR = 0.9  # Applied to the limit on every timed out request
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(
+        self,
+        *,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        window_size: int = LATENCY_WINDOW_SIZE,
+        tolerance: float = LATENCY_TOLERANCE,
+    ):
+        """Concurrency limit that adapts to the latency observed on the API (gradient algorithm)
+
+        Latency samples are grouped in windows of `window_size` requests. The p50 of every window
+        is compared to a long-term baseline: while it stays within `tolerance` of the baseline the
+        limit grows by about its square root, when it rises over it the limit shrinks proportionally
+        to the increase. The limit only grows if the current limit is actually being used.
+
+        Every gate created with `new_gate` is resized when the limit changes, so layers that admit
+        work at different granularity (requests, pipeline fan-out) share the same limit.
+        """
+        self.lock = Lock()
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.window_size = window_size
+        self.tolerance = tolerance
+
+        self._limit = float(initial_limit)
+        self._baseline: float | None = None
+        self._samples: list[float] = []
+        self._max_in_flight = 0
+        self._listeners: list[Callable[[int], None]] = []
+
+    @classmethod
+    def from_settings(cls):
+        if not settings.API_ADAPTIVE_CONCURRENCY_ENABLED:
+            # A limiter that never changes its limit
+            return cls(
+                initial_limit=settings.API_SIMULTANEOUS_REQUESTS,
+                min_limit=settings.API_SIMULTANEOUS_REQUESTS,
+                max_limit=settings.API_SIMULTANEOUS_REQUESTS,
+            )
+        return cls(
+            initial_limit=settings.API_SIMULTANEOUS_REQUESTS,
+            min_limit=settings.API_MIN_SIMULTANEOUS_REQUESTS,
+            max_limit=settings.API_MAX_SIMULTANEOUS_REQUESTS,
+        )
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self._limit))
+
+    def new_gate(self) -> FairShareScheduler:
+        """Create a fair share semaphore whose capacity follows the limit"""
+        with self.lock:
+            gate = FairShareScheduler(self.limit)
+            self._listeners.append(gate.resize)
+        return gate
+
+    def record_latency(self, latency: float, in_flight: int):
+        """Record the latency of a completed request and the requests in flight when it started"""
+        with self.lock:
+            self._samples.append(latency)
+            self._max_in_flight = max(self._max_in_flight, in_flight)
+            if len(self._samples) < self.window_size:
+                return
+
+            p50 = statistics.median(self._samples)
+            max_in_flight = self._max_in_flight
+            self._samples.clear()
+            self._max_in_flight = 0
+
+            if self._baseline is None:
+                self._baseline = p50
+            else:
+                self._baseline += BASELINE_SMOOTHING * (p50 - self._baseline)
+            baseline = self._baseline
+
+            gradient = max(MIN_GRADIENT, min(1.0, self.tolerance * baseline / p50))
+            new_limit = self._limit * gradient
+            # Only probe for more capacity if the current limit is the bottleneck
+            if gradient == 1.0 and max_in_flight >= self._limit / 2:
+                new_limit += sqrt(self._limit)
+            previous_limit = self.limit
+            self._update_limit(
+                (1 - LIMIT_SMOOTHING) * self._limit + LIMIT_SMOOTHING * new_limit
+            )
+            limit = self.limit
+            if limit != previous_limit:
+                # Notify holding the lock so gates never see the updates out of order
+                self._notify(limit)
+
+        if limit != previous_limit:
+            logger.debug(
+                "Concurrency limit updated",
+                limit=limit,
+                p50_latency=round(p50, 3),
+                baseline_latency=round(baseline, 3),
+            )
+
+    def on_dropped(self):
+        """Record a request that timed out, which is a strong signal of overload"""
+        with self.lock:
+            previous_limit = self.limit
+            self._update_limit(self._limit * DROP_DECREASE_FACTOR)
+            limit = self.limit
+            if limit != previous_limit:
+                self._notify(limit)
+
+        if limit != previous_limit:
+            logger.debug("Concurrency limit decreased after a timeout", limit=limit)
+
+    def _update_limit(self, limit: float):
+        self._limit = min(self.max_limit, max(self.min_limit, limit))
+
+    def _notify(self, limit: int):
+        for listener in self._listeners:
+            listener(limit)
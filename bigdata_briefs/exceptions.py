@@ -8,3 +8,19 @@ class TooManyAPIRetriesError(Exception):
 
 class FailedBriefGenerationError(Exception):
     """FailedBriefGenerationError"""
+
+
+class QueryUnitBudgetExceededError(Exception):
+    """QueryUnitBudgetExceededError"""
+
+
+class CircuitOpenError(Exception):
+    """CircuitOpenError"""
+
+
+class CassetteMissError(Exception):
+    """CassetteMissError"""
+
+
+class LLMBatchError(Exception):
+    """LLMBatchError"""
@@ -0,0 +1,377 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from contextvars import ContextVar, Token
+from threading import Condition
+from typing import NamedTuple
+from uuid import UUID
+
+import openai
+from openai.lib._parsing._responses import type_to_text_format_param
+from openai.types.responses import Response
+from pydantic import BaseModel
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, col, select
+
+from bigdata_briefs import logger
+from bigdata_briefs.cassette import build_openai_client
+from bigdata_briefs.exceptions import LLMBatchError
+from bigdata_briefs.metrics import LLMMetrics
+from bigdata_briefs.models import LLMUsage
+from bigdata_briefs.settings import settings
+from bigdata_briefs.sql_models import SQLLLMBatchBrief, SQLLLMBatchCall
+from bigdata_briefs.utils import canonical_hash
+
+BATCH_ENDPOINT = "/v1/responses"
+# Batches in any other status are still running
+FINISHED_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchedCall(NamedTuple):
+    batch_id: str
+    # Body of the response, None until the batch is finished or if the call failed
+    output: dict | None
+    error: str | None
+
+
+class LLMBatchStorage(ABC):
+    @abstractmethod
+    def retrieve_calls(self, keys: list[str]) -> dict[str, BatchedCall]: ...
+
+    @abstractmethod
+    def add_batch(self, batch_id: str, keys: list[str]): ...
+
+    @abstractmethod
+    def set_results(self, results: dict[str, BatchedCall]): ...
+
+    @abstractmethod
+    def add_brief(self, request_id: UUID, request: dict): ...
+
+    @abstractmethod
+    def remove_brief(self, request_id: UUID): ...
+
+    @abstractmethod
+    def pending_briefs(self) -> dict[UUID, dict]: ...
+
+
+class SQLiteLLMBatchStorage(LLMBatchStorage):
+    def __init__(self, engine: Engine):
+        """Calls sent in batches and briefs waiting on them, stored in the service database"""
+        self.engine = engine
+
+    def retrieve_calls(self, keys: list[str]) -> dict[str, BatchedCall]:
+        if not keys:
+            return {}
+        with Session(self.engine) as session:
+            rows = session.exec(
+                select(SQLLLMBatchCall).where(col(SQLLLMBatchCall.key).in_(keys))
+            ).all()
+            return {
+                row.key: BatchedCall(row.batch_id, row.output, row.error)
+                for row in rows
+            }
+
+    def add_batch(self, batch_id: str, keys: list[str]):
+        now = time.time()
+        with Session(self.engine) as session:
+            for key in keys:
+                session.merge(
+                    SQLLLMBatchCall(key=key, batch_id=batch_id, created_at=now)
+                )
+            session.commit()
+
+    def set_results(self, results: dict[str, BatchedCall]):
+        with Session(self.engine) as session:
+            rows = session.exec(
+                select(SQLLLMBatchCall).where(
+                    col(SQLLLMBatchCall.key).in_(list(results))
+                )
+            ).all()
+            for row in rows:
+                row.output = results[row.key].output
+                row.error = results[row.key].error
+                session.add(row)
+            session.commit()
+
+    def add_brief(self, request_id: UUID, request: dict):
+        with Session(self.engine) as session:
+            session.merge(
+                SQLLLMBatchBrief(
+                    request_id=request_id, request=request, created_at=time.time()
+                )
+            )
+            session.commit()
+
+    def remove_brief(self, request_id: UUID):
+        with Session(self.engine) as session:
+            brief = session.get(SQLLLMBatchBrief, request_id)
+            if brief is not None:
+                session.delete(brief)
+                session.commit()
+
+    def pending_briefs(self) -> dict[UUID, dict]:
+        with Session(self.engine) as session:
+            rows = session.exec(
+                select(SQLLLMBatchBrief).order_by(col(SQLLLMBatchBrief.created_at))
+            ).all()
+            return {row.request_id: row.request for row in rows}
+
+
+class LLMBatchClient:
+    def __init__(
+        self,
+        storage: LLMBatchStorage,
+        client: openai.OpenAI | None = None,
+        *,
+        poll_interval_seconds: float,
+        completion_window: str = "24h",
+    ):
+        """Run LLM calls through the batch API of an OpenAI-compatible provider
+
+        Calls are keyed on the hash of their body. The batch of every call is stored before
+        waiting on it, and its response once the batch is finished, so after a restart the same
+        calls are answered from the storage or wait on the batch already submitted instead of
+        being sent again.
+        """
+        self.storage = storage
+        self.client = client or build_openai_client()
+        self.poll_interval_seconds = poll_interval_seconds
+        self.completion_window = completion_window
+
+    @classmethod
+    def from_settings(cls, engine: Engine) -> "LLMBatchClient | None":
+        if not settings.LLM_BATCH_ENABLED:
+            return None
+        return cls(
+            SQLiteLLMBatchStorage(engine),
+            poll_interval_seconds=settings.LLM_BATCH_POLL_INTERVAL_SECONDS,
+            completion_window=settings.LLM_BATCH_COMPLETION_WINDOW,
+        )
+
+    def run(self, bodies: dict[str, dict]) -> dict[str, BatchedCall]:
+        """Results of the `/v1/responses` request bodies, keyed like `bodies`. Calls missing
+        from the output of their batch are missing from the results."""
+        calls = self.storage.retrieve_calls(list(bodies))
+        results = {
+            key: call
+            for key, call in calls.items()
+            if call.output is not None or call.error is not None
+        }
+        running_batches = {
+            call.batch_id for key, call in calls.items() if key not in results
+        }
+        unsent = {key: body for key, body in bodies.items() if key not in calls}
+        if results or running_batches:
+            logger.info(
+                "Resuming LLM calls sent in previous batches",
+                finished_calls=len(results),
+                running_batches=len(running_batches),
+            )
+        if unsent:
+            running_batches.add(self.submit(unsent))
+
+        for batch_id in running_batches:
+            batch_results = self.wait(batch_id)
+            self.storage.set_results(batch_results)
+            results.update(batch_results)
+        return {key: results[key] for key in bodies if key in results}
+
+    def submit(self, bodies: dict[str, dict]) -> str:
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": key,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": body,
+                }
+            )
+            for key, body in bodies.items()
+        ]
+        batch_file = self.client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode(), "application/jsonl"),
+            purpose="batch",
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        self.storage.add_batch(batch.id, list(bodies))
+        logger.info("Submitted LLM batch", batch_id=batch.id, calls=len(bodies))
+        return batch.id
+
+    def wait(self, batch_id: str) -> dict[str, BatchedCall]:
+        """Poll the batch until it's finished and return its results, keyed on custom ID"""
+        batch = self.client.batches.retrieve(batch_id)
+        while batch.status not in FINISHED_BATCH_STATUSES:
+            logger.debug(
+                "Waiting for LLM batch", batch_id=batch_id, status=batch.status
+            )
+            time.sleep(self.poll_interval_seconds)
+            batch = self.client.batches.retrieve(batch_id)
+        if batch.status != "completed":
+            raise LLMBatchError(f"LLM batch {batch_id} is {batch.status}")
+
+        logger.info("LLM batch completed", batch_id=batch_id)
+        results = {}
+        for file_id in [batch.output_file_id, batch.error_file_id]:
+            if file_id is None:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                results[item["custom_id"]] = batched_call_from_output(batch_id, item)
+        return results
+
+
+def batched_call_from_output(batch_id: str, item: dict) -> BatchedCall:
+    """Result of a call from a line of the output or error file of a batch"""
+    response = item.get("response") or {}
+    if item.get("error") or response.get("status_code") != 200:
+        error = item.get("error") or response.get("body", {}).get("error")
+        return BatchedCall(batch_id, None, json.dumps(error) if error else "Failed")
+    return BatchedCall(batch_id, response["body"], None)
+
+
+class PendingCall(NamedTuple):
+    body: dict
+    text_format: type[BaseModel]
+    future: Future
+
+
+class LLMBatchCollector:
+    def __init__(self, batch_client: LLMBatchClient, participants: int):
+        """Collect the LLM calls of the entity pipelines of a brief and send them in batches
+
+        Every entity pipeline is a participant. A call blocks its pipeline until the batch with
+        the call is finished. Once every participant still running is blocked on a call, the
+        pending calls are sent as one batch by the last one, usually the follow-up questions of
+        all the entities and then their entity updates. Pipelines must `leave` once done, so
+        the others don't wait on them.
+        """
+        self.batch_client = batch_client
+        self.condition = Condition()
+        self.participants = participants
+        self.waiting = 0
+        self.pending: dict[str, PendingCall] = {}
+
+    def call_with_response_format(
+        self,
+        *,
+        system: list,
+        messages: list,
+        model: str,
+        max_tokens: int,
+        text_format: type[BaseModel],
+        **kwargs,
+    ):
+        """Same as `LLMClient.call_with_response_format`, through the next batch"""
+        body = dict(
+            input=system + messages,
+            model=model,
+            max_output_tokens=max_tokens,
+            text={"format": type_to_text_format_param(text_format)},
+            **kwargs,
+        )
+        key = canonical_hash(body)
+        with self.condition:
+            call = self.pending.get(key)
+            if call is None:
+                call = self.pending[key] = PendingCall(body, text_format, Future())
+            self.waiting += 1
+            batch = self._take_batch()
+        if batch:
+            self._run(batch)
+
+        output = call.future.result()
+        LLMMetrics.track_usage(
+            LLMUsage(
+                model=output.model,
+                prompt_tokens=output.usage.input_tokens,
+                completion_tokens=output.usage.output_tokens,
+                total_tokens=output.usage.total_tokens,
+            )
+        )
+        return text_format.model_validate_json(output.output_text)
+
+    def leave(self):
+        """The pipeline of a participant is done, it won't make any other call"""
+        with self.condition:
+            self.participants -= 1
+            batch = self._take_batch()
+        if batch:
+            self._run(batch)
+
+    def participate(self, func, *args, **kwargs):
+        """Run the pipeline `func` of a participant and leave once it's done"""
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.leave()
+
+    def _take_batch(self) -> dict[str, PendingCall]:
+        """The pending calls if every participant is waiting on them, must hold the lock"""
+        if not self.pending or self.waiting < self.participants:
+            return {}
+        # Every participant is blocked on this batch, no call can be added until it's finished
+        batch, self.pending, self.waiting = self.pending, {}, 0
+        return batch
+
+    def _run(self, batch: dict[str, PendingCall]):
+        try:
+            results = self.batch_client.run(
+                {key: call.body for key, call in batch.items()}
+            )
+        except (
+            openai.OpenAIError,
+            LLMBatchError,
+            SQLAlchemyError,
+            KeyError,
+            ValueError,
+        ) as e:
+            for call in batch.values():
+                call.future.set_exception(e)
+            return
+
+        for key, call in batch.items():
+            result = results.get(key)
+            if result is None:
+                call.future.set_exception(
+                    LLMBatchError("LLM call missing from the output of its batch")
+                )
+            elif result.output is None:
+                call.future.set_exception(
+                    LLMBatchError(
+                        f"LLM call failed in batch {result.batch_id}: {result.error}"
+                    )
+                )
+            else:
+                # Built like the SDK does, without failing on fields it doesn't know
+                call.future.set_result(Response.construct(**result.output))
+
+
+_llm_batch_collector: ContextVar[LLMBatchCollector | None] = ContextVar(
+    "llm_batch_collector", default=None
+)
+
+
+def set_llm_batch_collector(collector: LLMBatchCollector) -> Token:
+    """Send the batchable LLM calls made from the current context, usually a brief, through
+    `collector`.
+
+    Threads started from this context only inherit it if they are submitted with
+    `bigdata_briefs.utils.submit_with_context`.
+    """
+    return _llm_batch_collector.set(collector)
+
+
+def reset_llm_batch_collector(token: Token):
+    _llm_batch_collector.reset(token)
+
+
+def get_llm_batch_collector() -> LLMBatchCollector | None:
+    return _llm_batch_collector.get()
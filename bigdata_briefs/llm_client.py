@@ -1,13 +1,25 @@
+import asyncio
 import json
+from typing import Any
 
 import openai
 from pydantic import BaseModel
 
 from bigdata_briefs import logger
+from bigdata_briefs.cache import Cache
+from bigdata_briefs.cassette import build_async_openai_client, build_openai_client
+from bigdata_briefs.llm_scheduler import (
+    LLMScheduler,
+    estimate_tokens,
+    get_llm_scheduler,
+    rate_limited_retry_after,
+)
 from bigdata_briefs.metrics import LLMMetrics
 from bigdata_briefs.models import LLMUsage
 from bigdata_briefs.settings import settings
 from bigdata_briefs.utils import (
+    async_sleep_with_backoff,
+    canonical_hash,
     log_args,
     log_return_value,
     log_time,
@@ -20,10 +32,19 @@ class FollowUpQuestionsPromptDefaults(BaseModel):
 
 
 class LLMClient:
-    def __init__(self, client: openai.OpenAI | None = None):
+    def __init__(
+        self,
+        client: openai.OpenAI | None = None,
+        scheduler: LLMScheduler | None = None,
+        cache: Cache | None = None,
+    ):
         if client is None:
-            client = openai.OpenAI()
+            # Retries go through the scheduler, the SDK must not retry on its own
+            client = build_openai_client(max_retries=0)
         self.client = client
+        self.scheduler = scheduler or get_llm_scheduler()
+        # Responses of identical calls, keyed on the model, prompt and parameters
+        self.cache = cache
 
     @log_time
     @log_args
@@ -35,13 +56,19 @@ class LLMClient:
         logger.debug(
             f"Calling {model} with messages: \n {json.dumps(messages, indent=2)}"
         )
+        request = dict(
+            input=messages, model=model, max_output_tokens=max_tokens, **kwargs
+        )
+        cache_key = self._cache_key("responses.parse", *args, **request)
+        cached = self._get_cached(cache_key, model)
+        if cached is not None:
+            return decode_cached_output(cached, kwargs.get("text_format"))
+
         response = self._call_with_retries(
             self.client.responses.parse,
             *args,
-            input=messages,
-            model=model,
-            max_output_tokens=max_tokens,
-            **kwargs,
+            estimated_tokens=estimate_tokens(messages) + max_tokens,
+            **request,
         )
 
         LLMMetrics.track_usage(
@@ -54,6 +81,9 @@ class LLMClient:
         )
 
         content = response.output_parsed
+        self._set_cached(
+            cache_key, encode_cached_output(content, kwargs.get("text_format"))
+        )
 
         return content
 
@@ -66,13 +96,17 @@ class LLMClient:
         logger.debug(
             f"Calling {model} with messages: \n {json.dumps(messages, indent=2)}"
         )
+        request = dict(messages=messages, model=model, max_tokens=max_tokens, **kwargs)
+        cache_key = self._cache_key("chat.completions.create", *args, **request)
+        cached = self._get_cached(cache_key, model)
+        if cached is not None:
+            return cached
+
         response = self._call_with_retries(
             self.client.chat.completions.create,
             *args,
-            messages=messages,
-            model=model,
-            max_tokens=max_tokens,
-            **kwargs,
+            estimated_tokens=estimate_tokens(messages) + max_tokens,
+            **request,
         )
 
         LLMMetrics.track_usage(
@@ -84,14 +118,209 @@ class LLMClient:
             )
         )
 
-        return response["output"]["message"]["content"][0]["text"]
+        content = response["output"]["message"]["content"][0]["text"]
+        self._set_cached(cache_key, content)
 
-    def _call_with_retries(self, func, *args, **kwargs):
+        return content
+
+    def _cache_key(self, method: str, *args, **kwargs) -> str | None:
+        if self.cache is None:
+            return None
+        return llm_cache_key(method, *args, **kwargs)
+
+    def _get_cached(self, cache_key: str | None, model: str) -> Any | None:
+        if cache_key is None:
+            return None
+        value = self.cache.get(cache_key)
+        if value is not None:
+            track_cached_call(model)
+        return value
+
+    def _set_cached(self, cache_key: str | None, value: Any):
+        if cache_key is not None and value is not None:
+            self.cache.set(cache_key, value)
+
+    def _call_with_retries(self, func, *args, estimated_tokens: int, **kwargs):
+        model = kwargs["model"]
         for attempt in range(settings.LLM_RETRIES):
+            if self.scheduler is not None:
+                self.scheduler.wait(model, estimated_tokens)
             try:
                 return func(*args, **kwargs)
             except Exception as e:
+                retry_after = rate_limited_retry_after(e)
+                if retry_after is not None and self.scheduler is not None:
+                    self.scheduler.on_rate_limited(model, retry_after)
                 if attempt >= settings.LLM_RETRIES - 1:
                     raise
                 logger.warning(f"Error calling LLM: {e}. Attempt {attempt + 1}")
-                sleep_with_backoff(attempt=attempt)
+                if retry_after is None or self.scheduler is None:
+                    sleep_with_backoff(attempt=attempt)
+                # Otherwise the scheduler delays the retry as much as the provider asked for
+
+
+class AsyncLLMClient:
+    """Asyncio-native version of `LLMClient`.
+
+    Calls are coroutines sharing a single `openai.AsyncOpenAI` client. They are queued by the
+    LLM scheduler, shared with the synchronous clients of the process, so concurrent calls
+    are released at the rate allowed by the provider instead of failing with rate limits.
+    """
+
+    def __init__(
+        self,
+        client: openai.AsyncOpenAI | None = None,
+        scheduler: LLMScheduler | None = None,
+        cache: Cache | None = None,
+    ):
+        if client is None:
+            # Retries go through the scheduler, the SDK must not retry on its own
+            client = build_async_openai_client(max_retries=0)
+        self.client = client
+        self.scheduler = scheduler or get_llm_scheduler()
+        self.cache = cache
+
+    async def cleanup(self):
+        await self.client.close()
+
+    @log_time
+    @log_args
+    @log_return_value
+    async def call_with_response_format(
+        self, *args, system: list, messages: list, model: str, max_tokens: int, **kwargs
+    ):
+        messages = system + messages
+        logger.debug(
+            f"Calling {model} with messages: \n {json.dumps(messages, indent=2)}"
+        )
+        request = dict(
+            input=messages, model=model, max_output_tokens=max_tokens, **kwargs
+        )
+        cache_key = self._cache_key("responses.parse", *args, **request)
+        cached = await self._get_cached(cache_key, model)
+        if cached is not None:
+            return decode_cached_output(cached, kwargs.get("text_format"))
+
+        response = await self._call_with_retries(
+            self.client.responses.parse,
+            *args,
+            estimated_tokens=estimate_tokens(messages) + max_tokens,
+            **request,
+        )
+
+        LLMMetrics.track_usage(
+            LLMUsage(
+                model=model,
+                prompt_tokens=response.usage.input_tokens,
+                completion_tokens=response.usage.output_tokens,
+                total_tokens=response.usage.total_tokens,
+            )
+        )
+
+        content = response.output_parsed
+        await self._set_cached(
+            cache_key, encode_cached_output(content, kwargs.get("text_format"))
+        )
+
+        return content
+
+    @log_time
+    @log_args
+    @log_return_value
+    async def call_without_response_format(
+        self, *args, messages: list, model: str, max_tokens: int, **kwargs
+    ):
+        logger.debug(
+            f"Calling {model} with messages: \n {json.dumps(messages, indent=2)}"
+        )
+        request = dict(messages=messages, model=model, max_tokens=max_tokens, **kwargs)
+        cache_key = self._cache_key("chat.completions.create", *args, **request)
+        cached = await self._get_cached(cache_key, model)
+        if cached is not None:
+            return cached
+
+        response = await self._call_with_retries(
+            self.client.chat.completions.create,
+            *args,
+            estimated_tokens=estimate_tokens(messages) + max_tokens,
+            **request,
+        )
+
+        LLMMetrics.track_usage(
+            LLMUsage(
+                model=model,
+                prompt_tokens=response["usage"]["inputTokens"],
+                completion_tokens=response["usage"]["outputTokens"],
+                total_tokens=response["usage"]["totalTokens"],
+            )
+        )
+
+        content = response["output"]["message"]["content"][0]["text"]
+        await self._set_cached(cache_key, content)
+
+        return content
+
+    def _cache_key(self, method: str, *args, **kwargs) -> str | None:
+        if self.cache is None:
+            return None
+        return llm_cache_key(method, *args, **kwargs)
+
+    async def _get_cached(self, cache_key: str | None, model: str) -> Any | None:
+        if cache_key is None:
+            return None
+        # The cache is backed by the database, keep its I/O off the event loop
+        value = await asyncio.to_thread(self.cache.get, cache_key)
+        if value is not None:
+            track_cached_call(model)
+        return value
+
+    async def _set_cached(self, cache_key: str | None, value: Any):
+        if cache_key is not None and value is not None:
+            await asyncio.to_thread(self.cache.set, cache_key, value)
+
+    async def _call_with_retries(self, func, *args, estimated_tokens: int, **kwargs):
+        model = kwargs["model"]
+        for attempt in range(settings.LLM_RETRIES):
+            if self.scheduler is not None:
+                await self.scheduler.wait_async(model, estimated_tokens)
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                retry_after = rate_limited_retry_after(e)
+                if retry_after is not None and self.scheduler is not None:
+                    self.scheduler.on_rate_limited(model, retry_after)
+                if attempt >= settings.LLM_RETRIES - 1:
+                    raise
+                logger.warning(f"Error calling LLM: {e}. Attempt {attempt + 1}")
+                if retry_after is None or self.scheduler is None:
+                    await async_sleep_with_backoff(attempt=attempt)
+
+
+def llm_cache_key(method: str, *args, **kwargs) -> str:
+    """Content-addressed key of an LLM call, the same model, prompt and parameters always map to
+    the same key. Response formats are keyed on their JSON schema."""
+    kwargs = {
+        key: value.model_json_schema() if is_model_class(value) else value
+        for key, value in kwargs.items()
+    }
+    return canonical_hash({"method": method, "args": args, "kwargs": kwargs})
+
+
+def track_cached_call(model: str):
+    LLMMetrics.track_usage(LLMUsage(model=model, n_calls=0, cached_calls=1))
+
+
+def encode_cached_output(output: Any, text_format: Any) -> Any | None:
+    """JSON serializable version of the parsed output of a call, None if the output can't be
+    restored from the cache"""
+    if is_model_class(text_format) and isinstance(output, text_format):
+        return output.model_dump(mode="json")
+    return None
+
+
+def decode_cached_output(value: Any, text_format: type[BaseModel]) -> BaseModel:
+    return text_format.model_validate(value)
+
+
+def is_model_class(value: Any) -> bool:
+    return isinstance(value, type) and issubclass(value, BaseModel)
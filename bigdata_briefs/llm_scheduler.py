@@ -0,0 +1,160 @@
+import asyncio
+import json
+from collections.abc import Callable
+from functools import cache
+from math import ceil
+from threading import Lock
+from time import perf_counter, sleep
+
+import openai
+
+from bigdata_briefs import logger
+from bigdata_briefs.query_service.rate_limit import (
+    RequestsPerMinuteController,
+    parse_retry_after,
+)
+from bigdata_briefs.settings import settings
+
+# Rough average for English text, only used to estimate the size of prompts
+CHARS_PER_TOKEN = 4
+REFRESH_FREQUENCY_RATE_LIMIT = 5  # Time in seconds to pro-rate the provider limits
+TIME_BEFORE_RETRY_RATE_LIMITER = 1.0  # Bounds the time a call waits for the limits
+DEFAULT_RATE_LIMITED_PAUSE = 1.0  # Pause after a 429 without a Retry-After header
+
+
+def estimate_tokens(messages: list) -> int:
+    """Estimate the tokens of a prompt from the length of the messages, formatting included"""
+    return ceil(len(json.dumps(messages)) / CHARS_PER_TOKEN)
+
+
+class ModelLimits:
+    def __init__(
+        self,
+        *,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        clock: Callable[[], float] = perf_counter,
+    ):
+        """Token buckets of the requests and tokens per minute allowed for a model"""
+        self.requests = RequestsPerMinuteController(
+            max_requests_per_min=requests_per_minute,
+            rate_limit_refresh_frequency=REFRESH_FREQUENCY_RATE_LIMIT,
+            seconds_before_retry=TIME_BEFORE_RETRY_RATE_LIMITER,
+            clock=clock,
+        )
+        # Same bucket, where every token of the prompt and completion is a "request"
+        self.tokens = RequestsPerMinuteController(
+            max_requests_per_min=tokens_per_minute,
+            rate_limit_refresh_frequency=REFRESH_FREQUENCY_RATE_LIMIT,
+            seconds_before_retry=TIME_BEFORE_RETRY_RATE_LIMITER,
+            clock=clock,
+        )
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        *,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        model_requests_per_minute: dict[str, int] | None = None,
+        model_tokens_per_minute: dict[str, int] | None = None,
+        clock: Callable[[], float] = perf_counter,
+    ):
+        """Queue the calls to the LLM provider to stay under its limits of requests and tokens
+        per minute, tracked separately for every model
+
+        The tokens of a call are estimated before sending it as the size of the prompt plus its
+        `max_tokens`, the same upper bound the provider counts against the limit. Every call
+        reserves its request and tokens in the buckets of its model and waits until both are
+        available, so waiting calls are released in FIFO order at the allowed rate. A rate
+        limited response pauses the model for the time asked by the provider, instead of letting
+        every call retry on its own.
+
+        :param requests_per_minute: Requests per minute allowed for the models without their
+            own limit in `model_requests_per_minute`.
+        :param tokens_per_minute: Tokens per minute allowed for the models without their own
+            limit in `model_tokens_per_minute`.
+        """
+        self.lock = Lock()
+        self.clock = clock
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.model_requests_per_minute = model_requests_per_minute or {}
+        self.model_tokens_per_minute = model_tokens_per_minute or {}
+        self._limits: dict[str, ModelLimits] = {}
+
+    @classmethod
+    def from_settings(cls) -> "LLMScheduler | None":
+        if not settings.LLM_RATE_LIMIT_ENABLED:
+            return None
+        return cls(
+            requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+            model_requests_per_minute=settings.LLM_MODEL_REQUESTS_PER_MINUTE,
+            model_tokens_per_minute=settings.LLM_MODEL_TOKENS_PER_MINUTE,
+        )
+
+    def limits(self, model: str) -> ModelLimits:
+        with self.lock:
+            if model not in self._limits:
+                self._limits[model] = ModelLimits(
+                    requests_per_minute=self.model_requests_per_minute.get(
+                        model, self.requests_per_minute
+                    ),
+                    tokens_per_minute=self.model_tokens_per_minute.get(
+                        model, self.tokens_per_minute
+                    ),
+                    clock=self.clock,
+                )
+            return self._limits[model]
+
+    def reserve(self, model: str, tokens: int) -> float:
+        """Reserve a request and `tokens` for a call to `model`, return the time in seconds
+        the call must wait before being sent"""
+        limits = self.limits(model)
+        wait = max(limits.requests.reserve(), limits.tokens.reserve(tokens))
+        if wait > 0:
+            logger.debug(
+                "Waiting for the LLM rate limit",
+                model=model,
+                tokens=tokens,
+                seconds_to_wait=round(wait, 2),
+            )
+        return wait
+
+    def wait(self, model: str, tokens: int):
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            sleep(wait)
+
+    async def wait_async(self, model: str, tokens: int):
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_rate_limited(self, model: str, retry_after: float | None = None):
+        """Pause the calls to `model` after a rate limited response"""
+        pause = retry_after or DEFAULT_RATE_LIMITED_PAUSE
+        logger.warning("Rate limited by the LLM provider", model=model, pause=pause)
+        limits = self.limits(model)
+        limits.requests.pause(pause)
+        limits.tokens.pause(pause)
+
+
+def rate_limited_retry_after(exception: Exception) -> float | None:
+    """Time to wait asked by a rate limited response of the OpenAI API, None if `exception` is
+    not a rate limited response"""
+    if not isinstance(exception, openai.RateLimitError):
+        return None
+    headers = exception.response.headers
+    retry_after_ms = parse_retry_after(headers.get("retry-after-ms"))
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    return parse_retry_after(headers.get("retry-after")) or DEFAULT_RATE_LIMITED_PAUSE
+
+
+@cache
+def get_llm_scheduler() -> LLMScheduler | None:
+    """LLM scheduler shared by every LLM client of the process"""
+    return LLMScheduler.from_settings()
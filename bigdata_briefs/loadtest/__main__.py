@@ -0,0 +1,160 @@
+"""Load test the service against fake Bigdata and OpenAI APIs
+
+Start the fake APIs, then the service pointing to them, and drive briefs through it:
+
+    python -m bigdata_briefs.loadtest fake-server --port 9000 --llm-latency 2 --rate-limited-ratio 0.05
+    API_BASE_URL=http://localhost:9000 OPENAI_BASE_URL=http://localhost:9000/v1 python -m bigdata_briefs
+    python -m bigdata_briefs.loadtest drive --base-url http://localhost:8000 --briefs 20
+
+Or predict the wall time of a brief without any traffic, with latencies from recorded logs:
+
+    python -m bigdata_briefs.loadtest simulate --entities 200 --simultaneous-requests 60 --logs brief.log
+
+Briefs are created from a list of entities, watchlists are resolved with the Bigdata SDK and
+are not served by the fake APIs.
+"""
+
+import argparse
+import asyncio
+from datetime import date, timedelta
+
+from bigdata_briefs.loadtest.driver import drive
+from bigdata_briefs.loadtest.fake_servers import (
+    EndpointBehaviour,
+    FakeServerConfig,
+    create_fake_server,
+)
+from bigdata_briefs.loadtest.simulator import (
+    SimulationConfig,
+    latencies_from_logs,
+    simulate,
+)
+
+DEFAULT_ENTITIES = ["AAAAA1", "AAAAA2", "AAAAA3", "AAAAA4", "AAAAA5"]
+
+
+def run_fake_server(args: argparse.Namespace):
+    import uvicorn
+
+    def behaviour(latency: float) -> EndpointBehaviour:
+        return EndpointBehaviour(
+            latency_median=latency,
+            latency_sigma=args.latency_sigma,
+            rate_limited_ratio=args.rate_limited_ratio,
+            server_error_ratio=args.server_error_ratio,
+        )
+
+    config = FakeServerConfig(
+        search=behaviour(args.search_latency),
+        knowledge_graph=behaviour(args.knowledge_graph_latency),
+        llm=behaviour(args.llm_latency),
+        embeddings=behaviour(args.embeddings_latency),
+        documents_per_search=args.documents_per_search,
+        seed=args.seed,
+    )
+    uvicorn.run(create_fake_server(config), host=args.host, port=args.port)
+
+
+def run_driver(args: argparse.Namespace):
+    payload = {
+        "entities": args.entities,
+        "report_start_date": (date.today() - timedelta(days=7)).isoformat(),
+        "report_end_date": date.today().isoformat(),
+        "novelty": not args.no_novelty,
+    }
+    if args.topics:
+        payload["topics"] = args.topics
+    report = asyncio.run(
+        drive(
+            args.base_url,
+            payload,
+            n_briefs=args.briefs,
+            poll_interval=args.poll_interval,
+            timeout=args.timeout,
+            access_token=args.token,
+        )
+    )
+    print(report.format())
+
+
+def run_simulation(args: argparse.Namespace):
+    latencies = None
+    if args.logs:
+        with open(args.logs) as f:
+            latencies = latencies_from_logs(f)
+    overrides = {
+        name: value
+        for name, value in {
+            "topics": args.topics,
+            "follow_up_questions": args.follow_up_questions,
+            "simultaneous_requests": args.simultaneous_requests,
+            "requests_per_minute": args.requests_per_minute,
+        }.items()
+        if value is not None
+    }
+    config = SimulationConfig(
+        n_entities=args.entities,
+        no_info_ratio=args.no_info_ratio,
+        novelty=not args.no_novelty,
+        **overrides,
+    )
+    print(simulate(config, latencies, seed=args.seed).format())
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bigdata_briefs.loadtest")
+    commands = parser.add_subparsers(required=True)
+
+    fake = commands.add_parser(
+        "fake-server", help="Serve the fake Bigdata and OpenAI APIs"
+    )
+    fake.add_argument("--host", default="127.0.0.1")
+    fake.add_argument("--port", type=int, default=9000)
+    fake.add_argument(
+        "--search-latency", type=float, default=0.3, help="Median, seconds"
+    )
+    fake.add_argument("--knowledge-graph-latency", type=float, default=0.1)
+    fake.add_argument("--llm-latency", type=float, default=2.0)
+    fake.add_argument("--embeddings-latency", type=float, default=0.2)
+    fake.add_argument(
+        "--latency-sigma", type=float, default=0.5, help="Log-normal shape"
+    )
+    fake.add_argument("--rate-limited-ratio", type=float, default=0.0)
+    fake.add_argument("--server-error-ratio", type=float, default=0.0)
+    fake.add_argument("--documents-per-search", type=int, default=5)
+    fake.add_argument("--seed", type=int, default=None)
+    fake.set_defaults(func=run_fake_server)
+
+    driver = commands.add_parser("drive", help="Fire concurrent briefs at the service")
+    driver.add_argument("--base-url", default="http://localhost:8000")
+    driver.add_argument("--briefs", type=int, default=10)
+    driver.add_argument("--entities", nargs="+", default=DEFAULT_ENTITIES)
+    driver.add_argument("--topics", nargs="+", default=None)
+    driver.add_argument("--no-novelty", action="store_true")
+    driver.add_argument("--poll-interval", type=float, default=0.5)
+    driver.add_argument("--timeout", type=float, default=1800)
+    driver.add_argument("--token", default=None, help="Access token of the service")
+    driver.set_defaults(func=run_driver)
+
+    simulator = commands.add_parser(
+        "simulate", help="Predict the wall time of a brief on a virtual clock"
+    )
+    simulator.add_argument("--entities", type=int, required=True)
+    simulator.add_argument("--topics", type=int, default=None)
+    simulator.add_argument("--follow-up-questions", type=int, default=None)
+    simulator.add_argument("--simultaneous-requests", type=int, default=None)
+    simulator.add_argument("--requests-per-minute", type=int, default=None)
+    simulator.add_argument("--no-info-ratio", type=float, default=0.0)
+    simulator.add_argument("--no-novelty", action="store_true")
+    simulator.add_argument(
+        "--logs", default=None, help="Debug logs of a brief to sample latencies from"
+    )
+    simulator.add_argument("--seed", type=int, default=None)
+    simulator.set_defaults(func=run_simulation)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
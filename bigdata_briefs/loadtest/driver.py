@@ -0,0 +1,164 @@
+import asyncio
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import httpx
+import numpy as np
+
+QUEUED_STAGE = "Queued"
+PERCENTILES = (50, 95, 99)
+FINAL_STATUSES = {"completed", "failed"}
+
+_DIGITS = re.compile(r"\d+")
+
+
+@dataclass
+class BriefRun:
+    """Timeline of a brief, as observed by polling its status"""
+
+    request_id: str
+    submitted_at: float
+    status: str = "queued"
+    finished_at: float | None = None
+    # First time each status log message was seen, in order
+    logs_seen_at: list[tuple[str, float]] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float | None:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.submitted_at
+
+    def stage_durations(self) -> dict[str, float]:
+        """Time spent in each stage of the brief
+
+        A stage starts when its log message is first seen and ends with the next one, or when
+        the brief finishes. Numbers are removed from the messages so the stages of briefs with
+        different entities can be aggregated. The time until the first message is the time
+        spent in the queue.
+        """
+        if self.finished_at is None:
+            return {}
+        boundaries = [(QUEUED_STAGE, self.submitted_at), *self.logs_seen_at]
+        ends = [seen_at for _, seen_at in boundaries[1:]] + [self.finished_at]
+        durations = defaultdict(float)
+        for (message, start), end in zip(boundaries, ends):
+            durations[_DIGITS.sub("N", message)] += end - start
+        return dict(durations)
+
+
+@dataclass
+class LoadTestReport:
+    runs: list[BriefRun]
+    wall_time: float
+
+    @property
+    def completed(self) -> list[BriefRun]:
+        return [run for run in self.runs if run.status == "completed"]
+
+    @property
+    def briefs_per_minute(self) -> float:
+        if self.wall_time <= 0:
+            return 0.0
+        return len(self.completed) * 60 / self.wall_time
+
+    def end_to_end_percentiles(self) -> dict[int, float]:
+        return percentiles([run.duration for run in self.completed])
+
+    def stage_percentiles(self) -> dict[str, dict[int, float]]:
+        samples = defaultdict(list)
+        for run in self.completed:
+            for stage, duration in run.stage_durations().items():
+                samples[stage].append(duration)
+        return {stage: percentiles(durations) for stage, durations in samples.items()}
+
+    def format(self) -> str:
+        header = "p50".rjust(10) + "p95".rjust(10) + "p99".rjust(10)
+        lines = [
+            (
+                f"Briefs: {len(self.runs)} submitted, {len(self.completed)} completed, "
+                f"{len(self.runs) - len(self.completed)} failed or unfinished"
+            ),
+            f"Wall time: {self.wall_time:.1f}s, throughput: {self.briefs_per_minute:.2f} briefs/min",
+            "",
+            f"{'Stage':<60}{header}",
+        ]
+        rows = {**self.stage_percentiles(), "End to end": self.end_to_end_percentiles()}
+        for stage, values in rows.items():
+            name = stage if len(stage) <= 58 else stage[:55] + "..."
+            lines.append(
+                f"{name:<60}" + "".join(f"{values[p]:>9.2f}s" for p in PERCENTILES)
+            )
+        return "\n".join(lines)
+
+
+def percentiles(values: list[float]) -> dict[int, float]:
+    if not values:
+        return {p: float("nan") for p in PERCENTILES}
+    return {p: float(np.percentile(values, p)) for p in PERCENTILES}
+
+
+async def run_brief(
+    client: httpx.AsyncClient,
+    payload: dict,
+    *,
+    poll_interval: float,
+    timeout: float,
+    params: dict | None = None,
+) -> BriefRun:
+    """Create a brief and poll its status until it finishes or `timeout` expires"""
+    submitted_at = time.perf_counter()
+    response = await client.post("/briefs/create", json=payload, params=params)
+    response.raise_for_status()
+    run = BriefRun(request_id=response.json()["request_id"], submitted_at=submitted_at)
+
+    seen = set()
+    while time.perf_counter() - submitted_at < timeout:
+        await asyncio.sleep(poll_interval)
+        response = await client.get(f"/briefs/status/{run.request_id}", params=params)
+        response.raise_for_status()
+        status = response.json()
+        now = time.perf_counter()
+        for message in status["logs"]:
+            if message not in seen:
+                seen.add(message)
+                run.logs_seen_at.append((message, now))
+        run.status = status["status"]
+        if run.status in FINAL_STATUSES:
+            run.finished_at = now
+            break
+    return run
+
+
+async def drive(
+    base_url: str,
+    payload: dict,
+    *,
+    n_briefs: int,
+    poll_interval: float = 0.5,
+    timeout: float = 1800,
+    access_token: str | None = None,
+) -> LoadTestReport:
+    """Fire `n_briefs` concurrent briefs against the service at `base_url`
+
+    Stage timings are as precise as `poll_interval`, which should be well below the duration
+    of the stages.
+    """
+    params = {"token": access_token} if access_token else None
+    start = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        runs = await asyncio.gather(
+            *(
+                run_brief(
+                    client,
+                    payload,
+                    poll_interval=poll_interval,
+                    timeout=timeout,
+                    params=params,
+                )
+                for _ in range(n_briefs)
+            )
+        )
+    return LoadTestReport(runs=list(runs), wall_time=time.perf_counter() - start)
@@ -0,0 +1,392 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+from email.policy import HTTP
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+EMBEDDING_DIMENSIONS = 64
+
+
+@dataclass
+class EndpointBehaviour:
+    """Latency and errors of a fake endpoint
+
+    Latencies follow a log-normal distribution with the given median and shape, which gives the
+    long tail observed on real APIs. A fraction of the requests is answered with a 429 or a
+    500 instead.
+    """
+
+    latency_median: float = 0.1
+    latency_sigma: float = 0.5
+    rate_limited_ratio: float = 0.0
+    server_error_ratio: float = 0.0
+
+    def sample_latency(self, rng: random.Random) -> float:
+        if self.latency_median <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+
+
+@dataclass
+class FakeServerConfig:
+    search: EndpointBehaviour = field(default_factory=EndpointBehaviour)
+    knowledge_graph: EndpointBehaviour = field(default_factory=EndpointBehaviour)
+    llm: EndpointBehaviour = field(
+        default_factory=lambda: EndpointBehaviour(latency_median=2.0)
+    )
+    embeddings: EndpointBehaviour = field(
+        default_factory=lambda: EndpointBehaviour(latency_median=0.2)
+    )
+    documents_per_search: int = 5
+    chunks_per_document: int = 2
+    items_per_array: int = 3
+    # Times a batch is retrieved still in progress before it completes
+    batch_polls_before_completion: int = 1
+    seed: int | None = None
+
+
+def create_fake_server(config: FakeServerConfig | None = None) -> FastAPI:
+    """Stand-in for the Bigdata and OpenAI APIs, to load test the service without network
+
+    It serves `/v1/search`, `/v1/knowledge-graph/entities/id` and the OpenAI `/v1/responses`
+    and `/v1/embeddings` endpoints with synthetic content, following the latency and errors of
+    `config`. Point `API_BASE_URL` and `OPENAI_BASE_URL` at it. The number of requests and
+    injected errors per endpoint is served at `/stats`.
+
+    The OpenAI `/v1/files` and `/v1/batches` endpoints run batches of `/v1/responses` calls,
+    kept in memory. A batch completes once it's been retrieved
+    `config.batch_polls_before_completion` times, its calls fail with the server error ratio
+    of `config.llm`.
+    """
+    config = config or FakeServerConfig()
+    rng = random.Random(config.seed)
+    stats = Counter()
+    files: dict[str, str] = {}
+    batches: dict[str, dict] = {}
+    app = FastAPI(title="Fake Bigdata and OpenAI APIs")
+
+    async def simulate(name: str, behaviour: EndpointBehaviour) -> JSONResponse | None:
+        """Wait for the endpoint latency and return the injected error, if any"""
+        stats[f"{name}_requests"] += 1
+        await asyncio.sleep(behaviour.sample_latency(rng))
+        draw = rng.random()
+        if draw < behaviour.rate_limited_ratio:
+            stats[f"{name}_rate_limited"] += 1
+            return JSONResponse(
+                {"error": "Too many requests"},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+        if draw < behaviour.rate_limited_ratio + behaviour.server_error_ratio:
+            stats[f"{name}_server_errors"] += 1
+            return JSONResponse({"error": "Internal server error"}, status_code=500)
+        return None
+
+    @app.post("/v1/search")
+    async def search(request: Request):
+        if error := await simulate("search", config.search):
+            return error
+        query = (await request.json())["query"]
+        entity_ids = query["filters"]["entity"]["any_of"]
+        return {
+            "results": fake_documents(
+                entity_ids,
+                query.get("text", ""),
+                min(query["max_chunks"], config.documents_per_search),
+                config.chunks_per_document,
+            ),
+            "usage": {"api_query_units": 1.0},
+        }
+
+    @app.post("/v1/knowledge-graph/entities/id")
+    async def entities(request: Request):
+        if error := await simulate("knowledge_graph", config.knowledge_graph):
+            return error
+        entity_ids = (await request.json())["values"]
+        return {
+            "results": {entity_id: fake_entity(entity_id) for entity_id in entity_ids}
+        }
+
+    @app.post("/v1/responses")
+    async def responses(request: Request):
+        if error := await simulate("llm", config.llm):
+            return error
+        return fake_responses_call(await request.json(), config.items_per_array)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        if error := await simulate("embeddings", config.embeddings):
+            return error
+        payload = await request.json()
+        texts = (
+            payload["input"]
+            if isinstance(payload["input"], list)
+            else [payload["input"]]
+        )
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        return {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+                for i, text in enumerate(texts)
+            ],
+            "model": payload["model"],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.post("/v1/files")
+    async def upload_file(request: Request):
+        stats["files_requests"] += 1
+        content = parse_uploaded_file(
+            request.headers["content-type"], await request.body()
+        )
+        file_id = f"file-{len(files)}"
+        files[file_id] = content
+        return fake_file(file_id, content)
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        stats["files_requests"] += 1
+        if file_id not in files:
+            raise HTTPException(status_code=404, detail="File not found")
+        return PlainTextResponse(files[file_id])
+
+    @app.post("/v1/batches")
+    async def create_batch(request: Request):
+        stats["batches_requests"] += 1
+        payload = await request.json()
+        if payload["input_file_id"] not in files:
+            raise HTTPException(status_code=404, detail="File not found")
+        batch_id = f"batch-{len(batches)}"
+        batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": payload["endpoint"],
+            "input_file_id": payload["input_file_id"],
+            "completion_window": payload["completion_window"],
+            "created_at": 0,
+            "status": "in_progress",
+            "polls": 0,
+        }
+        return public_batch(batches[batch_id])
+
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        stats["batches_requests"] += 1
+        if batch_id not in batches:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        batch = batches[batch_id]
+        batch["polls"] += 1
+        if (
+            batch["status"] == "in_progress"
+            and batch["polls"] > config.batch_polls_before_completion
+        ):
+            outputs, errors = [], []
+            for line in files[batch["input_file_id"]].splitlines():
+                call = json.loads(line)
+                stats["batch_calls"] += 1
+                if rng.random() < config.llm.server_error_ratio:
+                    stats["batch_call_errors"] += 1
+                    errors.append(
+                        {
+                            "id": f"batch_req_{len(errors)}",
+                            "custom_id": call["custom_id"],
+                            "response": {
+                                "status_code": 500,
+                                "body": {"error": {"message": "Internal server error"}},
+                            },
+                            "error": None,
+                        }
+                    )
+                    continue
+                outputs.append(
+                    {
+                        "id": f"batch_req_{len(outputs)}",
+                        "custom_id": call["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": fake_responses_call(
+                                call["body"], config.items_per_array
+                            ),
+                        },
+                        "error": None,
+                    }
+                )
+            for name, lines in [("output_file_id", outputs), ("error_file_id", errors)]:
+                if lines:
+                    file_id = f"file-{len(files)}"
+                    files[file_id] = "\n".join(json.dumps(line) for line in lines)
+                    batch[name] = file_id
+            batch["status"] = "completed"
+        return public_batch(batch)
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+
+def fake_responses_call(payload: dict, items_per_array: int) -> dict:
+    """Response of `/v1/responses`, following the JSON schema of the response format if any"""
+    text_format = payload.get("text", {}).get("format", {})
+    if text_format.get("type") == "json_schema":
+        schema = text_format["schema"]
+        text = json.dumps(
+            fake_instance(schema, schema.get("$defs", {}), items_per_array)
+        )
+    else:
+        text = "Lorem ipsum dolor sit amet."
+    return fake_llm_response(payload["model"], text, prompt=json.dumps(payload))
+
+
+def parse_uploaded_file(content_type: str, body: bytes) -> str:
+    """Content of the `file` field of a multipart upload"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_payload(decode=True).decode()
+    raise HTTPException(status_code=400, detail="Missing file")
+
+
+def fake_file(file_id: str, content: str) -> dict:
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(content.encode()),
+        "created_at": 0,
+        "filename": "batch.jsonl",
+        "purpose": "batch",
+        "status": "processed",
+    }
+
+
+def public_batch(batch: dict) -> dict:
+    return {key: value for key, value in batch.items() if key != "polls"}
+
+
+def fake_documents(
+    entity_ids: list[str], text: str, n_documents: int, chunks_per_document: int
+) -> list[dict]:
+    documents = []
+    for i in range(n_documents):
+        entity_id = entity_ids[i % len(entity_ids)]
+        document_id = hashlib.sha256(f"{entity_id}{text}{i}".encode()).hexdigest()[:32]
+        documents.append(
+            {
+                "id": document_id.upper(),
+                "headline": f"News {i} about {entity_id}",
+                "timestamp": "2024-01-15T12:00:00Z",
+                "source": {
+                    "id": f"SRC{i % 10:03d}",
+                    "name": f"Source {i % 10}",
+                    "rank": f"RANK_{i % 5 + 1}",
+                },
+                "url": f"https://example.com/{document_id}",
+                "document_type": "news",
+                "language": "en",
+                "chunks": [
+                    {
+                        "cnum": cnum,
+                        "text": f"Chunk {cnum} of news {i} about {entity_id}. {text}",
+                        "relevance": round(1 - (i + cnum) / 100, 4),
+                        "sentiment": 0.5,
+                        "detections": [{"id": entity_id, "type": "entity"}],
+                    }
+                    for cnum in range(chunks_per_document)
+                ],
+            }
+        )
+    return documents
+
+
+def fake_entity(entity_id: str) -> dict:
+    return {
+        "id": entity_id,
+        "name": f"Company {entity_id}",
+        "category": "Companies",
+        "type": "Public",
+        "country": "US",
+        "sector": "Technology",
+        "ticker": entity_id[:4],
+        "description": f"Synthetic company {entity_id}",
+    }
+
+
+def fake_instance(schema: dict, defs: dict, items_per_array: int):
+    """Build a value matching a JSON schema, as returned by structured outputs"""
+    if "$ref" in schema:
+        return fake_instance(
+            defs[schema["$ref"].rsplit("/", 1)[-1]], defs, items_per_array
+        )
+    if "anyOf" in schema:
+        return fake_instance(schema["anyOf"][0], defs, items_per_array)
+    match schema.get("type"):
+        case "object":
+            return {
+                name: fake_instance(prop, defs, items_per_array)
+                for name, prop in schema.get("properties", {}).items()
+            }
+        case "array":
+            return [
+                fake_instance(schema.get("items", {}), defs, items_per_array)
+                for _ in range(items_per_array)
+            ]
+        case "integer":
+            return max(schema.get("minimum", 3), 3)
+        case "number":
+            return 0.5
+        case "boolean":
+            return True
+        case "null":
+            return None
+        case _:
+            return "Lorem ipsum dolor sit amet, consectetur adipiscing elit."
+
+
+def fake_llm_response(model: str, text: str, prompt: str) -> dict:
+    input_tokens = len(prompt) // 4
+    output_tokens = len(text) // 4
+    return {
+        "id": "resp_fake",
+        "object": "response",
+        "created_at": 0,
+        "status": "completed",
+        "model": model,
+        "output": [
+            {
+                "type": "message",
+                "id": "msg_fake",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ],
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+def fake_embedding(text: str) -> list[float]:
+    """Deterministic unit vector, the same text always gets the same embedding"""
+    text_rng = random.Random(hashlib.sha256(text.encode()).digest())
+    vector = [text_rng.gauss(0, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector]
@@ -0,0 +1,415 @@
+import heapq
+import itertools
+import math
+import random
+import re
+import statistics
+from collections import defaultdict, deque
+from collections.abc import Callable, Generator, Iterable
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import NamedTuple
+
+from bigdata_briefs.loadtest.driver import PERCENTILES, percentiles
+from bigdata_briefs.query_service.api import (
+    REFRESH_FREQUENCY_RATE_LIMIT,
+    TIME_BEFORE_RETRY_RATE_LIMITER,
+)
+from bigdata_briefs.query_service.rate_limit import (
+    AdaptiveRequestsPerMinuteController,
+)
+from bigdata_briefs.settings import settings
+from bigdata_briefs.weighted_semaphore import WeightedSemaphore
+
+
+class Stage(StrEnum):
+    PRE_CHECK = "pre_check"
+    EXPLORATORY_SEARCH = "exploratory_search"
+    FOLLOW_UP_LLM = "follow_up_llm"
+    FOLLOW_UP_SEARCH = "follow_up_search"
+    REPORT_LLM = "report_llm"
+    NOVELTY_EMBEDDINGS = "novelty_embeddings"
+    INTRO = "intro"
+
+
+class LatencySource(StrEnum):
+    SEARCH = "search"
+    FOLLOW_UP_LLM = "follow_up_llm"
+    REPORT_LLM = "report_llm"
+    EMBEDDINGS = "embeddings"
+    INTRO_LLM = "intro_llm"
+
+
+@dataclass
+class LatencyDistribution:
+    """Latency of a call, either resampled from recorded latencies or log-normal"""
+
+    median: float
+    sigma: float = 0.4
+    samples: list[float] = field(default_factory=list)
+
+    @classmethod
+    def from_samples(cls, samples: Iterable[float]) -> "LatencyDistribution":
+        samples = list(samples)
+        return cls(median=statistics.median(samples), samples=samples)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.samples:
+            return rng.choice(self.samples)
+        return rng.lognormvariate(math.log(self.median), self.sigma)
+
+
+DEFAULT_LATENCIES = {
+    LatencySource.SEARCH: LatencyDistribution(median=1.0),
+    LatencySource.FOLLOW_UP_LLM: LatencyDistribution(median=6.0),
+    LatencySource.REPORT_LLM: LatencyDistribution(median=10.0),
+    LatencySource.EMBEDDINGS: LatencyDistribution(median=0.5),
+    LatencySource.INTRO_LLM: LatencyDistribution(median=4.0),
+}
+
+# Lines logged by `log_performance` and `log_time`
+_METRIC_LINE = re.compile(
+    r"\d{2}:\d{2}:\d{2}\.\d{2} - (?P<name>.+?) - (?P<seconds>\d+(?:\.\d+)?)"
+)
+_TIMED_LINE = re.compile(r"(?P<name>\w+) executed in (?P<seconds>[\d.e+-]+)s")
+_METRIC_SOURCES = {
+    "Generate follow up questions": LatencySource.FOLLOW_UP_LLM,
+    "Generating report": LatencySource.REPORT_LLM,
+}
+_TIMED_SOURCES = {
+    "api_search": LatencySource.SEARCH,
+    # The intro calls are not timed on their own, any structured LLM call stands for them
+    "call_with_response_format": LatencySource.INTRO_LLM,
+}
+
+
+def latencies_from_logs(
+    lines: Iterable[str],
+) -> dict[LatencySource, LatencyDistribution]:
+    """Latency distributions recorded in the debug logs of a brief, the sources missing from
+    the logs keep their default distribution
+
+    The recorded latencies include the time spent waiting for the rate limiter, record them on
+    a lightly loaded run to simulate heavier ones.
+    """
+    samples = defaultdict(list)
+    for line in lines:
+        if match := _METRIC_LINE.search(line):
+            source = _METRIC_SOURCES.get(match["name"])
+        elif match := _TIMED_LINE.search(line):
+            source = _TIMED_SOURCES.get(match["name"])
+        else:
+            continue
+        if source is not None:
+            samples[source].append(float(match["seconds"]))
+
+    return {
+        source: LatencyDistribution.from_samples(samples[source])
+        if samples[source]
+        else default
+        for source, default in DEFAULT_LATENCIES.items()
+    }
+
+
+class Delay(NamedTuple):
+    seconds: float
+
+
+class Acquire(NamedTuple):
+    gate: "SimulatedGate"
+    weight: int
+
+
+class AllOf(NamedTuple):
+    processes: list[Generator]
+
+
+class EventLoop:
+    def __init__(self):
+        """Discrete-event loop running on a virtual clock
+
+        Processes are generators yielding `Delay`, `Acquire` or `AllOf` commands, they are
+        resumed when the command completes, with the weight acquired for `Acquire`. Time only
+        advances between events, so hours of simulated traffic run in a fraction of a second.
+        """
+        self.now = 0.0
+        self._events = []
+        self._seq = itertools.count()
+
+    def clock(self) -> float:
+        return self.now
+
+    def start(self, process: Generator, on_done: Callable[[], None] | None = None):
+        self._schedule(0.0, self._step, process, None, on_done)
+
+    def run(self) -> float:
+        """Run until no events are left, returns the virtual time elapsed"""
+        while self._events:
+            self.now, _, callback, args = heapq.heappop(self._events)
+            callback(*args)
+        return self.now
+
+    def _schedule(self, delay: float, callback: Callable, *args):
+        heapq.heappush(
+            self._events, (self.now + delay, next(self._seq), callback, args)
+        )
+
+    def _step(self, process: Generator, value, on_done: Callable[[], None] | None):
+        try:
+            command = process.send(value)
+        except StopIteration:
+            if on_done is not None:
+                on_done()
+            return
+
+        def resume(value=None):
+            self._schedule(0.0, self._step, process, value, on_done)
+
+        match command:
+            case Delay(seconds):
+                self._schedule(seconds, self._step, process, None, on_done)
+            case Acquire(gate, weight):
+                gate.acquire(weight, resume)
+            case AllOf(processes):
+                pending = len(processes)
+                if not pending:
+                    resume()
+
+                def child_done():
+                    nonlocal pending
+                    pending -= 1
+                    if not pending:
+                        resume()
+
+                for child in processes:
+                    self.start(child, child_done)
+            case _:
+                raise TypeError(f"Unknown simulation command {command!r}")
+
+
+class SimulatedGate:
+    def __init__(self, semaphore: WeightedSemaphore):
+        """`WeightedSemaphore` whose waiters are resumed by the event loop instead of blocking
+
+        As with the `notify_all` of the semaphore, every waiter whose weight fits is granted on
+        release, in arrival order.
+        """
+        self.semaphore = semaphore
+        self._waiters: deque[tuple[int, Callable]] = deque()
+
+    def acquire(self, weight: int, resume: Callable):
+        self._waiters.append((weight, resume))
+        self._dispatch()
+
+    def release(self, acquired: int):
+        self.semaphore.release(acquired)
+        self._dispatch()
+
+    def _dispatch(self):
+        still_waiting = deque()
+        while self._waiters and self.semaphore.weight_available() > 0:
+            weight, resume = self._waiters.popleft()
+            acquired = self.semaphore.try_acquire(weight)
+            if acquired is None:
+                still_waiting.append((weight, resume))
+            else:
+                resume(acquired)
+        still_waiting.extend(self._waiters)
+        self._waiters = still_waiting
+
+
+@dataclass
+class SimulationConfig:
+    n_entities: int
+    topics: int = len(settings.TOPICS)
+    follow_up_questions: int = settings.LLM_FOLLOW_UP_QUESTIONS
+    simultaneous_requests: int = settings.API_SIMULTANEOUS_REQUESTS
+    requests_per_minute: int = settings.API_REQUESTS_PER_MINUTE
+    max_requests_per_minute: int = settings.API_MAX_REQUESTS_PER_MINUTE
+    bulk_prescreen: bool = settings.API_BULK_PRESCREEN_ENABLED
+    prescreen_batch_size: int = settings.API_PRESCREEN_BATCH_SIZE
+    novelty: bool = settings.NOVELTY_ENABLED
+    disable_introduction: bool = False
+    # Fraction of the entities without results in the pre-check, they skip the other stages
+    no_info_ratio: float = 0.0
+
+
+@dataclass
+class SimulationResult:
+    wall_time: float
+    n_searches: int
+    n_llm_calls: int
+    n_reports: int
+    stage_durations: dict[Stage, list[float]]
+
+    def stage_percentiles(self) -> dict[Stage, dict[int, float]]:
+        return {
+            stage: percentiles(durations)
+            for stage, durations in self.stage_durations.items()
+        }
+
+    def format(self) -> str:
+        header = "".join(f"p{p}".rjust(10) for p in PERCENTILES)
+        lines = [
+            f"Predicted wall time: {self.wall_time:.1f}s",
+            (
+                f"Searches: {self.n_searches}, LLM calls: {self.n_llm_calls}, "
+                f"entity reports: {self.n_reports}"
+            ),
+            "",
+            f"{'Stage':<25}{header}",
+        ]
+        for stage, values in self.stage_percentiles().items():
+            lines.append(
+                f"{stage:<25}" + "".join(f"{values[p]:>9.2f}s" for p in PERCENTILES)
+            )
+        return "\n".join(lines)
+
+
+class PipelineSimulator:
+    def __init__(
+        self,
+        config: SimulationConfig,
+        latencies: dict[LatencySource, LatencyDistribution] | None = None,
+        *,
+        seed: int | None = None,
+    ):
+        """Simulate `execute_watchlist_report_pipeline` on a virtual clock, for capacity planning
+
+        Every entity goes through the pre-check, the exploratory fan-out, the follow-up
+        questions LLM call, the follow-up searches, the report LLM call and the novelty
+        embeddings, then the intro is generated for the whole watchlist. Calls take a latency
+        sampled from `latencies`, while the searches go through the same rate limiter and
+        weighted semaphores as the query service, driven by the virtual clock.
+
+        The API is assumed to never rate limit or fail, and the concurrency limit stays at
+        `simultaneous_requests`, as without adaptive concurrency.
+        """
+        self.config = config
+        self.latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+        self.rng = random.Random(seed)
+        self.loop = EventLoop()
+        # The pipeline and the query service have their own gates with the same capacity
+        self.pipeline_gate = SimulatedGate(
+            WeightedSemaphore(config.simultaneous_requests)
+        )
+        self.request_gate = SimulatedGate(
+            WeightedSemaphore(config.simultaneous_requests)
+        )
+        self.rate_limit_controller = AdaptiveRequestsPerMinuteController(
+            max_requests_per_min=config.requests_per_minute,
+            min_requests_per_min=settings.API_MIN_REQUESTS_PER_MINUTE,
+            ceiling_requests_per_min=config.max_requests_per_minute,
+            rate_limit_refresh_frequency=REFRESH_FREQUENCY_RATE_LIMIT,
+            seconds_before_retry=TIME_BEFORE_RETRY_RATE_LIMITER,
+            decrease_factor=settings.API_RATE_LIMIT_DECREASE_FACTOR,
+            increase_per_min=settings.API_RATE_LIMIT_INCREASE_PER_MINUTE,
+            clock=self.loop.clock,
+        )
+        self.n_searches = 0
+        self.n_llm_calls = 0
+        self.n_reports = 0
+        self.stage_durations: dict[Stage, list[float]] = defaultdict(list)
+
+    def run(self) -> SimulationResult:
+        self.loop.start(self._brief())
+        wall_time = self.loop.run()
+        return SimulationResult(
+            wall_time=wall_time,
+            n_searches=self.n_searches,
+            n_llm_calls=self.n_llm_calls,
+            n_reports=self.n_reports,
+            stage_durations=dict(self.stage_durations),
+        )
+
+    @contextmanager
+    def _stage(self, stage: Stage):
+        start = self.loop.now
+        yield
+        self.stage_durations[stage].append(self.loop.now - start)
+
+    def _brief(self):
+        config = self.config
+        if config.bulk_prescreen:
+            with self._stage(Stage.PRE_CHECK):
+                n_batches = math.ceil(config.n_entities / config.prescreen_batch_size)
+                yield AllOf([self._search() for _ in range(n_batches)])
+
+        yield AllOf([self._entity_pipeline() for _ in range(config.n_entities)])
+
+        intro_enabled = (
+            not config.disable_introduction
+            and config.n_entities <= settings.DISABLE_INTRO_OVER_N_ENTITIES
+        )
+        if intro_enabled and self.n_reports:
+            with self._stage(Stage.INTRO):
+                n_bullet_points = min(
+                    self.n_reports, settings.MAX_INTRO_SECTION_ENTITIES
+                )
+                yield AllOf(
+                    [
+                        self._llm_call(LatencySource.INTRO_LLM)
+                        for _ in range(n_bullet_points)
+                    ]
+                )
+                # The title is generated from the first bullet point
+                yield from self._llm_call(LatencySource.INTRO_LLM)
+
+    def _entity_pipeline(self):
+        config = self.config
+        if not config.bulk_prescreen:
+            with self._stage(Stage.PRE_CHECK):
+                yield from self._search()
+        if self.rng.random() < config.no_info_ratio:
+            return
+
+        with self._stage(Stage.EXPLORATORY_SEARCH):
+            # One search per topic, plus one with just the entity
+            acquired = yield Acquire(self.pipeline_gate, config.topics + 1)
+            yield AllOf([self._search() for _ in range(config.topics + 1)])
+            self.pipeline_gate.release(acquired)
+
+        with self._stage(Stage.FOLLOW_UP_LLM):
+            yield from self._llm_call(LatencySource.FOLLOW_UP_LLM)
+
+        with self._stage(Stage.FOLLOW_UP_SEARCH):
+            acquired = yield Acquire(self.pipeline_gate, config.follow_up_questions)
+            yield AllOf([self._search() for _ in range(config.follow_up_questions)])
+            self.pipeline_gate.release(acquired)
+
+        with self._stage(Stage.REPORT_LLM):
+            yield from self._llm_call(LatencySource.REPORT_LLM)
+
+        if config.novelty:
+            with self._stage(Stage.NOVELTY_EMBEDDINGS):
+                yield Delay(self._sample(LatencySource.EMBEDDINGS))
+
+        self.n_reports += 1
+
+    def _search(self):
+        # As in the query service, the request slot is held while waiting for the rate limiter
+        acquired = yield Acquire(self.request_gate, 1)
+        wait = self.rate_limit_controller.reserve()
+        if wait > 0:
+            yield Delay(wait)
+        yield Delay(self._sample(LatencySource.SEARCH))
+        self.rate_limit_controller.on_success()
+        self.request_gate.release(acquired)
+        self.n_searches += 1
+
+    def _llm_call(self, source: LatencySource):
+        yield Delay(self._sample(source))
+        self.n_llm_calls += 1
+
+    def _sample(self, source: LatencySource) -> float:
+        return self.latencies[source].sample(self.rng)
+
+
+def simulate(
+    config: SimulationConfig,
+    latencies: dict[LatencySource, LatencyDistribution] | None = None,
+    *,
+    seed: int | None = None,
+) -> SimulationResult:
+    return PipelineSimulator(config, latencies, seed=seed).run()
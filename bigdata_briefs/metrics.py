@@ -5,8 +5,12 @@ from threading import Lock
 from bigdata_briefs import logger
 from bigdata_briefs.models import (
     BulletPointsUsage,
+    CacheUsage,
     EmbeddingsUsage,
     LLMUsage,
+    PrescreenUsage,
+    PromptBudgetUsage,
+    RateLimitUsage,
     TopicContentTracker,
 )
 
@@ -31,16 +35,16 @@ class CacheMetrics(Metrics):
     lock = Lock()
 
     @classmethod
-    def track_usage(cls, usage: int = 1):
+    def track_usage(cls, usage: CacheUsage):
         cls.metrics_queue.put(usage)
 
     @classmethod
-    def get_total_usage(cls) -> int:
+    def get_total_usage(cls) -> CacheUsage:
         with cls.lock:
             usages = cls.metrics_queue.queue
             if not usages:
-                return 0
-            return sum(usages)
+                return CacheUsage()
+            return sum(usages, start=CacheUsage())
 
 
 class QueryUnitMetrics(Metrics):
@@ -60,6 +64,57 @@ class QueryUnitMetrics(Metrics):
             return sum(usages)
 
 
+class RateLimitMetrics(Metrics):
+    metrics_queue = Queue()
+    lock = Lock()
+
+    @classmethod
+    def track_usage(cls, usage: RateLimitUsage):
+        cls.metrics_queue.put(usage)
+
+    @classmethod
+    def get_total_usage(cls) -> RateLimitUsage:
+        with cls.lock:
+            usages = cls.metrics_queue.queue
+            if not usages:
+                return RateLimitUsage()
+            return sum(usages, start=RateLimitUsage())
+
+
+class PromptBudgetMetrics(Metrics):
+    metrics_queue = Queue()
+    lock = Lock()
+
+    @classmethod
+    def track_usage(cls, usage: PromptBudgetUsage):
+        cls.metrics_queue.put(usage)
+
+    @classmethod
+    def get_total_usage(cls) -> PromptBudgetUsage:
+        with cls.lock:
+            usages = cls.metrics_queue.queue
+            if not usages:
+                return PromptBudgetUsage()
+            return sum(usages, start=PromptBudgetUsage())
+
+
+class PrescreenMetrics(Metrics):
+    metrics_queue = Queue()
+    lock = Lock()
+
+    @classmethod
+    def track_usage(cls, usage: PrescreenUsage):
+        cls.metrics_queue.put(usage)
+
+    @classmethod
+    def get_total_usage(cls) -> PrescreenUsage:
+        with cls.lock:
+            usages = cls.metrics_queue.queue
+            if not usages:
+                return PrescreenUsage()
+            return sum(usages, start=PrescreenUsage())
+
+
 class WarningsMetrics(Metrics):
     metrics_queue = Queue()
     warnings = set()
@@ -130,6 +185,7 @@ class LLMMetrics:
         total_prompt_tokens = 0
         total_completion_tokens = 0
         total_n_calls = 0
+        total_cached_calls = 0
         total_tokens = 0
 
         for usage in summary.values():
@@ -137,6 +193,7 @@ class LLMMetrics:
             total_completion_tokens += usage.completion_tokens
             total_tokens += usage.total_tokens
             total_n_calls += usage.n_calls
+            total_cached_calls += usage.cached_calls
 
         return LLMUsage(
             model="multiple",
@@ -144,6 +201,7 @@ class LLMMetrics:
             completion_tokens=total_completion_tokens,
             total_tokens=total_tokens,
             n_calls=total_n_calls,
+            cached_calls=total_cached_calls,
         )
 
     @classmethod
@@ -205,3 +263,9 @@ class ContentMetrics(Metrics):
             if not usages:
                 return {}
             return TopicContentTracker.aggregate_per_topic(usages)
+
+    @classmethod
+    def get_trackers(cls) -> list[TopicContentTracker]:
+        """Content tracked for every search, without aggregation"""
+        with cls.lock:
+            return list(cls.metrics_queue.queue)
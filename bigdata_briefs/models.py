@@ -1,10 +1,15 @@
+import copy
 import re
-from datetime import datetime, timedelta
+import sys
+from datetime import UTC, datetime, timedelta
 from enum import StrEnum
 from typing import Annotated, Any
 
+import numpy as np
 from jinja2 import Template
 from pydantic import (
+    AliasChoices,
+    AliasPath,
     BaseModel,
     ConfigDict,
     Field,
@@ -20,6 +25,7 @@ from bigdata_briefs.settings import settings
 from bigdata_briefs.templates import loader
 
 MAX_CHUNKS_PER_DOCUMENT = 10
+SOURCE_RANKS = {"RANK_1": 1, "RANK_2": 2, "RANK_3": 3, "RANK_4": 4, "RANK_5": 5}
 REFERENCE_REGEX = re.compile(r"`:ref\[LIST:\[.*?\]\]`")
 
 
@@ -34,6 +40,8 @@ class NoInfoReportGenerationStep(StrEnum):
 class Watchlist(BaseModel):
     id: str
     name: str
+    last_updated: datetime | None = None
+    items: list[str] = Field(default_factory=list)
 
 
 class Entity(BaseModel):
@@ -81,33 +89,43 @@ class Entity(BaseModel):
 
 
 class ChunkHighlight(BaseModel):
-    pnum: int = Field(description="Paragraph number")
-    snum: int = Field(description="Sentence number")
+    pnum: int = Field(
+        description="Paragraph number",
+        validation_alias=AliasChoices("pnum", "paragraph"),
+    )
+    snum: int = Field(
+        description="Sentence number",
+        validation_alias=AliasChoices("snum", "sentence"),
+    )
 
 
 class Chunk(BaseModel):
-    """Represents a snippet of text from a single result document."""
+    """Represents a snippet of text from a single result document.
+
+    The validation aliases map the fields of the search API, so chunks can be validated straight
+    from the API response, see `Result.from_api`.
+    """
 
     text: str
-    chunk: int
+    chunk: int = Field(validation_alias=AliasChoices("chunk", "cnum"))
     relevance: float
     sentiment: float
-    highlights: list[ChunkHighlight]
+    # Not being returned for now, will be empty until they are added to the API response
+    highlights: list[ChunkHighlight] = Field(
+        default_factory=list, validation_alias=AliasChoices("highlights", "sentences")
+    )
 
     model_config = ConfigDict(frozen=True)
 
+    @field_validator("text", mode="after")
+    @classmethod
+    def intern_text(cls, text):
+        # The same chunk is usually returned by several searches, share a single copy of the text
+        return sys.intern(text)
+
     @classmethod
     def from_api(cls, api_chunk):
-        return cls(
-            text=api_chunk["text"],
-            chunk=api_chunk["cnum"],
-            relevance=api_chunk["relevance"],
-            sentiment=api_chunk["sentiment"],
-            highlights=[
-                ChunkHighlight(pnum=sentence["paragraph"], snum=sentence["sentence"])
-                for sentence in api_chunk.get("sentences", [])
-            ],  # Not being returned for now, will be empty until they are added to the API response
-        )
+        return cls.model_validate(api_chunk)
 
     def __hash__(self) -> int:
         return hash((self.text, self.chunk))
@@ -121,20 +139,37 @@ class Chunk(BaseModel):
 class Result(BaseModel):
     """Represents a single search result."""
 
-    document_id: str
+    document_id: str = Field(validation_alias=AliasChoices("document_id", "id"))
     headline: str
     timestamp: str
-    source_key: str
-    source_name: str
-    source_rank: int | None = None
+    source_key: str = Field(
+        validation_alias=AliasChoices("source_key", AliasPath("source", "id"))
+    )
+    source_name: str = Field(
+        validation_alias=AliasChoices("source_name", AliasPath("source", "name"))
+    )
+    source_rank: int | None = Field(
+        None, validation_alias=AliasChoices("source_rank", AliasPath("source", "rank"))
+    )
     url: str | None = None
-    ts: str
-    document_scope: str
-    language: str
+    ts: str = Field(validation_alias=AliasChoices("ts", "timestamp"))
+    document_scope: str = Field(
+        "Unknown", validation_alias=AliasChoices("document_scope", "document_type")
+    )
+    language: str = "Unknown"
     chunks: tuple[Chunk, ...]
 
     model_config = ConfigDict(frozen=True)
 
+    @field_validator("source_rank", mode="before")
+    @classmethod
+    def parse_source_rank(cls, source_rank):
+        if not isinstance(source_rank, str):
+            return source_rank
+        if source_rank not in SOURCE_RANKS:
+            raise ValueError(f"Unknown source rank {source_rank}")
+        return SOURCE_RANKS[source_rank]
+
     @field_validator("chunks", mode="after")
     @classmethod
     def filter_and_sort(cls, chunks):
@@ -142,34 +177,136 @@ class Result(BaseModel):
 
     @classmethod
     def from_api(cls, api_document):
-        match api_document["source"]["rank"]:
-            case "RANK_1":
-                rank_int = 1
-            case "RANK_2":
-                rank_int = 2
-            case "RANK_3":
-                rank_int = 3
-            case "RANK_4":
-                rank_int = 4
-            case "RANK_5":
-                rank_int = 5
-            case _:
-                raise ValueError(
-                    f"Unknown source rank {api_document['source']['rank']} for document {api_document['id']}"
-                )
-        return cls(
-            document_id=api_document["id"],
-            headline=api_document["headline"],
-            timestamp=api_document["timestamp"],
-            source_name=api_document["source"]["name"],
-            source_key=api_document["source"]["id"],
-            source_rank=rank_int,
-            url=api_document.get("url", None),
-            ts=api_document["timestamp"],
-            document_scope=api_document.get("document_type", "Unknown"),
-            language=api_document.get("language", "Unknown"),
-            chunks=[Chunk.from_api(api_chunk) for api_chunk in api_document["chunks"]],
+        """Validate a document of the search API response in a single pass"""
+        return cls.model_validate(api_document)
+
+
+class ResultBatch:
+    """Search results stored as columns, one row per chunk.
+
+    Relevance, sentiment, source rank and timestamp are NumPy arrays, so selecting, deduplicating
+    and ranking tens of thousands of chunks run as array operations instead of Python loops.
+    Every row keeps the index of its document in `documents`, which holds the document metadata
+    and is used to convert the batch back into `Result` models. Missing source ranks are `nan`.
+    """
+
+    def __init__(
+        self,
+        documents: list[Result],
+        document_index: np.ndarray,
+        chunks: np.ndarray,
+    ):
+        self.documents = documents
+        self.document_index = document_index
+        self.chunks = chunks
+
+        n_chunks = len(chunks)
+        self.document_ids = np.array(
+            [documents[i].document_id for i in document_index], dtype=object
+        )
+        self.chunk_ids = np.fromiter(
+            (c.chunk for c in chunks), dtype=np.int64, count=n_chunks
+        )
+        self.texts = np.array([sys.intern(c.text) for c in chunks], dtype=object)
+        self.relevance = np.fromiter(
+            (c.relevance for c in chunks), dtype=np.float64, count=n_chunks
+        )
+        self.sentiment = np.fromiter(
+            (c.sentiment for c in chunks), dtype=np.float64, count=n_chunks
+        )
+        document_source_ranks = np.array(
+            [np.nan if d.source_rank is None else d.source_rank for d in documents],
+            dtype=np.float64,
+        )
+        document_timestamps = np.array(
+            [_parse_timestamp(d.ts) for d in documents], dtype="datetime64[s]"
+        )
+        self.source_rank = document_source_ranks[document_index]
+        self.timestamp = document_timestamps[document_index]
+
+    @classmethod
+    def from_results(cls, results: list[Result]) -> "ResultBatch":
+        document_index = np.fromiter(
+            (i for i, result in enumerate(results) for _ in result.chunks),
+            dtype=np.int64,
+        )
+        # `fromiter` stores the chunks as they are, assigning a list would probe every model for
+        # the array protocol, which is slow on pydantic models
+        chunks = np.fromiter(
+            (chunk for result in results for chunk in result.chunks),
+            dtype=object,
+            count=len(document_index),
         )
+        return cls(list(results), document_index, chunks)
+
+    def to_results(self) -> list[Result]:
+        """Group the rows back into one `Result` per document.
+
+        Documents are returned in the order of their first row, so the order of a ranked batch is
+        kept, and the chunks of each document are sorted by chunk number.
+        """
+        order, rows_by_document = [], {}
+        for row, document in enumerate(self.document_index.tolist()):
+            if document not in rows_by_document:
+                order.append(document)
+                rows_by_document[document] = []
+            rows_by_document[document].append(row)
+
+        results = []
+        for document in order:
+            chunks = sorted(
+                self.chunks[rows_by_document[document]], key=lambda c: c.chunk
+            )
+            results.append(
+                self.documents[document].model_copy(update={"chunks": tuple(chunks)})
+            )
+        return results
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def select(self, rows: np.ndarray) -> "ResultBatch":
+        """Return the rows given by a boolean mask or an array of indices, in that order"""
+        selected = copy.copy(self)
+        for column in (
+            "document_index",
+            "chunks",
+            "document_ids",
+            "chunk_ids",
+            "texts",
+            "relevance",
+            "sentiment",
+            "source_rank",
+            "timestamp",
+        ):
+            setattr(selected, column, getattr(self, column)[rows])
+        return selected
+
+    def dedup(self) -> "ResultBatch":
+        """Keep the first row of every (document_id, chunk) pair"""
+        _, document_codes = np.unique(self.document_ids, return_inverse=True)
+        keys = np.stack([document_codes, self.chunk_ids], axis=1)
+        _, first_rows = np.unique(keys, axis=0, return_index=True)
+        return self.select(np.sort(first_rows))
+
+    def top_k(self, k: int, by: str = "relevance") -> "ResultBatch":
+        """Return the `k` rows with the highest value of the `by` column, highest first"""
+        values = -getattr(self, by)
+        if k <= 0:
+            rows = np.arange(0)
+        elif k < len(values):
+            rows = np.argpartition(values, k - 1)[:k]
+        else:
+            rows = np.arange(len(values))
+        return self.select(rows[np.argsort(values[rows], kind="stable")])
+
+
+def _parse_timestamp(ts: str) -> np.datetime64:
+    # Timezone aware timestamps are stored as naive UTC, NumPy does not support offsets
+    timestamp = datetime.fromisoformat(ts)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(UTC).replace(tzinfo=None)
+    return np.datetime64(timestamp, "s")
 
 
 class StartEndDate(BaseModel):
@@ -523,6 +660,17 @@ class OutputEntityReport(BaseModel):
     content: list[OutputReportBulletPoint]
 
 
+class QueryUnitBudgetUsage(BaseModel):
+    """Query units used by a brief and the work shed to stay within its budget"""
+
+    query_unit_budget: float | None = None
+    query_units_used: float = 0
+    topics_shed: int = 0
+    follow_up_questions_shed: int = 0
+    pre_screen_only_entities: int = 0
+    rejected_searches: int = 0
+
+
 class BriefReport(BaseModel):
     watchlist_id: str
     watchlist_name: str
@@ -534,6 +682,7 @@ class BriefReport(BaseModel):
     introduction: str
     entity_reports: list[OutputEntityReport] = []
     source_metadata: ReportedSources
+    query_unit_budget: QueryUnitBudgetUsage | None = None
 
     @classmethod
     def from_watchlist_report(
@@ -580,6 +729,8 @@ class PromptConfig(BaseModel):
     system_prompt: str
     user_template: Template
     llm_kwargs: dict
+    # Maximum tokens of the user prompt, None for no limit
+    token_budget: int | None = None
 
 
 class BulletPointsUsage(BaseModel):
@@ -602,12 +753,112 @@ class BulletPointsUsage(BaseModel):
         )
 
 
+class CacheUsage(BaseModel):
+    hits: int = 0
+    misses: int = 0
+
+    def __add__(self, other):
+        if not isinstance(other, type(self)):
+            raise ValueError(f"Can't add items that are not CacheUsage: {type(other)}")
+
+        return CacheUsage(
+            hits=self.hits + other.hits,
+            misses=self.misses + other.misses,
+        )
+
+
+class PromptBudgetUsage(BaseModel):
+    prompts: int = 0
+    trimmed_prompts: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+    dropped_chunks: int = 0
+
+    def __add__(self, other):
+        if not isinstance(other, type(self)):
+            raise ValueError(
+                f"Can't add items that are not PromptBudgetUsage: {type(other)}"
+            )
+
+        return PromptBudgetUsage(
+            prompts=self.prompts + other.prompts,
+            trimmed_prompts=self.trimmed_prompts + other.trimmed_prompts,
+            tokens_before=self.tokens_before + other.tokens_before,
+            tokens_after=self.tokens_after + other.tokens_after,
+            dropped_chunks=self.dropped_chunks + other.dropped_chunks,
+        )
+
+
+class PrescreenUsage(BaseModel):
+    batches: int = 0
+    # Batches with chunks that could not be assigned to any entity of the batch
+    inconclusive_batches: int = 0
+    entities_checked_individually: int = 0
+
+    def __add__(self, other):
+        if not isinstance(other, type(self)):
+            raise ValueError(
+                f"Can't add items that are not PrescreenUsage: {type(other)}"
+            )
+
+        return PrescreenUsage(
+            batches=self.batches + other.batches,
+            inconclusive_batches=self.inconclusive_batches + other.inconclusive_batches,
+            entities_checked_individually=self.entities_checked_individually
+            + other.entities_checked_individually,
+        )
+
+
+class TopicYield(BaseModel):
+    """Searches of a topic and how many of them returned results"""
+
+    searches: int = 0
+    hits: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.searches if self.searches else 0.0
+
+    def __add__(self, other):
+        if not isinstance(other, type(self)):
+            raise ValueError(f"Can't add items that are not TopicYield: {type(other)}")
+
+        return TopicYield(
+            searches=self.searches + other.searches,
+            hits=self.hits + other.hits,
+        )
+
+
+class RateLimitUsage(BaseModel):
+    requests_per_minute: float | None = None
+    rate_limited_responses: int = 0
+
+    def __add__(self, other):
+        if not isinstance(other, type(self)):
+            raise ValueError(
+                f"Can't add items that are not RateLimitUsage: {type(other)}"
+            )
+
+        # The rate is a gauge, keep the most recent value
+        return RateLimitUsage(
+            requests_per_minute=(
+                other.requests_per_minute
+                if other.requests_per_minute is not None
+                else self.requests_per_minute
+            ),
+            rate_limited_responses=self.rate_limited_responses
+            + other.rate_limited_responses,
+        )
+
+
 class LLMUsage(BaseModel):
     model: str = "N/A"
     prompt_tokens: int = 0
     completion_tokens: int = 0
     total_tokens: int = 0
     n_calls: int = 1
+    # Calls answered by the LLM response cache, not counted in `n_calls`
+    cached_calls: int = 0
 
     def __add__(self, other):
         if not isinstance(other, type(self)):
@@ -624,11 +875,12 @@ class LLMUsage(BaseModel):
             completion_tokens=self.completion_tokens + other.completion_tokens,
             total_tokens=self.total_tokens + other.total_tokens,
             n_calls=self.n_calls + other.n_calls,
+            cached_calls=self.cached_calls + other.cached_calls,
         )
 
     def is_empty(self) -> bool:
-        """Check if this usage instance has any tokens recorded."""
-        return self.total_tokens == 0
+        """Check if this usage instance has any tokens or cached calls recorded."""
+        return self.total_tokens == 0 and self.cached_calls == 0
 
 
 class EmbeddingsUsage(BaseModel):
@@ -679,6 +931,8 @@ class TopicContentTracker(BaseModel):
 
     topic: str
     retrieval: list[RetrievalTracker]
+    # Entity searched, kept when the search returned no results
+    entity_id: str | None = None
 
     @property
     def total_documents(self) -> float:
@@ -705,6 +959,7 @@ class TopicContentTracker(BaseModel):
         return TopicContentTracker(
             topic=self.topic,
             retrieval=self.retrieval + other.retrieval,
+            entity_id=self.entity_id if self.entity_id == other.entity_id else None,
         )
 
     @classmethod
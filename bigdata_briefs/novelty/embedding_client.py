@@ -3,6 +3,7 @@ import traceback
 import openai
 
 from bigdata_briefs import logger
+from bigdata_briefs.cassette import build_openai_client
 from bigdata_briefs.metrics import EmbeddingsMetrics
 from bigdata_briefs.models import EmbeddingsUsage
 from bigdata_briefs.settings import settings
@@ -13,7 +14,7 @@ class EmbeddingClient:
     def __init__(self, model: str, client: openai.OpenAI | None = None):
         self.model = model
         if client is None:
-            client = openai.OpenAI()
+            client = build_openai_client()
         self.client = client
 
     def compute(self, texts: list[str], **kwargs) -> list[list[float]]:
@@ -27,4 +27,5 @@ def get_prompt_keys(
             system_prompt=system_prompt,
             user_template=Template(user_template, undefined=StrictUndefined),
             llm_kwargs={**properties["model_kwargs"], "model": properties["model"]},
+            token_budget=properties.get("token_budget"),
         )
@@ -0,0 +1,139 @@
+from collections.abc import Callable
+from functools import cache
+from math import ceil
+
+import numpy as np
+
+from bigdata_briefs import logger
+from bigdata_briefs.llm_scheduler import CHARS_PER_TOKEN
+from bigdata_briefs.metrics import PromptBudgetMetrics
+from bigdata_briefs.models import PromptBudgetUsage, PromptConfig, Result, ResultBatch
+from bigdata_briefs.settings import settings
+
+try:
+    import tiktoken
+except ImportError:  # Optional, token counts are estimated without it
+    tiktoken = None
+
+# Encoding of the recent OpenAI models, for the models unknown to tiktoken
+DEFAULT_ENCODING = "o200k_base"
+
+
+@cache
+def get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Tokens of `text` for `model`, estimated from its length if tiktoken is not installed"""
+    if tiktoken is None:
+        return ceil(len(text) / CHARS_PER_TOKEN)
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+class PromptTokenBudget:
+    def __init__(self, name: str, max_tokens: int, model: str):
+        """Fit the search results of a prompt to `max_tokens`
+
+        The results are the variable part of the prompts, e.g. every chunk of the exploratory
+        search in the follow-up questions prompt. When the rendered prompt is over the budget,
+        the least relevant chunks of all the results are dropped, and the documents left without
+        chunks, keeping the most chunks that fit. The tokens of every prompt before and after
+        fitting are tracked in `PromptBudgetMetrics`.
+        """
+        self.name = name
+        self.max_tokens = max_tokens
+        self.model = model
+
+    @classmethod
+    def for_prompt(
+        cls, name: str, prompt_config: PromptConfig
+    ) -> "PromptTokenBudget | None":
+        if not settings.PROMPT_TOKEN_BUDGET_ENABLED:
+            return None
+        max_tokens = settings.PROMPT_TOKEN_BUDGETS.get(name, prompt_config.token_budget)
+        if max_tokens is None:
+            return None
+        return cls(name, max_tokens, prompt_config.llm_kwargs["model"])
+
+    def fit(
+        self,
+        result_lists: list[list[Result]],
+        render: Callable[[list[list[Result]]], str],
+    ) -> str:
+        """Render the prompt with the most relevant chunks of `result_lists` that fit the budget
+
+        :param result_lists: Results of the prompt, e.g. the answers of every question.
+        :param render: Render the prompt with the given results, with the same shape as
+            `result_lists`.
+        """
+        prompt = render(result_lists)
+        tokens_before = count_tokens(prompt, self.model)
+        n_chunks = sum(
+            len(result.chunks) for results in result_lists for result in results
+        )
+        if tokens_before <= self.max_tokens:
+            self._track(tokens_before, tokens_before, dropped_chunks=0)
+            return prompt
+
+        # Largest number of chunks that fits, the prompt grows with the chunks it keeps
+        low, high = 0, n_chunks - 1
+        while low < high:
+            kept = (low + high + 1) // 2
+            prompt = render(most_relevant_chunks(result_lists, kept))
+            if count_tokens(prompt, self.model) <= self.max_tokens:
+                low = kept
+            else:
+                high = kept - 1
+        n_kept = low
+        prompt = render(most_relevant_chunks(result_lists, n_kept))
+        tokens_after = count_tokens(prompt, self.model)
+
+        if tokens_after > self.max_tokens:
+            logger.warning(
+                "Prompt over its token budget without any search result",
+                prompt=self.name,
+                tokens=tokens_after,
+                token_budget=self.max_tokens,
+            )
+        logger.debug(
+            "Dropped the least relevant chunks of the prompt to fit its token budget",
+            prompt=self.name,
+            tokens_before=tokens_before,
+            tokens_after=tokens_after,
+            dropped_chunks=n_chunks - n_kept,
+        )
+        self._track(tokens_before, tokens_after, dropped_chunks=n_chunks - n_kept)
+        return prompt
+
+    def _track(self, tokens_before: int, tokens_after: int, dropped_chunks: int):
+        PromptBudgetMetrics.track_usage(
+            PromptBudgetUsage(
+                prompts=1,
+                trimmed_prompts=int(dropped_chunks > 0),
+                tokens_before=tokens_before,
+                tokens_after=tokens_after,
+                dropped_chunks=dropped_chunks,
+            )
+        )
+
+
+def most_relevant_chunks(
+    result_lists: list[list[Result]], k: int
+) -> list[list[Result]]:
+    """Keep the `k` most relevant chunks across all the lists, in their original order"""
+    batches = [ResultBatch.from_results(results) for results in result_lists]
+    if not batches:
+        return []
+    relevance = np.concatenate([batch.relevance for batch in batches])
+    keep = np.zeros(len(relevance), dtype=bool)
+    keep[np.argsort(-relevance, kind="stable")[:k]] = True
+
+    fitted, start = [], 0
+    for batch in batches:
+        fitted.append(batch.select(keep[start : start + len(batch)]).to_results())
+        start += len(batch)
+    return fitted
@@ -6,11 +6,13 @@ from bigdata_briefs.llm_client import (
 from bigdata_briefs.models import (
     Entity,
     QAPairs,
+    QuestionAnswer,
     ReportDates,
     Result,
     RetrievedSources,
     SingleEntityReport,
 )
+from bigdata_briefs.prompts.token_budget import PromptTokenBudget
 from bigdata_briefs.templates import loader
 
 
@@ -23,25 +25,33 @@ def get_followup_questions_user_prompt(
     user_template: Template,
     topics: list[str],
     config: FollowUpQuestionsPromptDefaults = FollowUpQuestionsPromptDefaults(),
+    token_budget: PromptTokenBudget | None = None,
 ) -> str:
-    results_md = (
-        loader.get_template("prompts/results.md.jinja").render(results=results).strip()
-    )
     topics_md = "\n".join(f"* {t.format(entity=entity.name)}" for t in topics)
 
-    return user_template.render(
-        entity_info=entity,
-        topics=topics_md,
-        results_md=results_md,
-        n_followup_queries=config.n_followup_queries,
-        lookback_days=report_dates.get_lookback_days(),  # TODO do we still want lookback_days in the prompt?
-        start_date=report_dates.start.strftime("%B %d, %Y"),
-        end_date=report_dates.end.strftime("%B %d, %Y"),
-        response_format=response_format,
-        current_datetime=report_dates.end.strftime(
-            "%A, %B %d, %Y %H:%M %Z"
-        ),  # TODO difference with end_day?
-    )
+    def render(result_lists: list[list[Result]]) -> str:
+        results_md = (
+            loader.get_template("prompts/results.md.jinja")
+            .render(results=result_lists[0])
+            .strip()
+        )
+        return user_template.render(
+            entity_info=entity,
+            topics=topics_md,
+            results_md=results_md,
+            n_followup_queries=config.n_followup_queries,
+            lookback_days=report_dates.get_lookback_days(),  # TODO do we still want lookback_days in the prompt?
+            start_date=report_dates.start.strftime("%B %d, %Y"),
+            end_date=report_dates.end.strftime("%B %d, %Y"),
+            response_format=response_format,
+            current_datetime=report_dates.end.strftime(
+                "%A, %B %d, %Y %H:%M %Z"
+            ),  # TODO difference with end_day?
+        )
+
+    if token_budget is None:
+        return render([results])
+    return token_budget.fit([results], render)
 
 
 def get_report_user_prompt(
@@ -53,30 +63,44 @@ def get_report_user_prompt(
     response_format: str,
     report_sources: RetrievedSources | None,
     topics: list[str] | None = None,
+    token_budget: PromptTokenBudget | None = None,
 ):
-    if report_sources:
-        rendered_qapairs = qa_pairs.render_md_with_references(report_sources)
-    else:
-        rendered_qapairs = qa_pairs.render_md()
-
     entity_info = f"{entity.name} ({entity.ticker})" if entity.ticker else entity.name
 
     topics_md = None
     if topics:
         topics_md = "\n".join(f"* {t.format(entity=entity.name)}" for t in topics)
 
-    return user_template.render(
-        entity_info=entity_info,
-        rendered_qapairs=rendered_qapairs,
-        topics=topics_md,
-        lookback_days=report_dates.get_lookback_days(),
-        start_date=report_dates.start.strftime("%B %d, %Y"),
-        end_date=report_dates.end.strftime("%B %d, %Y"),
-        current_datetime=report_dates.end.strftime(
-            "%A, %B %d, %Y %H:%M %Z"
-        ),  # TODO difference with end_day?
-        response_format=response_format,
-    )
+    def render(answers: list[list[Result]]) -> str:
+        # The sources of the dropped chunks are kept, they are just never referenced
+        rendered_pairs = QAPairs(
+            pairs=[
+                QuestionAnswer(question=pair.question, answer=answer)
+                for pair, answer in zip(qa_pairs.pairs, answers)
+            ]
+        )
+        if report_sources:
+            rendered_qapairs = rendered_pairs.render_md_with_references(report_sources)
+        else:
+            rendered_qapairs = rendered_pairs.render_md()
+
+        return user_template.render(
+            entity_info=entity_info,
+            rendered_qapairs=rendered_qapairs,
+            topics=topics_md,
+            lookback_days=report_dates.get_lookback_days(),
+            start_date=report_dates.start.strftime("%B %d, %Y"),
+            end_date=report_dates.end.strftime("%B %d, %Y"),
+            current_datetime=report_dates.end.strftime(
+                "%A, %B %d, %Y %H:%M %Z"
+            ),  # TODO difference with end_day?
+            response_format=response_format,
+        )
+
+    answers = [pair.answer for pair in qa_pairs.pairs]
+    if token_budget is None:
+        return render(answers)
+    return token_budget.fit(answers, render)
 
 
 def get_compare_reports_user_prompt(
@@ -1,41 +1,84 @@
+import asyncio
+import heapq
 import itertools
+import json
+from collections import defaultdict
 from concurrent.futures import as_completed
 from concurrent.futures.thread import ThreadPoolExecutor
-from threading import Semaphore
+from time import perf_counter
 
 import httpx
-from bigdata_client import Bigdata
-from bigdata_client.models.watchlists import Watchlist
 from pydantic import ValidationError
 
 from bigdata_briefs import logger
+from bigdata_briefs.budget import get_query_unit_budget
+from bigdata_briefs.cache import Cache
+from bigdata_briefs.cassette import async_cassette_transport, cassette_transport
+from bigdata_briefs.concurrency_limiter import AdaptiveConcurrencyLimiter
 from bigdata_briefs.exceptions import TooManyAPIRetriesError
-from bigdata_briefs.metrics import ContentMetrics, QueryUnitMetrics
+from bigdata_briefs.metrics import (
+    CacheMetrics,
+    ContentMetrics,
+    PrescreenMetrics,
+    QueryUnitMetrics,
+)
 from bigdata_briefs.models import (
+    MAX_CHUNKS_PER_DOCUMENT,
+    CacheUsage,
+    Chunk,
     Entity,
+    PrescreenUsage,
     QAPairs,
     QuestionAnswer,
     ReportDates,
     Result,
     TopicContentTracker,
+    Watchlist,
+)
+from bigdata_briefs.query_service.base import AsyncBaseQueryService, BaseQueryService
+from bigdata_briefs.query_service.circuit_breaker import (
+    CircuitBreaker,
+    RetryBudget,
+    get_circuit_breaker,
+    get_retry_budget,
+)
+from bigdata_briefs.query_service.hedging import (
+    HedgingPolicy,
+    first_successful,
+    first_successful_async,
+)
+from bigdata_briefs.query_service.models import (
+    SearchAPIQueryDict,
+    SearchResponse,
+    SearchUsageResponse,
 )
-from bigdata_briefs.query_service.base import BaseQueryService
-from bigdata_briefs.query_service.models import SearchAPIQueryDict
-from bigdata_briefs.query_service.rate_limit import RequestsPerMinuteController
+from bigdata_briefs.query_service.rate_limit import (
+    AdaptiveRequestsPerMinuteController,
+    parse_retry_after,
+)
+from bigdata_briefs.query_service.single_flight import AsyncSingleFlight, SingleFlight
+from bigdata_briefs.query_service.time_slices import (
+    SliceSearch,
+    TimeSlicing,
+    merge_slices,
+)
+from bigdata_briefs.query_service.watchlists import WatchlistProvider
+from bigdata_briefs.scheduler import FairShareScheduler
 from bigdata_briefs.settings import settings
 from bigdata_briefs.utils import (
+    async_sleep_with_backoff,
+    canonical_hash,
+    gather_bounded,
     log_args,
     log_performance,
     log_return_value,
     log_time,
     sleep_with_backoff,
+    submit_with_context,
 )
 
-MAX_REQUESTS_PER_MINUTE = (
-    460  # Backend rate limit (500 max, using 460 for maximum safety margin)
-)
 REFRESH_FREQUENCY_RATE_LIMIT = 5  # Time in seconds to pro-rate the rate limiter, lower values = smoother requests, more overhead
-TIME_BEFORE_RETRY_RATE_LIMITER = 1.0  # Time in seconds before retrying the request
+TIME_BEFORE_RETRY_RATE_LIMITER = 1.0  # Bounds the time a request waits for the rate limiter to MAX_RETRIES_RATE_LIMITER times this value
 
 MAX_ENTITIES_PER_KG_ENTITY_BY_ID_REQUEST = (
     100  # Max number of entities per request to /v1/knowledge-graph/entities/id
@@ -45,94 +88,280 @@ MAX_ENTITIES_PER_KG_ENTITY_BY_ID_REQUEST = (
 class APIQueryService(BaseQueryService):
     def __init__(
         self,
+        search_cache: Cache | None = None,
+        concurrency_limiter: AdaptiveConcurrencyLimiter | None = None,
+        entity_cache: Cache | None = None,
+        watchlist_cache: Cache | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        retry_budget: RetryBudget | None = None,
+        transport: httpx.BaseTransport | None = None,
     ):
         self._api_key = settings.BIGDATA_API_KEY
-        self.semaphore = Semaphore(
-            value=settings.API_SIMULTANEOUS_REQUESTS
-        )  # Max number of concurrent connections to the SDK
+        self.search_cache = search_cache
+        self.entity_cache = entity_cache
+        # Identical searches running at the same time share a single API call
+        self.single_flight = SingleFlight()
+        self.concurrency_limiter = (
+            concurrency_limiter or AdaptiveConcurrencyLimiter.from_settings()
+        )
+        # Max number of concurrent connections to the API
+        self.semaphore = self.concurrency_limiter.new_gate()
         self._client = httpx.Client(
             base_url=settings.API_BASE_URL,
             headers=self.headers,
             timeout=settings.API_TIMEOUT_SECONDS,
+            transport=transport or cassette_transport(),
+        )
+        self.rate_limit_controller = build_rate_limit_controller()
+        self.hedging = HedgingPolicy.from_settings()
+        # Shared by the whole process unless given, so an outage is detected by every service
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker()
+        self.retry_budget = retry_budget or get_retry_budget()
+        # Runs the requests that may be hedged, so the caller can wait on the first response
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=2 * settings.API_MAX_SIMULTANEOUS_REQUESTS
+        )
+        # Day slices are only worth searching if their responses are cached
+        self.time_slicing = (
+            TimeSlicing.from_settings() if search_cache is not None else None
         )
-        self.rate_limit_controller = RequestsPerMinuteController(
-            max_requests_per_min=MAX_REQUESTS_PER_MINUTE,
-            rate_limit_refresh_frequency=REFRESH_FREQUENCY_RATE_LIMIT,
-            seconds_before_retry=TIME_BEFORE_RETRY_RATE_LIMITER,
+        # Runs the searches of the day slices of a search
+        self._slice_executor = ThreadPoolExecutor(
+            max_workers=settings.API_MAX_SIMULTANEOUS_REQUESTS
+        )
+        # Fetches the batches of entities missing from the cache
+        self._entity_executor = ThreadPoolExecutor(
+            max_workers=settings.API_SIMULTANEOUS_REQUESTS
         )
 
         # Watchlists are not available in the API client yet, so we use the SDK for that
-        self.sdk_client = Bigdata(api_key=settings.BIGDATA_API_KEY)
+        self.watchlists = WatchlistProvider(watchlist_cache)
 
     @property
     def headers(self) -> dict[str, str]:
         return {"X-API-KEY": self._api_key, "Content-Type": "application/json"}
 
     def cleanup(self):
+        self._hedge_executor.shutdown(wait=False)
+        self._slice_executor.shutdown(wait=False)
+        self._entity_executor.shutdown(wait=False)
         self._client.close()
 
     def get_watchlist(self, watchlist_id: str) -> Watchlist:
-        return self.sdk_client.watchlists.get(watchlist_id)
+        return self.watchlists.get(watchlist_id)
 
+    @log_time
     def get_entities(self, entity_ids: list[str]) -> list[Entity]:
-        # Batch entity_ids into chunks
-        def batched(iterable, n):
-            for i in range(0, len(iterable), n):
-                yield iterable[i : i + n]
-
-        entities = []
-        for batch in batched(entity_ids, MAX_ENTITIES_PER_KG_ENTITY_BY_ID_REQUEST):
-            raw_entities = self._call_api(
-                endpoint="/v1/knowledge-graph/entities/id",
-                method="POST",
-                payload={"values": batch},
-                headers=self.headers,
-            )
-            for entity_data in raw_entities["results"].values():
-                entities.append(Entity.from_api(entity_data))
+        raw_entities = {}
+        if self.entity_cache is not None:
+            raw_entities = self.entity_cache.get_many(entity_ids)
 
-        return entities
+        missing_ids = [e for e in entity_ids if e not in raw_entities]
+        batches = list(batched(missing_ids, MAX_ENTITIES_PER_KG_ENTITY_BY_ID_REQUEST))
+        futures = [
+            submit_with_context(self._entity_executor, self._get_entities_batch, batch)
+            for batch in batches
+        ]
+        fetched_entities = {}
+        for future in futures:
+            fetched_entities.update(future.result())
+
+        logger.debug(
+            "Resolved entities",
+            n_entities=len(entity_ids),
+            retrieved_from_cache=len(raw_entities),
+            n_batches=len(batches),
+        )
+        if self.entity_cache is not None:
+            self.entity_cache.set_many(fetched_entities)
+        raw_entities.update(fetched_entities)
+
+        return [
+            Entity.from_api(raw_entities[entity_id])
+            for entity_id in entity_ids
+            if entity_id in raw_entities
+        ]
+
+    def _get_entities_batch(self, entity_ids: list[str]) -> dict[str, dict]:
+        raw_entities = self._call_api(
+            endpoint="/v1/knowledge-graph/entities/id",
+            method="POST",
+            payload={"values": entity_ids},
+            headers=self.headers,
+        )
+        return {
+            entity_data["id"]: entity_data
+            for entity_data in raw_entities["results"].values()
+        }
 
     @log_args
     @log_return_value
     @log_time
     def api_search(self, endpoint: str, method: str, payload: dict):
-        results = self._call_api(endpoint, method, payload, self.headers)
+        slices = self.time_slicing.split(payload) if self.time_slicing else []
+        if slices:
+            return self._sliced_search(endpoint, method, payload, slices)
+        return decode_search_response(self._search_content(endpoint, method, payload))
+
+    def _sliced_search(
+        self, endpoint: str, method: str, payload: dict, slices: list[SliceSearch]
+    ) -> list[Result]:
+        """Search every day of the date range of the payload, the days that are over are
+        usually cached, and merge the results as if the whole range was searched"""
+        logger.debug(f"Search split in {len(slices)} day slices")
+        futures = [
+            submit_with_context(
+                self._slice_executor,
+                self._search_content,
+                endpoint,
+                method,
+                time_slice.payload,
+                time_slice.ttl_seconds,
+            )
+            for time_slice in slices
+        ]
+        return merge_slices(
+            [decode_search_response(future.result()) for future in futures],
+            max_chunks=payload["query"].get("max_chunks"),
+        )
+
+    def api_search_raw(self, endpoint: str, method: str, payload: dict) -> dict:
+        """Search returning the response of the API as a dict, without validation"""
+        return json.loads(self._search_content(endpoint, method, payload))
 
-        QueryUnitMetrics.track_usage(results["usage"]["api_query_units"])
+    def _search_content(
+        self,
+        endpoint: str,
+        method: str,
+        payload: dict,
+        ttl_seconds: float | None = None,
+    ) -> str:
+        cache_key = search_cache_key(endpoint, method, payload)
+        if self.search_cache is not None:
+            content = self.search_cache.get(cache_key)
+            if content is not None:
+                CacheMetrics.track_usage(CacheUsage(hits=1))
+                return content
+            CacheMetrics.track_usage(CacheUsage(misses=1))
+
+        budget = get_query_unit_budget()
+        if budget is not None:
+            budget.check()
+        content, shared = self.single_flight.do(
+            cache_key, self._search, endpoint, method, payload, cache_key, ttl_seconds
+        )
+        if shared:
+            logger.debug("Search coalesced with an identical in-flight request")
 
-        parsed_results = []
-        for result in results["results"]:
-            parsed_results.append(Result.from_api(result))
+        return content
 
-        return parsed_results
+    def _search(
+        self,
+        endpoint: str,
+        method: str,
+        payload: dict,
+        cache_key: str,
+        ttl_seconds: float | None = None,
+    ) -> str:
+        # Keep the response as JSON text, it's decoded straight into the result models
+        content = self._send(endpoint, method, payload, self.headers).text
+        query_units = decode_query_units(content)
+        QueryUnitMetrics.track_usage(query_units)
+        budget = get_query_unit_budget()
+        if budget is not None:
+            budget.consume(query_units)
+
+        if self.search_cache is not None:
+            self.search_cache.set(cache_key, content, ttl_seconds=ttl_seconds)
+
+        return content
 
     def _call_api(
         self, endpoint: str, method: str, payload: dict, headers: dict
     ) -> dict:
-        with self.semaphore:
-            for attempt in range(settings.API_RETRIES):
-                try:
+        return self._send(endpoint, method, payload, headers).json()
+
+    def _send(
+        self, endpoint: str, method: str, payload: dict, headers: dict
+    ) -> httpx.Response:
+        self.retry_budget.on_request()
+        for attempt in range(settings.API_RETRIES):
+            self.circuit_breaker.before_call()
+            try:
+                # The slot is only held while the request runs, not while backing off
+                with self.semaphore(1):
                     result = self.rate_limit_controller(
-                        self._client.request,
+                        self._hedged_request,
                         method=method,
                         url=endpoint,
                         json=payload,
                         headers=headers,
                     )
-                    result.raise_for_status()
-                    return result.json()
-                except (httpx.HTTPStatusError, httpx.ConnectTimeout) as e:
-                    last_exception = e
-                    logger.warning(
-                        f"Error calling API {method} at endpoint {endpoint}: {e}. Attempt {attempt + 1}"
+                result.raise_for_status()
+                self.rate_limit_controller.on_success()
+                self.circuit_breaker.on_success()
+                return result
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                last_exception = e
+                logger.warning(
+                    f"Error calling API {method} at endpoint {endpoint}: {e}. Attempt {attempt + 1}"
+                )
+                if isinstance(e, httpx.TimeoutException):
+                    self.concurrency_limiter.on_dropped()
+                if is_server_failure(e):
+                    self.circuit_breaker.on_failure()
+                else:
+                    self.circuit_breaker.on_success()
+
+                if attempt + 1 == settings.API_RETRIES:
+                    break
+                if not self.retry_budget.try_retry():
+                    logger.warning("Retry budget exhausted, not retrying")
+                    break
+                if is_rate_limited(e):
+                    # The rate limiter already delays the retry as much as the server asked for
+                    self.rate_limit_controller.on_rate_limited(
+                        parse_retry_after(e.response.headers.get("Retry-After"))
                     )
+                else:
                     sleep_with_backoff(attempt=attempt)
 
-        msg = f"Too many API retries for {method} at endpoint {endpoint}. Last error {last_exception}."
-        if isinstance(last_exception, httpx.HTTPStatusError):
-            msg = msg + f" Response body {last_exception.response.text}"
-        raise TooManyAPIRetriesError(msg)
+        raise too_many_retries_error(method, endpoint, last_exception)
+
+    def _hedged_request(self, **kwargs) -> httpx.Response:
+        """Send a request, and a duplicate if it runs longer than usual for its endpoint,
+        returning the first response. The duplicate needs a free token of the rate limiter."""
+        if self.hedging is None:
+            return self._timed_request(**kwargs)
+        hedge_after = self.hedging.on_request(kwargs["url"])
+        if hedge_after is None:
+            return self._timed_request(**kwargs)
+
+        primary = submit_with_context(
+            self._hedge_executor, self._timed_request, **kwargs
+        )
+        try:
+            return primary.result(timeout=hedge_after)
+        except TimeoutError:
+            pass
+        if not (self.hedging.try_hedge() and self.rate_limit_controller.try_reserve()):
+            return primary.result()
+
+        logger.debug("Hedging slow request", url=kwargs["url"], after=hedge_after)
+        hedge = submit_with_context(self._hedge_executor, self._timed_request, **kwargs)
+        # The slower request can't be cancelled, it finishes in the background and is discarded
+        return first_successful([primary, hedge])
+
+    def _timed_request(self, **kwargs) -> httpx.Response:
+        """Send a request and feed its latency to the concurrency limiter and hedging policy"""
+        in_flight = self.semaphore.weight_in_use()
+        start = perf_counter()
+        response = self._client.request(**kwargs)
+        latency = perf_counter() - start
+        self.concurrency_limiter.record_latency(latency, in_flight)
+        if self.hedging is not None:
+            self.hedging.record_latency(kwargs["url"], latency)
+        return response
 
     @log_performance
     def check_if_entity_has_results(
@@ -182,6 +411,91 @@ class APIQueryService(BaseQueryService):
 
         return results
 
+    @log_performance
+    def check_if_entities_have_results(
+        self,
+        entity_ids: list[str],
+        report_dates: ReportDates,
+        executor: ThreadPoolExecutor,
+        *,
+        source_filter: list[str] | None = None,
+        categories: list[str] | None = None,
+    ) -> dict[str, list[Result]]:
+        """
+        Bulk version of `check_if_entity_has_results`, returns the results found for every entity.
+
+        Entities are searched in batches of `API_PRESCREEN_BATCH_SIZE` with a single query each,
+        and the results are assigned to entities with the entity detections of every chunk.
+        Entities without detections can only be ruled out if the batch did not return as many
+        chunks as requested, otherwise they are checked individually.
+        """
+        futures = [
+            submit_with_context(
+                executor,
+                self._check_if_batch_has_results,
+                batch,
+                report_dates,
+                executor,
+                source_filter=source_filter,
+                categories=categories,
+            )
+            for batch in batched(entity_ids, settings.API_PRESCREEN_BATCH_SIZE)
+        ]
+
+        results_per_entity = {}
+        for future in futures:
+            results_per_entity.update(future.result())
+        return results_per_entity
+
+    def _check_if_batch_has_results(
+        self,
+        entity_ids: list[str],
+        report_dates: ReportDates,
+        executor: ThreadPoolExecutor,
+        *,
+        source_filter: list[str] | None,
+        categories: list[str] | None,
+    ) -> dict[str, list[Result]]:
+        chunk_limit = len(entity_ids) * settings.API_PRESCREEN_CHUNKS_PER_ENTITY
+        query = build_query(
+            entity_id=entity_ids,
+            report_dates=report_dates,
+            similarity_text=None,
+            source_filter=source_filter,
+            categories=categories,
+            sentiment_threshold=None,
+            chunk_limit=chunk_limit,
+            rerank_threshold=None,
+            source_rank_boost=None,
+            freshness_boost=None,
+        )
+        results = self.api_search_raw(
+            endpoint="/v1/search",
+            method="POST",
+            payload=query,
+        )
+
+        results_per_entity, unresolved = resolve_prescreen_batch(
+            results, entity_ids, chunk_limit
+        )
+        futures = {
+            entity_id: submit_with_context(
+                executor,
+                self.check_if_entity_has_results,
+                entity_id=entity_id,
+                report_dates=report_dates,
+                source_filter=source_filter,
+                categories=categories,
+            )
+            for entity_id in unresolved
+        }
+        for entity_id, future in futures.items():
+            results_per_entity[entity_id] = future.result()
+
+        return {
+            entity_id: results_per_entity.get(entity_id, []) for entity_id in entity_ids
+        }
+
     @log_performance
     def _run_single_exploratory_search(
         self,
@@ -224,6 +538,7 @@ class APIQueryService(BaseQueryService):
                         sdk_results=results,
                         entity_id=entity_id,
                     ),
+                    entity_id=entity_id,
                 )
             )
 
@@ -246,12 +561,17 @@ class APIQueryService(BaseQueryService):
         rerank_threshold: float | None = settings.API_RERANK_EXPLORATORY,
         source_rank_boost: int | None = settings.API_SOURCE_RANK_BOOST,
         freshness_boost: int | None = settings.API_FRESHNESS_BOOST,
+        seed_results: list[Result] | None = None,
     ) -> list[Result]:
+        # Results already retrieved for the entity, e.g. by the pre-screen, are kept with the
+        # ones of the query with just the entity
+        seed_results = seed_results or []
         if use_topics:
             # TODO use jinja2
             entity_topics = [t.format(entity=entity.name) for t in topics]
             futures = [
-                executor.submit(
+                submit_with_context(
+                    executor,
                     self._run_single_exploratory_search,
                     entity_id=entity.id,
                     similarity_text=similarity_text,
@@ -271,7 +591,8 @@ class APIQueryService(BaseQueryService):
             ]
             # In addition to searching by topics, query with just the entity
             futures.append(
-                executor.submit(
+                submit_with_context(
+                    executor,
                     self._run_single_exploratory_search,
                     entity_id=entity.id,
                     report_dates=report_dates,
@@ -279,18 +600,18 @@ class APIQueryService(BaseQueryService):
                     metric_name=f"Exploratory search. Entity {entity.id}",
                 )
             )
-            # Remove duplicates and return as a list
-            v = list(set(itertools.chain(*(f.result() for f in as_completed(futures)))))
-
-            return v
+            return merge_results(
+                seed_results, *(f.result() for f in as_completed(futures))
+            )
 
         else:
-            return self._run_single_exploratory_search(
+            results = self._run_single_exploratory_search(
                 entity_id=entity.id,
                 report_dates=report_dates,
                 enable_metric=True,
                 metric_name=f"Exploratory search. Entity {entity.id}",
             )
+            return merge_results(seed_results, results)
 
     def _run_follow_up_single_question(
         self,
@@ -350,7 +671,8 @@ class APIQueryService(BaseQueryService):
         freshness_boost: int | None = settings.API_FRESHNESS_BOOST,
     ) -> QAPairs:
         future_to_question = {
-            executor.submit(
+            submit_with_context(
+                executor,
                 self._run_follow_up_single_question,
                 entity_id=entity.id,
                 question=question,
@@ -379,9 +701,722 @@ class APIQueryService(BaseQueryService):
         return QAPairs(pairs=qa_pairs)
 
 
+class AsyncAPIQueryService(AsyncBaseQueryService):
+    """Asyncio-native version of `APIQueryService`.
+
+    Searches are coroutines sharing a single `httpx.AsyncClient`, so the fan-out of topics and
+    follow-up questions for every entity runs on one event loop instead of a thread per request.
+    """
+
+    def __init__(
+        self,
+        search_cache: Cache | None = None,
+        concurrency_limiter: AdaptiveConcurrencyLimiter | None = None,
+        entity_cache: Cache | None = None,
+        watchlist_cache: Cache | None = None,
+        semaphore: FairShareScheduler | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        retry_budget: RetryBudget | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self._api_key = settings.BIGDATA_API_KEY
+        self.search_cache = search_cache
+        self.entity_cache = entity_cache
+        # Identical searches running at the same time share a single API call
+        self.single_flight = AsyncSingleFlight()
+        self.concurrency_limiter = (
+            concurrency_limiter or AdaptiveConcurrencyLimiter.from_settings()
+        )
+        # Max number of concurrent connections to the API. Pass the semaphore of an
+        # `APIQueryService` to share its connections, e.g. `APIQueryService.semaphore`
+        self.semaphore = semaphore or self.concurrency_limiter.new_gate()
+        self._client = httpx.AsyncClient(
+            base_url=settings.API_BASE_URL,
+            headers=self.headers,
+            timeout=settings.API_TIMEOUT_SECONDS,
+            transport=transport or async_cassette_transport(),
+        )
+        self.rate_limit_controller = build_rate_limit_controller()
+        self.hedging = HedgingPolicy.from_settings()
+        # Shared by the whole process unless given, so an outage is detected by every service
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker()
+        self.retry_budget = retry_budget or get_retry_budget()
+        # Day slices are only worth searching if their responses are cached
+        self.time_slicing = (
+            TimeSlicing.from_settings() if search_cache is not None else None
+        )
+
+        # Watchlists are not available in the API client yet, so we use the SDK for that
+        self.watchlists = WatchlistProvider(watchlist_cache)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"X-API-KEY": self._api_key, "Content-Type": "application/json"}
+
+    async def cleanup(self):
+        await self._client.aclose()
+
+    async def get_watchlist(self, watchlist_id: str) -> Watchlist:
+        # The SDK is synchronous, run it in a thread to avoid blocking the event loop
+        return await asyncio.to_thread(self.watchlists.get, watchlist_id)
+
+    async def get_entities(self, entity_ids: list[str]) -> list[Entity]:
+        raw_entities = {}
+        if self.entity_cache is not None:
+            raw_entities = await asyncio.to_thread(
+                self.entity_cache.get_many, entity_ids
+            )
+
+        missing_ids = [e for e in entity_ids if e not in raw_entities]
+        batches = list(batched(missing_ids, MAX_ENTITIES_PER_KG_ENTITY_BY_ID_REQUEST))
+        fetched_entities = {}
+        for batch_entities in await gather_bounded(
+            (self._get_entities_batch(batch) for batch in batches),
+            limit=self.concurrency_limiter.limit,
+        ):
+            fetched_entities.update(batch_entities)
+
+        logger.debug(
+            "Resolved entities",
+            n_entities=len(entity_ids),
+            retrieved_from_cache=len(raw_entities),
+            n_batches=len(batches),
+        )
+        if self.entity_cache is not None:
+            await asyncio.to_thread(self.entity_cache.set_many, fetched_entities)
+        raw_entities.update(fetched_entities)
+
+        return [
+            Entity.from_api(raw_entities[entity_id])
+            for entity_id in entity_ids
+            if entity_id in raw_entities
+        ]
+
+    async def _get_entities_batch(self, entity_ids: list[str]) -> dict[str, dict]:
+        raw_entities = await self._call_api(
+            endpoint="/v1/knowledge-graph/entities/id",
+            method="POST",
+            payload={"values": entity_ids},
+            headers=self.headers,
+        )
+        return {
+            entity_data["id"]: entity_data
+            for entity_data in raw_entities["results"].values()
+        }
+
+    @log_args
+    @log_return_value
+    @log_time
+    async def api_search(self, endpoint: str, method: str, payload: dict):
+        slices = self.time_slicing.split(payload) if self.time_slicing else []
+        if slices:
+            logger.debug(f"Search split in {len(slices)} day slices")
+            contents = await asyncio.gather(
+                *(
+                    self._search_content(
+                        endpoint, method, time_slice.payload, time_slice.ttl_seconds
+                    )
+                    for time_slice in slices
+                )
+            )
+            return merge_slices(
+                [decode_search_response(content) for content in contents],
+                max_chunks=payload["query"].get("max_chunks"),
+            )
+        return decode_search_response(
+            await self._search_content(endpoint, method, payload)
+        )
+
+    async def api_search_raw(self, endpoint: str, method: str, payload: dict) -> dict:
+        """Search returning the response of the API as a dict, without validation"""
+        return json.loads(await self._search_content(endpoint, method, payload))
+
+    async def _search_content(
+        self,
+        endpoint: str,
+        method: str,
+        payload: dict,
+        ttl_seconds: float | None = None,
+    ) -> str:
+        cache_key = search_cache_key(endpoint, method, payload)
+        if self.search_cache is not None:
+            # The cache is backed by the database, keep its I/O off the event loop
+            content = await asyncio.to_thread(self.search_cache.get, cache_key)
+            if content is not None:
+                CacheMetrics.track_usage(CacheUsage(hits=1))
+                return content
+            CacheMetrics.track_usage(CacheUsage(misses=1))
+
+        budget = get_query_unit_budget()
+        if budget is not None:
+            budget.check()
+        content, shared = await self.single_flight.do(
+            cache_key, self._search, endpoint, method, payload, cache_key, ttl_seconds
+        )
+        if shared:
+            logger.debug("Search coalesced with an identical in-flight request")
+
+        return content
+
+    async def _search(
+        self,
+        endpoint: str,
+        method: str,
+        payload: dict,
+        cache_key: str,
+        ttl_seconds: float | None = None,
+    ) -> str:
+        content = (await self._send(endpoint, method, payload, self.headers)).text
+        query_units = decode_query_units(content)
+        QueryUnitMetrics.track_usage(query_units)
+        budget = get_query_unit_budget()
+        if budget is not None:
+            budget.consume(query_units)
+
+        if self.search_cache is not None:
+            await asyncio.to_thread(
+                self.search_cache.set, cache_key, content, ttl_seconds=ttl_seconds
+            )
+
+        return content
+
+    async def _call_api(
+        self, endpoint: str, method: str, payload: dict, headers: dict
+    ) -> dict:
+        return (await self._send(endpoint, method, payload, headers)).json()
+
+    async def _send(
+        self, endpoint: str, method: str, payload: dict, headers: dict
+    ) -> httpx.Response:
+        self.retry_budget.on_request()
+        for attempt in range(settings.API_RETRIES):
+            self.circuit_breaker.before_call()
+            try:
+                # The slot is only held while the request runs, not while backing off
+                async with self.semaphore.acquire_async(1):
+                    result = await self.rate_limit_controller.call_async(
+                        self._hedged_request,
+                        method=method,
+                        url=endpoint,
+                        json=payload,
+                        headers=headers,
+                    )
+                result.raise_for_status()
+                self.rate_limit_controller.on_success()
+                self.circuit_breaker.on_success()
+                return result
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                last_exception = e
+                logger.warning(
+                    f"Error calling API {method} at endpoint {endpoint}: {e}. Attempt {attempt + 1}"
+                )
+                if isinstance(e, httpx.TimeoutException):
+                    self.concurrency_limiter.on_dropped()
+                if is_server_failure(e):
+                    self.circuit_breaker.on_failure()
+                else:
+                    self.circuit_breaker.on_success()
+
+                if attempt + 1 == settings.API_RETRIES:
+                    break
+                if not self.retry_budget.try_retry():
+                    logger.warning("Retry budget exhausted, not retrying")
+                    break
+                if is_rate_limited(e):
+                    # The rate limiter already delays the retry as much as the server asked for
+                    self.rate_limit_controller.on_rate_limited(
+                        parse_retry_after(e.response.headers.get("Retry-After"))
+                    )
+                else:
+                    await async_sleep_with_backoff(attempt=attempt)
+
+        raise too_many_retries_error(method, endpoint, last_exception)
+
+    async def _hedged_request(self, **kwargs) -> httpx.Response:
+        """Same as `APIQueryService._hedged_request`, the slower request is cancelled"""
+        if self.hedging is None:
+            return await self._timed_request(**kwargs)
+        hedge_after = self.hedging.on_request(kwargs["url"])
+        if hedge_after is None:
+            return await self._timed_request(**kwargs)
+
+        primary = asyncio.ensure_future(self._timed_request(**kwargs))
+        done, _ = await asyncio.wait([primary], timeout=hedge_after)
+        if done or not (
+            self.hedging.try_hedge() and self.rate_limit_controller.try_reserve()
+        ):
+            return await primary
+
+        logger.debug("Hedging slow request", url=kwargs["url"], after=hedge_after)
+        hedge = asyncio.ensure_future(self._timed_request(**kwargs))
+        return await first_successful_async([primary, hedge])
+
+    async def _timed_request(self, **kwargs) -> httpx.Response:
+        in_flight = self.semaphore.weight_in_use()
+        start = perf_counter()
+        response = await self._client.request(**kwargs)
+        latency = perf_counter() - start
+        self.concurrency_limiter.record_latency(latency, in_flight)
+        if self.hedging is not None:
+            self.hedging.record_latency(kwargs["url"], latency)
+        return response
+
+    async def _search_and_track(
+        self, query: dict, *, topic: str | None, entity_id: str
+    ) -> list[Result]:
+        results = await self.api_search(
+            endpoint="/v1/search",
+            method="POST",
+            payload=query,
+        )
+
+        if topic:
+            ContentMetrics.track_usage(
+                TopicContentTracker(
+                    topic=topic,
+                    retrieval=TopicContentTracker.retrieval_from_sdk_result(
+                        sdk_results=results,
+                        entity_id=entity_id,
+                    ),
+                    entity_id=entity_id,
+                )
+            )
+
+        return results
+
+    @log_performance
+    async def check_if_entity_has_results(
+        self,
+        entity_id: str,
+        report_dates: ReportDates,
+        similarity_text: str | None = None,
+        *,
+        source_filter: list[str] | None = None,
+        categories: list[str] | None = None,
+        sentiment_threshold: float | None = None,
+        chunk_limit: int | None = 1,
+        rerank_threshold: float | None = None,
+    ) -> list[Result]:
+        """
+        Make a simple query to find if the entity has results.
+        Based on this, the next steps will happen or not.
+        """
+        query = build_query(
+            entity_id=entity_id,
+            report_dates=report_dates,
+            similarity_text=similarity_text,
+            source_filter=source_filter,
+            categories=categories,
+            sentiment_threshold=sentiment_threshold,
+            chunk_limit=chunk_limit,
+            rerank_threshold=rerank_threshold,
+            source_rank_boost=None,
+            freshness_boost=None,
+        )
+        return await self._search_and_track(
+            query, topic="Check if entity has results", entity_id=entity_id
+        )
+
+    @log_performance
+    async def check_if_entities_have_results(
+        self,
+        entity_ids: list[str],
+        report_dates: ReportDates,
+        *,
+        source_filter: list[str] | None = None,
+        categories: list[str] | None = None,
+    ) -> dict[str, list[Result]]:
+        """Same as `APIQueryService.check_if_entities_have_results`"""
+        results_per_entity = {}
+        for batch_results in await asyncio.gather(
+            *(
+                self._check_if_batch_has_results(
+                    batch,
+                    report_dates,
+                    source_filter=source_filter,
+                    categories=categories,
+                )
+                for batch in batched(entity_ids, settings.API_PRESCREEN_BATCH_SIZE)
+            )
+        ):
+            results_per_entity.update(batch_results)
+        return results_per_entity
+
+    async def _check_if_batch_has_results(
+        self,
+        entity_ids: list[str],
+        report_dates: ReportDates,
+        *,
+        source_filter: list[str] | None,
+        categories: list[str] | None,
+    ) -> dict[str, list[Result]]:
+        chunk_limit = len(entity_ids) * settings.API_PRESCREEN_CHUNKS_PER_ENTITY
+        query = build_query(
+            entity_id=entity_ids,
+            report_dates=report_dates,
+            similarity_text=None,
+            source_filter=source_filter,
+            categories=categories,
+            sentiment_threshold=None,
+            chunk_limit=chunk_limit,
+            rerank_threshold=None,
+            source_rank_boost=None,
+            freshness_boost=None,
+        )
+        results = await self.api_search_raw(
+            endpoint="/v1/search",
+            method="POST",
+            payload=query,
+        )
+
+        results_per_entity, unresolved = resolve_prescreen_batch(
+            results, entity_ids, chunk_limit
+        )
+        for entity_id, entity_results in zip(
+            unresolved,
+            await asyncio.gather(
+                *(
+                    self.check_if_entity_has_results(
+                        entity_id=entity_id,
+                        report_dates=report_dates,
+                        source_filter=source_filter,
+                        categories=categories,
+                    )
+                    for entity_id in unresolved
+                )
+            ),
+        ):
+            results_per_entity[entity_id] = entity_results
+
+        return {
+            entity_id: results_per_entity.get(entity_id, []) for entity_id in entity_ids
+        }
+
+    @log_performance
+    async def _run_single_exploratory_search(
+        self,
+        entity_id: str,
+        report_dates: ReportDates,
+        similarity_text: str | None = None,
+        topic: str | None = None,
+        source_filter: list[str] | None = None,
+        categories: list[str] | None = None,
+        sentiment_threshold: float | None = settings.EXPLORATORY_SENTIMENT_THRESHOLD,
+        chunk_limit: int | None = settings.API_CHUNKS_LIMIT_EXPLORATORY,
+        rerank_threshold: float | None = settings.API_RERANK_EXPLORATORY,
+        source_rank_boost: int | None = settings.API_SOURCE_RANK_BOOST,
+        freshness_boost: int | None = settings.API_FRESHNESS_BOOST,
+    ) -> list[Result]:
+        query = build_query(
+            entity_id=entity_id,
+            report_dates=report_dates,
+            similarity_text=similarity_text,
+            source_filter=source_filter,
+            categories=categories,
+            sentiment_threshold=sentiment_threshold,
+            chunk_limit=chunk_limit,
+            rerank_threshold=rerank_threshold,
+            source_rank_boost=source_rank_boost,
+            freshness_boost=freshness_boost,
+        )
+        return await self._search_and_track(query, topic=topic, entity_id=entity_id)
+
+    @log_performance
+    @log_args
+    @log_return_value
+    async def run_exploratory_search(
+        self,
+        entity: Entity,
+        topics: list[str],
+        report_dates: ReportDates,
+        source_filter: list[str] | None = None,
+        categories: list[str] | None = None,
+        sentiment_threshold: float | None = settings.EXPLORATORY_SENTIMENT_THRESHOLD,
+        chunk_limit: int | None = settings.API_CHUNKS_LIMIT_EXPLORATORY,
+        use_topics: bool = True,
+        rerank_threshold: float | None = settings.API_RERANK_EXPLORATORY,
+        source_rank_boost: int | None = settings.API_SOURCE_RANK_BOOST,
+        freshness_boost: int | None = settings.API_FRESHNESS_BOOST,
+        seed_results: list[Result] | None = None,
+    ) -> list[Result]:
+        # Results already retrieved for the entity, e.g. by the pre-screen, are kept with the
+        # ones of the query with just the entity
+        seed_results = seed_results or []
+        if not use_topics:
+            results = await self._run_single_exploratory_search(
+                entity_id=entity.id,
+                report_dates=report_dates,
+                enable_metric=True,
+                metric_name=f"Exploratory search. Entity {entity.id}",
+            )
+            return merge_results(seed_results, results)
+
+        # TODO use jinja2
+        entity_topics = [t.format(entity=entity.name) for t in topics]
+        searches = [
+            self._run_single_exploratory_search(
+                entity_id=entity.id,
+                similarity_text=similarity_text,
+                topic=topic,
+                report_dates=report_dates,
+                source_filter=source_filter,
+                categories=categories,
+                sentiment_threshold=sentiment_threshold,
+                chunk_limit=chunk_limit,
+                rerank_threshold=rerank_threshold,
+                source_rank_boost=source_rank_boost,
+                freshness_boost=freshness_boost,
+                enable_metric=True,
+                metric_name=f"Exploratory search. Entity {entity.id}",
+            )
+            for similarity_text, topic in zip(entity_topics, topics)
+        ]
+        # In addition to searching by topics, query with just the entity
+        searches.append(
+            self._run_single_exploratory_search(
+                entity_id=entity.id,
+                report_dates=report_dates,
+                enable_metric=True,
+                metric_name=f"Exploratory search. Entity {entity.id}",
+            )
+        )
+        return merge_results(seed_results, *await asyncio.gather(*searches))
+
+    async def _run_follow_up_single_question(
+        self,
+        entity_id: str,
+        question: str | None,
+        report_dates: ReportDates,
+        *,
+        source_filter: list[str] | None = None,
+        categories: list[str] | None = None,
+        sentiment_threshold: float | None = settings.FOLLOWUP_SENTIMENT_THRESHOLD,
+        chunk_limit: int | None = settings.API_CHUNK_LIMIT_FOLLOWUP,
+        rerank_threshold: float | None = settings.API_RERANK_FOLLOWUP,
+        source_rank_boost: int | None = settings.API_SOURCE_RANK_BOOST,
+        freshness_boost: int | None = settings.API_FRESHNESS_BOOST,
+    ) -> list[Result]:
+        query = build_query(
+            entity_id=entity_id,
+            report_dates=report_dates,
+            similarity_text=question,
+            source_filter=source_filter,
+            categories=categories,
+            sentiment_threshold=sentiment_threshold,
+            chunk_limit=chunk_limit,
+            rerank_threshold=rerank_threshold,
+            source_rank_boost=source_rank_boost,
+            freshness_boost=freshness_boost,
+        )
+        return await self._search_and_track(
+            query, topic="Follow up questions", entity_id=entity_id
+        )
+
+    @log_performance
+    async def run_query_with_follow_up_questions(
+        self,
+        entity: Entity,
+        follow_up_questions: list[str],
+        report_dates: ReportDates,
+        source_filter: list[str] | None,
+        categories: list[str] | None,
+        source_rank_boost: int | None = settings.API_SOURCE_RANK_BOOST,
+        freshness_boost: int | None = settings.API_FRESHNESS_BOOST,
+    ) -> QAPairs:
+        answers = await asyncio.gather(
+            *(
+                self._run_follow_up_single_question(
+                    entity_id=entity.id,
+                    question=question,
+                    report_dates=report_dates,
+                    source_filter=source_filter,
+                    categories=categories,
+                    source_rank_boost=source_rank_boost,
+                    freshness_boost=freshness_boost,
+                )
+                for question in follow_up_questions
+            ),
+            return_exceptions=True,
+        )
+        qa_pairs = []
+        for question, answer in zip(follow_up_questions, answers):
+            if isinstance(answer, ValidationError):
+                logger.warning(
+                    f"Error running follow up questions for entity {entity}: {answer}"
+                )
+                continue
+            if isinstance(answer, BaseException):
+                raise answer
+            qa_pairs.append(QuestionAnswer(question=question, answer=answer))
+
+        return QAPairs(pairs=qa_pairs)
+
+
+def batched(iterable, n):
+    for i in range(0, len(iterable), n):
+        yield iterable[i : i + n]
+
+
+def decode_search_response(content: str | bytes) -> list[Result]:
+    """Validate a search response straight from its JSON text, in a single pass"""
+    return SearchResponse.model_validate_json(content).results
+
+
+def decode_query_units(content: str | bytes) -> float:
+    return SearchUsageResponse.model_validate_json(content).usage.api_query_units
+
+
+def demultiplex_search_response(
+    results: dict, entity_ids: list[str]
+) -> tuple[dict[str, list[Result]], bool]:
+    """Split the documents of a search on several entities by the entities detected in each chunk
+
+    Returns the results per entity, keeping only the chunks that mention it, and whether every
+    chunk could be assigned to one of the entities.
+    """
+    entity_ids = set(entity_ids)
+    results_per_entity = defaultdict(list)
+    conclusive = True
+    for document in results["results"]:
+        chunks_per_entity = defaultdict(list)
+        for chunk in document["chunks"]:
+            detected = {
+                detection["id"] for detection in chunk.get("detections", [])
+            } & entity_ids
+            if not detected:
+                conclusive = False
+            for entity_id in detected:
+                chunks_per_entity[entity_id].append(chunk)
+
+        for entity_id, chunks in chunks_per_entity.items():
+            results_per_entity[entity_id].append(
+                Result.from_api({**document, "chunks": chunks})
+            )
+
+    return dict(results_per_entity), conclusive
+
+
+def resolve_prescreen_batch(
+    results: dict, entity_ids: list[str], chunk_limit: int
+) -> tuple[dict[str, list[Result]], list[str]]:
+    """Assign the response of a bulk pre-screen search to its entities
+
+    Returns the results of the entities found in the response, and the entities that must be
+    checked individually because the response can't rule them out.
+    """
+    results_per_entity, conclusive = demultiplex_search_response(results, entity_ids)
+    n_chunks = sum(len(document["chunks"]) for document in results["results"])
+    if conclusive and n_chunks < chunk_limit:
+        # Every matching chunk was returned, entities without chunks have no results
+        unresolved = []
+    else:
+        unresolved = [e for e in entity_ids if e not in results_per_entity]
+
+    logger.debug(
+        "Pre-screened entities in bulk",
+        n_entities=len(entity_ids),
+        n_with_results=len(results_per_entity),
+        n_checked_individually=len(unresolved),
+    )
+    # Without entity detections in the response a batch costs more than checking its
+    # entities one by one, track it so it is visible in the brief metrics
+    PrescreenMetrics.track_usage(
+        PrescreenUsage(
+            batches=1,
+            inconclusive_batches=int(not conclusive),
+            entities_checked_individually=len(unresolved),
+        )
+    )
+    for entity_id, entity_results in results_per_entity.items():
+        ContentMetrics.track_usage(
+            TopicContentTracker(
+                topic="Check if entity has results",
+                retrieval=TopicContentTracker.retrieval_from_sdk_result(
+                    sdk_results=entity_results,
+                    entity_id=entity_id,
+                ),
+            )
+        )
+    return results_per_entity, unresolved
+
+
+def merge_results(*result_lists: list[Result]) -> list[Result]:
+    """Merge search results into one result per document
+
+    Different searches often return different chunks of the same document. The chunks of every
+    document are joined, without duplicates, and capped to the `MAX_CHUNKS_PER_DOCUMENT` most
+    relevant ones. Documents keep the order and metadata of their first occurrence.
+    """
+    documents: dict[str, Result] = {}
+    document_chunks: dict[str, dict[Chunk, None]] = {}
+    for result in itertools.chain(*result_lists):
+        if result.document_id not in documents:
+            documents[result.document_id] = result
+            document_chunks[result.document_id] = dict.fromkeys(result.chunks)
+        else:
+            document_chunks[result.document_id].update(dict.fromkeys(result.chunks))
+
+    merged = []
+    for document_id, result in documents.items():
+        chunks = list(document_chunks[document_id])
+        if len(chunks) == len(result.chunks):
+            merged.append(result)
+            continue
+        if len(chunks) > MAX_CHUNKS_PER_DOCUMENT:
+            chunks = heapq.nlargest(
+                MAX_CHUNKS_PER_DOCUMENT, chunks, key=lambda c: c.relevance
+            )
+        merged.append(
+            result.model_copy(
+                update={"chunks": tuple(sorted(chunks, key=lambda c: c.chunk))}
+            )
+        )
+    return merged
+
+
+def search_cache_key(endpoint: str, method: str, payload: dict) -> str:
+    """Content-addressed key of a search, the same query always maps to the same key"""
+    return canonical_hash({"endpoint": endpoint, "method": method, "payload": payload})
+
+
+def build_rate_limit_controller() -> AdaptiveRequestsPerMinuteController:
+    return AdaptiveRequestsPerMinuteController(
+        max_requests_per_min=settings.API_REQUESTS_PER_MINUTE,
+        min_requests_per_min=settings.API_MIN_REQUESTS_PER_MINUTE,
+        ceiling_requests_per_min=settings.API_MAX_REQUESTS_PER_MINUTE,
+        rate_limit_refresh_frequency=REFRESH_FREQUENCY_RATE_LIMIT,
+        seconds_before_retry=TIME_BEFORE_RETRY_RATE_LIMITER,
+        decrease_factor=settings.API_RATE_LIMIT_DECREASE_FACTOR,
+        increase_per_min=settings.API_RATE_LIMIT_INCREASE_PER_MINUTE,
+    )
+
+
+def is_rate_limited(exception: Exception) -> bool:
+    return (
+        isinstance(exception, httpx.HTTPStatusError)
+        and exception.response.status_code == httpx.codes.TOO_MANY_REQUESTS
+    )
+
+
+def is_server_failure(exception: Exception) -> bool:
+    """Whether the error means the API is failing, as opposed to rejecting the request"""
+    if isinstance(exception, httpx.HTTPStatusError):
+        return exception.response.is_server_error
+    return isinstance(exception, httpx.TransportError)
+
+
+def too_many_retries_error(
+    method: str, endpoint: str, last_exception: Exception
+) -> TooManyAPIRetriesError:
+    msg = f"Too many API retries for {method} at endpoint {endpoint}. Last error {last_exception}."
+    if isinstance(last_exception, httpx.HTTPStatusError):
+        msg = msg + f" Response body {last_exception.response.text}"
+    return TooManyAPIRetriesError(msg)
+
+
 @log_args
 def build_query(
-    entity_id: str,
+    entity_id: str | list[str],
     similarity_text: str | None,
     report_dates: ReportDates,
     *,
@@ -416,10 +1451,11 @@ def build_query(
         query["text"] = similarity_text
 
     # Check if entity_id is presumably a known entity or a topic
-    if len(entity_id) == 6:
-        query["filters"]["entity"] = {"any_of": [entity_id]}
-    else:
-        raise ValueError(f"Invalid entity ID format: {entity_id}")
+    entity_ids = [entity_id] if isinstance(entity_id, str) else list(entity_id)
+    for query_entity_id in entity_ids:
+        if len(query_entity_id) != 6:
+            raise ValueError(f"Invalid entity ID format: {query_entity_id}")
+    query["filters"]["entity"] = {"any_of": entity_ids}
 
     # If a sentiment threshold is provided, filter for strong positive/negative
     # We want to avoid specifically chunks with sentiment 0 as those are often not relevant
@@ -1,13 +1,12 @@
 from abc import ABC, abstractmethod
 from concurrent.futures.thread import ThreadPoolExecutor
 
-from bigdata_client.models.watchlists import Watchlist
-
 from bigdata_briefs.models import (
     Entity,
     QAPairs,
     ReportDates,
     Result,
+    Watchlist,
 )
 from bigdata_briefs.utils import (
     log_args,
@@ -42,6 +41,18 @@ class BaseQueryService(ABC):
         rerank_threshold: float = 0.0,
     ) -> list[Result]: ...
 
+    @abstractmethod
+    @log_performance
+    def check_if_entities_have_results(
+        self,
+        entity_ids: list[str],
+        report_dates: ReportDates,
+        executor: ThreadPoolExecutor,
+        *,
+        source_filter: list[str] | None = None,
+        categories: list[str] | None = None,
+    ) -> dict[str, list[Result]]: ...
+
     @abstractmethod
     @log_performance
     def _run_single_exploratory_search(
@@ -80,6 +91,7 @@ class BaseQueryService(ABC):
         rerank_threshold: float | None = None,
         source_rank_boost: int | None,
         freshness_boost: int | None,
+        seed_results: list[Result] | None = None,
     ) -> list[Result]: ...
 
     @abstractmethod
@@ -110,3 +122,72 @@ class BaseQueryService(ABC):
         source_rank_boost: int | None,
         freshness_boost: int | None,
     ) -> QAPairs: ...
+
+
+class AsyncBaseQueryService(ABC):
+    """Asyncio counterpart of `BaseQueryService`, every operation is a coroutine and
+    the fan-out of searches happens on the event loop instead of a thread pool."""
+
+    @abstractmethod
+    async def cleanup(self):
+        pass
+
+    @abstractmethod
+    async def get_watchlist(self, watchlist_id: str) -> Watchlist: ...
+
+    @abstractmethod
+    async def get_entities(self, entity_ids: list[str]) -> list[Entity]: ...
+
+    @abstractmethod
+    async def check_if_entity_has_results(
+        self,
+        entity_id: str,
+        report_dates: ReportDates,
+        similarity_text: str | None = None,
+        *,
+        source_filter: list[str] | None = None,
+        categories: list[str] | None = None,
+        sentiment_threshold: float | None = None,
+        chunk_limit: int | None = None,
+        rerank_threshold: float = 0.0,
+    ) -> list[Result]: ...
+
+    @abstractmethod
+    async def check_if_entities_have_results(
+        self,
+        entity_ids: list[str],
+        report_dates: ReportDates,
+        *,
+        source_filter: list[str] | None = None,
+        categories: list[str] | None = None,
+    ) -> dict[str, list[Result]]: ...
+
+    @abstractmethod
+    async def run_exploratory_search(
+        self,
+        entity: Entity,
+        topics: list[str],
+        report_dates: ReportDates,
+        *,
+        source_filter: list[str] | None = None,
+        categories: list[str] | None = None,
+        sentiment_threshold: float | None = None,
+        chunk_limit: int | None = None,
+        use_topics: bool = True,
+        rerank_threshold: float | None = None,
+        source_rank_boost: int | None,
+        freshness_boost: int | None,
+        seed_results: list[Result] | None = None,
+    ) -> list[Result]: ...
+
+    @abstractmethod
+    async def run_query_with_follow_up_questions(
+        self,
+        entity: Entity,
+        follow_up_questions: list[str],
+        report_dates: ReportDates,
+        source_filter: list[str] | None,
+        categories: list[str] | None,
+        source_rank_boost: int | None,
+        freshness_boost: int | None,
+    ) -> QAPairs: ...
@@ -0,0 +1,123 @@
+from enum import StrEnum
+from functools import cache
+from threading import Lock
+from time import perf_counter
+
+from bigdata_briefs import logger
+from bigdata_briefs.exceptions import CircuitOpenError
+from bigdata_briefs.settings import settings
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, *, failure_threshold: int, reset_timeout: float):
+        """Stop calling the API while it is failing
+
+        The circuit opens after `failure_threshold` consecutive failures, and every request fails
+        fast with `CircuitOpenError` instead of adding load to a degraded API. After
+        `reset_timeout` seconds the circuit is half-open: a single probe request is let through,
+        closing the circuit if it succeeds and opening it again if it fails. A probe that never
+        reports back is replaced by a new one after another `reset_timeout`.
+        """
+        self.lock = Lock()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: float | None = None
+
+    @property
+    def state(self) -> CircuitState:
+        with self.lock:
+            return self._state
+
+    def before_call(self):
+        """Raise `CircuitOpenError` if the request is not allowed"""
+        with self.lock:
+            if self._state == CircuitState.CLOSED:
+                return
+            now = perf_counter()
+            if self._state == CircuitState.OPEN:
+                if now - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("The API circuit breaker is open")
+                logger.info("API circuit breaker half-open, probing the API")
+                self._state = CircuitState.HALF_OPEN
+            elif (
+                self._probe_started_at is not None
+                and now - self._probe_started_at < self.reset_timeout
+            ):
+                raise CircuitOpenError("The API circuit breaker is probing the API")
+            self._probe_started_at = now
+
+    def on_success(self):
+        with self.lock:
+            if self._state != CircuitState.CLOSED:
+                logger.info("API circuit breaker closed")
+            self._state = CircuitState.CLOSED
+            self._failures = 0
+            self._probe_started_at = None
+
+    def on_failure(self):
+        with self.lock:
+            self._failures += 1
+            if (
+                self._state == CircuitState.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                if self._state != CircuitState.OPEN:
+                    logger.warning(
+                        "API circuit breaker open", consecutive_failures=self._failures
+                    )
+                self._state = CircuitState.OPEN
+                self._opened_at = perf_counter()
+                self._probe_started_at = None
+
+
+class RetryBudget:
+    def __init__(self, *, ratio: float, max_tokens: float):
+        """Retries allowed across all requests
+
+        Every request earns `ratio` tokens and every retry spends one, so retries stay within
+        that fraction of the traffic. The bucket starts full with `max_tokens` so occasional
+        errors are always retried, but a general outage can't multiply the load on the API.
+        """
+        self.lock = Lock()
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    def on_request(self):
+        with self.lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_retry(self) -> bool:
+        with self.lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+@cache
+def get_circuit_breaker() -> CircuitBreaker:
+    """Circuit breaker shared by every query service of the process"""
+    return CircuitBreaker(
+        failure_threshold=settings.API_CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=settings.API_CIRCUIT_BREAKER_RESET_SECONDS,
+    )
+
+
+@cache
+def get_retry_budget() -> RetryBudget:
+    """Retry budget shared by every query service of the process"""
+    return RetryBudget(
+        ratio=settings.API_RETRY_BUDGET_RATIO,
+        max_tokens=settings.API_RETRY_BUDGET_MAX_TOKENS,
+    )
@@ -0,0 +1,101 @@
+import asyncio
+from collections import defaultdict, deque
+from concurrent.futures import Future, as_completed
+from threading import Lock
+
+import httpx
+import numpy as np
+
+from bigdata_briefs.settings import settings
+
+LATENCY_WINDOW_SIZE = 200  # Number of recent latency samples kept per endpoint
+MAX_HEDGE_BURST = 5.0  # Hedges that can be saved up while requests are fast
+
+
+class HedgingPolicy:
+    def __init__(
+        self,
+        *,
+        percentile: float,
+        max_hedge_ratio: float,
+        min_samples: int,
+        window_size: int = LATENCY_WINDOW_SIZE,
+    ):
+        """Decide when to send a duplicate (hedge) of a slow request
+
+        A request becomes a candidate for a hedge once it has been running for longer than the
+        `percentile` latency of its endpoint, computed over its last `window_size` requests. No
+        hedges are sent until `min_samples` requests of the endpoint were observed.
+
+        Every request earns `max_hedge_ratio` hedges, so hedges never exceed that fraction of the
+        traffic, apart from a small burst saved up while requests are fast.
+        """
+        self.lock = Lock()
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self._latencies: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=window_size)
+        )
+        self._hedge_tokens = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "HedgingPolicy | None":
+        if not settings.API_HEDGING_ENABLED:
+            return None
+        return cls(
+            percentile=settings.API_HEDGING_PERCENTILE,
+            max_hedge_ratio=settings.API_HEDGING_MAX_RATIO,
+            min_samples=settings.API_HEDGING_MIN_SAMPLES,
+        )
+
+    def record_latency(self, endpoint: str, latency: float):
+        with self.lock:
+            self._latencies[endpoint].append(latency)
+
+    def on_request(self, endpoint: str) -> float | None:
+        """Account for a new request and return the time after which it should be hedged,
+        or None if the endpoint has not been observed enough yet"""
+        with self.lock:
+            self._hedge_tokens = min(
+                MAX_HEDGE_BURST, self._hedge_tokens + self.max_hedge_ratio
+            )
+            latencies = self._latencies[endpoint]
+            if len(latencies) < self.min_samples:
+                return None
+            return float(np.percentile(latencies, self.percentile))
+
+    def try_hedge(self) -> bool:
+        """Take one of the hedges allowed, returns False if the cap has been reached"""
+        with self.lock:
+            if self._hedge_tokens < 1:
+                return False
+            self._hedge_tokens -= 1
+            return True
+
+
+def first_successful(futures: list[Future]):
+    """Result of the first future that completes without a request error, or the last error.
+    Any other exception is a bug and is raised right away."""
+    error = None
+    for future in as_completed(futures):
+        try:
+            return future.result()
+        except httpx.HTTPError as e:
+            error = e
+    raise error
+
+
+async def first_successful_async(tasks: list[asyncio.Task]):
+    """Same as `first_successful` for tasks, the tasks still running are cancelled"""
+    error = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                return await next_done
+            except httpx.HTTPError as e:
+                error = e
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,5 +1,9 @@
 from typing import List, Literal, NotRequired, TypedDict
 
+from pydantic import BaseModel
+
+from bigdata_briefs.models import Result
+
 
 class TimestampFilter(TypedDict):
     start: str
@@ -49,3 +53,17 @@ class SearchAPIQueryDict(TypedDict, total=False):
     ranking_params: RankingParams
     max_chunks: int
     text: NotRequired[str]
+
+
+class SearchUsage(BaseModel):
+    api_query_units: float
+
+
+class SearchUsageResponse(BaseModel):
+    """Only the usage of a search response, the results are parsed but not validated"""
+
+    usage: SearchUsage
+
+
+class SearchResponse(SearchUsageResponse):
+    results: list[Result]
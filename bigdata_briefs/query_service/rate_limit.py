@@ -1,13 +1,19 @@
+import asyncio
 import warnings
-from collections import deque
+from collections.abc import Callable
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
 from math import floor
 from threading import Lock
 from time import perf_counter, sleep
 
 from bigdata_briefs import logger
 from bigdata_briefs.exceptions import TooManyAPIRetriesError
+from bigdata_briefs.metrics import RateLimitMetrics
+from bigdata_briefs.models import RateLimitUsage
 
-# Define a high max retries to avoid infinite loops in rate limiter
+# Define a high max retries to avoid waiting forever in rate limiter, the maximum time a request
+# can wait for a permit is MAX_RETRIES_RATE_LIMITER * seconds_before_retry
 MAX_RETRIES_RATE_LIMITER = 10000
 LOG_WARNING_EVERY_N_RETRIES = 100
 RAISE_WARNING_EVERY_N_RETRIES = 1000
@@ -20,6 +26,7 @@ class RequestsPerMinuteController:
         max_requests_per_min: int,
         rate_limit_refresh_frequency: float,
         seconds_before_retry: float,
+        clock: Callable[[], float] = perf_counter,
     ):
         """This class will control the rate limit of requests per minute
 
@@ -27,48 +34,217 @@ class RequestsPerMinuteController:
         frontloading the requests and to allow for a more even distribution of requests over the
         full minute.
 
+        It is implemented as a token bucket holding the requests allowed per refresh period and
+        refilled continuously. Every request reserves a token, possibly one that will only be
+        refilled in the future, and sleeps exactly until that moment. As each reservation comes
+        after the previous one, waiting requests are released in FIFO order without polling.
+
         :param max_requests_per_min: The maximum number of requests per minute allowed.
         :param rate_limit_refresh_frequency: The frequency at which the rate limit will refresh, lower
             values will allow for requests to be executed with a better spread over the minute.
-        :param seconds_before_retry: The time in seconds before retrying the request.
+        :param seconds_before_retry: Used to bound the time a single request can wait for a
+            permit, which is `MAX_RETRIES_RATE_LIMITER * seconds_before_retry`.
+        :param clock: Monotonic time in seconds, replaced by a virtual clock in simulations.
         """
         self.lock = Lock()
+        self.clock = clock
         self.rate_limit_refresh_frequency = rate_limit_refresh_frequency
-        self.max_requests_per_refresh = floor(
-            max_requests_per_min / floor(60 / self.rate_limit_refresh_frequency)
-        )
         self.time_before_retry = seconds_before_retry
-        self.deque = deque(maxlen=self.max_requests_per_refresh)
+        self.max_wait = MAX_RETRIES_RATE_LIMITER * self.time_before_retry
+        self._set_rate(max_requests_per_min)
+
+        self._tokens = float(self.max_requests_per_refresh)
+        self._last_refill = self.clock()
+
+    @property
+    def refill_rate(self) -> float:
+        """Tokens added to the bucket per second"""
+        return self.max_requests_per_min / 60
+
+    def _set_rate(self, max_requests_per_min: float):
+        self.max_requests_per_min = max_requests_per_min
+        # Allow at least one request per refresh, otherwise the bucket could never fill up
+        self.max_requests_per_refresh = max(
+            1,
+            floor(max_requests_per_min / floor(60 / self.rate_limit_refresh_frequency)),
+        )
 
     def __call__(self, func, *args, **kwargs):
         """This will attempt to execute any function while taking into account the rate limit"""
-        # Effectively a while(True), but safer
-        for idx in range(MAX_RETRIES_RATE_LIMITER):
-            if self._allowed_by_rate_limit():
-                return func(*args, **kwargs)
-            if idx > 0 and idx % LOG_WARNING_EVERY_N_RETRIES == 0:
-                logger.warning("Handling requests throttle.", retries_attempted=idx)
-            if idx > 0 and idx % RAISE_WARNING_EVERY_N_RETRIES == 0:
-                warnings.warn(
-                    f"Handling requests throttle. Retries attempted: {idx}",
-                    RuntimeWarning,
-                    stacklevel=3,
-                )
-            sleep(self.time_before_retry)
+        wait = self.reserve()
+        if wait > 0:
+            sleep(wait)
+        return func(*args, **kwargs)
+
+    async def call_async(self, func, *args, **kwargs):
+        """Same as calling the controller, but awaits `func` and waits without blocking the event loop"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return await func(*args, **kwargs)
+
+    def try_reserve(self) -> bool:
+        """Take a token only if one is available right now, without waiting"""
+        with self.lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def reserve(self, weight: float = 1) -> float:
+        """Reserve `weight` tokens and return the time in seconds until they are available, the
+        caller must wait that long before sending the request. The weight of a request may be
+        larger than the bucket, it then waits for the tokens missing."""
+        with self.lock:
+            self._refill()
+            wait = max(0.0, (weight - self._tokens) / self.refill_rate)
+            if wait > self.max_wait:
+                self._raise_too_many_retries(wait)
+            self._tokens -= weight
+
+        self._warn_if_throttled(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        """Drain the bucket so the next reservation waits at least `seconds`"""
+        with self.lock:
+            self._refill()
+            self._drain(seconds)
+
+    def _drain(self, seconds: float):
+        self._tokens = min(self._tokens, 1 - seconds * self.refill_rate)
 
+    def _refill(self):
+        """Add the tokens accumulated since the last refill, must be called holding the lock"""
+        now = self.clock()
+        self._tokens = min(
+            float(self.max_requests_per_refresh),
+            self._tokens + (now - self._last_refill) * self.refill_rate,
+        )
+        self._last_refill = now
+
+    def _warn_if_throttled(self, wait: float):
+        # Keep the thresholds of the previous polling implementation, expressed in seconds
+        if self.time_before_retry <= 0:
+            return
+        if wait >= LOG_WARNING_EVERY_N_RETRIES * self.time_before_retry:
+            logger.warning(
+                "Handling requests throttle.", seconds_to_wait=round(wait, 2)
+            )
+        if wait >= RAISE_WARNING_EVERY_N_RETRIES * self.time_before_retry:
+            warnings.warn(
+                f"Handling requests throttle. Seconds to wait: {wait:.2f}",
+                RuntimeWarning,
+                stacklevel=4,
+            )
+
+    def _raise_too_many_retries(self, wait: float):
         raise TooManyAPIRetriesError(
-            f"Exceeded max retries on rate limiter. {MAX_RETRIES_RATE_LIMITER} retries exceeded over a period of {MAX_RETRIES_RATE_LIMITER * self.time_before_retry} seconds for a single request"
+            f"Exceeded max retries on rate limiter. Waiting {wait:.2f} seconds for a single request exceeds the maximum of {MAX_RETRIES_RATE_LIMITER} retries over a period of {self.max_wait} seconds"
         )
 
-    def _allowed_by_rate_limit(self) -> bool:
-        # If the deque is not full or the oldest request is older than the refresh frequency
-        # allow a new request through
+
+class AdaptiveRequestsPerMinuteController(RequestsPerMinuteController):
+    def __init__(
+        self,
+        *,
+        max_requests_per_min: int,
+        min_requests_per_min: int,
+        ceiling_requests_per_min: int,
+        rate_limit_refresh_frequency: float,
+        seconds_before_retry: float,
+        decrease_factor: float = 0.5,
+        increase_per_min: float = 10,
+        clock: Callable[[], float] = perf_counter,
+    ):
+        """Rate limiter that adapts its rate to the responses of the server (AIMD)
+
+        Every rate limited response (HTTP 429) decreases the rate multiplicatively and pauses
+        new requests for the time requested by the `Retry-After` header, if any. Every
+        successful response increases the rate additively, so the rate probes back up by
+        about `increase_per_min` requests per minute for every minute of successful traffic.
+
+        :param max_requests_per_min: The initial number of requests per minute allowed.
+        :param min_requests_per_min: The rate will never decrease below this value.
+        :param ceiling_requests_per_min: The rate will never increase above this value, usually
+            the documented limit of the server.
+        :param decrease_factor: The rate is multiplied by this factor on every rate limited response.
+        :param increase_per_min: Requests per minute added to the rate per minute of successful traffic.
+        """
+        super().__init__(
+            max_requests_per_min=max_requests_per_min,
+            rate_limit_refresh_frequency=rate_limit_refresh_frequency,
+            seconds_before_retry=seconds_before_retry,
+            clock=clock,
+        )
+        self.min_requests_per_min = min_requests_per_min
+        self.ceiling_requests_per_min = ceiling_requests_per_min
+        self.decrease_factor = decrease_factor
+        self.increase_per_min = increase_per_min
+        self._last_decrease = float("-inf")
+
+    def on_success(self):
         with self.lock:
-            if (
-                len(self.deque) < self.max_requests_per_refresh
-                or perf_counter() - self.deque[0] > self.rate_limit_refresh_frequency
-            ):
-                self.deque.append(perf_counter())
-                return True
-
-            return False
+            previous_rate = self.max_requests_per_min
+            self._refill()
+            self._set_rate(
+                min(
+                    self.ceiling_requests_per_min,
+                    previous_rate + self.increase_per_min / previous_rate,
+                )
+            )
+            new_rate = self.max_requests_per_min
+
+        if floor(new_rate) != floor(previous_rate):
+            RateLimitMetrics.track_usage(RateLimitUsage(requests_per_minute=new_rate))
+
+    def on_rate_limited(self, retry_after: float | None = None):
+        with self.lock:
+            self._refill()
+            now = self.clock()
+            # Responses to requests sent before the last decrease don't reflect the new rate yet,
+            # decrease at most once per refresh period to avoid collapsing the rate on a burst of 429s
+            if now - self._last_decrease > self.rate_limit_refresh_frequency:
+                self._last_decrease = now
+                self._set_rate(
+                    max(
+                        self.min_requests_per_min,
+                        self.max_requests_per_min * self.decrease_factor,
+                    )
+                )
+                self._tokens = min(self._tokens, float(self.max_requests_per_refresh))
+            if retry_after:
+                # Drain the bucket so the next reservation waits at least `retry_after`
+                self._drain(retry_after)
+            new_rate = self.max_requests_per_min
+
+        logger.warning(
+            "Rate limited by the server, slowing down.",
+            requests_per_minute=round(new_rate, 2),
+            retry_after=retry_after,
+        )
+        RateLimitMetrics.track_usage(
+            RateLimitUsage(requests_per_minute=new_rate, rate_limited_responses=1)
+        )
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse the value of a `Retry-After` header, either in seconds or as an HTTP date
+
+    >>> parse_retry_after("3")
+    3.0
+    >>> parse_retry_after(None) is None
+    True
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(UTC)).total_seconds())
@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import Future
+from threading import Lock
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing the same key into a single execution.
+
+    The first caller for a key executes the function, any caller arriving with the same key
+    while that execution is in flight waits for it and receives the same result (or exception).
+    Once the call finishes the key is forgotten, so this is not a cache.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._in_flight: dict[str, Future] = {}
+
+    def do(self, key: str, func, *args, **kwargs) -> tuple[object, bool]:
+        """Execute `func` unless there is already an execution for `key` in flight.
+
+        :returns: The result and whether it was shared with an execution started by other caller.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_leader:
+            return future.result(), True
+
+        try:
+            result = func(*args, **kwargs)
+            future.set_result(result)
+            return result, False
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+class AsyncSingleFlight:
+    """Asyncio counterpart of `SingleFlight`, callers must share the same event loop."""
+
+    def __init__(self):
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, func, *args, **kwargs) -> tuple[object, bool]:
+        task = self._in_flight.get(key)
+        is_leader = task is None
+        if is_leader:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # Shield the shared task so a cancelled caller does not cancel the others
+        return await asyncio.shield(task), not is_leader
@@ -0,0 +1,125 @@
+import copy
+from datetime import UTC, datetime, time, timedelta
+from typing import NamedTuple
+
+from bigdata_briefs.models import Result, ResultBatch
+from bigdata_briefs.settings import settings
+
+
+class TimeSlice(NamedTuple):
+    start: datetime
+    end: datetime
+    closed: bool
+
+
+class SliceSearch(NamedTuple):
+    payload: dict
+    # TTL of the cached response, None for the default TTL of the search cache
+    ttl_seconds: float | None
+
+
+class TimeSlicing:
+    def __init__(
+        self,
+        *,
+        closed_ttl_seconds: float,
+        settle_seconds: float,
+        max_days: int,
+    ):
+        """Split the searches of a date range into one search per day
+
+        Rolling briefs search mostly the same days every time, e.g. a daily brief over the last
+        7 days. The days that are over (closed) don't get new content, so their searches are
+        cached for `closed_ttl_seconds`, longer than the default TTL of the search cache, and
+        only the open day is searched live. A day is closed `settle_seconds` after its end, to
+        let the documents published late in the day be indexed. Ranges longer than `max_days`
+        are searched whole.
+        """
+        self.closed_ttl_seconds = closed_ttl_seconds
+        self.settle_seconds = settle_seconds
+        self.max_days = max_days
+
+    @classmethod
+    def from_settings(cls) -> "TimeSlicing | None":
+        if not settings.SEARCH_TIME_SLICING_ENABLED:
+            return None
+        return cls(
+            closed_ttl_seconds=settings.SEARCH_CLOSED_SLICE_TTL_SECONDS,
+            settle_seconds=settings.SEARCH_SLICE_SETTLE_SECONDS,
+            max_days=settings.SEARCH_TIME_SLICING_MAX_DAYS,
+        )
+
+    def split(self, payload: dict, now: datetime | None = None) -> list[SliceSearch]:
+        """The searches of every slice of the date range of a search payload, made by
+        `build_query`. Empty if the search is not worth splitting."""
+        timestamp = payload.get("query", {}).get("filters", {}).get("timestamp")
+        if timestamp is None:
+            return []
+        start = datetime.fromisoformat(timestamp["start"])
+        end = datetime.fromisoformat(timestamp["end"])
+        if now is None:
+            now = datetime.now(start.tzinfo or UTC)
+            if start.tzinfo is None:
+                # Naive dates are UTC for the API
+                now = now.replace(tzinfo=None)
+
+        slices = day_slices(start, end, now - timedelta(seconds=self.settle_seconds))
+        if len(slices) < 2 or len(slices) > self.max_days + 1:
+            return []
+        return [
+            SliceSearch(
+                payload=slice_payload(payload, time_slice),
+                ttl_seconds=self.closed_ttl_seconds if time_slice.closed else None,
+            )
+            for time_slice in slices
+        ]
+
+
+def day_slices(
+    start: datetime, end: datetime, closed_before: datetime
+) -> list[TimeSlice]:
+    """Split [start, end] at every midnight, in the timezone of the dates
+
+    The slices ending before `closed_before` are closed. The first and last slices are shorter
+    than a day when the range does not start or end at midnight.
+    """
+    slices = []
+    slice_start = start
+    while slice_start < end:
+        next_midnight = datetime.combine(
+            slice_start.date() + timedelta(days=1), time(), tzinfo=slice_start.tzinfo
+        )
+        slice_end = min(next_midnight, end)
+        slices.append(
+            TimeSlice(
+                start=slice_start,
+                end=slice_end,
+                closed=slice_end <= closed_before,
+            )
+        )
+        slice_start = slice_end
+    return slices
+
+
+def slice_payload(payload: dict, time_slice: TimeSlice) -> dict:
+    sliced = copy.deepcopy(payload)
+    sliced["query"]["filters"]["timestamp"] = {
+        "start": time_slice.start.isoformat(),
+        "end": time_slice.end.isoformat(),
+    }
+    return sliced
+
+
+def merge_slices(
+    result_lists: list[list[Result]], max_chunks: int | None
+) -> list[Result]:
+    """Merge the results of the slices of a search as if the whole range was searched
+
+    Slices only share the documents published at the midnight between them, their duplicated
+    chunks are dropped. Like the search on the whole range, at most `max_chunks` chunks are
+    returned, the most relevant ones.
+    """
+    batch = ResultBatch.from_results(
+        [result for results in result_lists for result in results]
+    ).dedup()
+    return batch.top_k(len(batch) if max_chunks is None else max_chunks).to_results()
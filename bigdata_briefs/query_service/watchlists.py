@@ -0,0 +1,88 @@
+import time
+from functools import cache
+
+from bigdata_client import Bigdata
+from bigdata_client.exceptions import BigdataClientError
+from requests import RequestException
+
+from bigdata_briefs import logger
+from bigdata_briefs.cache import Cache
+from bigdata_briefs.models import Watchlist
+from bigdata_briefs.settings import settings
+
+
+@cache
+def get_sdk_client() -> Bigdata:
+    """SDK client shared by the whole process, it's only created when first needed"""
+    return Bigdata(api_key=settings.BIGDATA_API_KEY)
+
+
+class WatchlistProvider:
+    def __init__(
+        self,
+        watchlist_cache: Cache | None = None,
+        *,
+        revalidate_after_seconds: float = settings.WATCHLIST_REVALIDATE_AFTER_SECONDS,
+    ):
+        """Retrieve watchlists with the SDK, keeping them in a cache.
+
+        Watchlists cached less than `revalidate_after_seconds` ago are used as they are. Older
+        ones are revalidated against the `last_updated` date returned when listing the
+        watchlists, which is a single request without items, and only fetched again if they
+        changed. The cache TTL bounds how long a watchlist can be used without revalidation.
+        """
+        self.watchlist_cache = watchlist_cache
+        self.revalidate_after_seconds = revalidate_after_seconds
+
+    @property
+    def sdk_client(self) -> Bigdata:
+        return get_sdk_client()
+
+    def get(self, watchlist_id: str) -> Watchlist:
+        if self.watchlist_cache is None:
+            return self._fetch(watchlist_id)
+
+        cached = self.watchlist_cache.get(watchlist_id)
+        if cached is not None:
+            watchlist = Watchlist.model_validate(cached["watchlist"])
+            if time.time() - cached["validated_at"] < self.revalidate_after_seconds:
+                return watchlist
+            if self._is_unchanged(watchlist):
+                logger.debug("Cached watchlist revalidated", watchlist_id=watchlist_id)
+                self._store(watchlist)
+                return watchlist
+
+        watchlist = self._fetch(watchlist_id)
+        self._store(watchlist)
+        return watchlist
+
+    def _fetch(self, watchlist_id: str) -> Watchlist:
+        sdk_watchlist = self.sdk_client.watchlists.get(watchlist_id)
+        return Watchlist(
+            id=sdk_watchlist.id,
+            name=sdk_watchlist.name,
+            last_updated=sdk_watchlist.last_updated,
+            items=sdk_watchlist.items,
+        )
+
+    def _is_unchanged(self, watchlist: Watchlist) -> bool:
+        if watchlist.last_updated is None:
+            return False
+        try:
+            current = {w.id: w for w in self.sdk_client.watchlists.list()}
+        except (BigdataClientError, RequestException) as e:
+            logger.warning(f"Failed to revalidate watchlist {watchlist.id}: {e}")
+            return False
+        return (
+            watchlist.id in current
+            and current[watchlist.id].last_updated == watchlist.last_updated
+        )
+
+    def _store(self, watchlist: Watchlist):
+        self.watchlist_cache.set(
+            watchlist.id,
+            {
+                "watchlist": watchlist.model_dump(mode="json"),
+                "validated_at": time.time(),
+            },
+        )
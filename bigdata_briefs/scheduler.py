@@ -0,0 +1,210 @@
+import asyncio
+import heapq
+import itertools
+from collections.abc import Callable
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from enum import StrEnum
+
+from bigdata_briefs.weighted_semaphore import WeightedSemaphore
+
+DEFAULT_FLOW_ID = "default"
+
+
+class Priority(StrEnum):
+    INTERACTIVE = "interactive"
+    BATCH = "batch"
+
+
+# Lower values are served first
+PRIORITY_ORDER = {Priority.INTERACTIVE: 0, Priority.BATCH: 1}
+
+
+@dataclass(frozen=True)
+class SchedulingContext:
+    flow_id: str = DEFAULT_FLOW_ID
+    priority: Priority = Priority.INTERACTIVE
+    share: float = 1.0
+
+
+_scheduling_context: ContextVar[SchedulingContext | None] = ContextVar(
+    "scheduling_context", default=None
+)
+
+
+def set_scheduling_context(
+    flow_id: str, priority: Priority, share: float = 1.0
+) -> Token:
+    """Identify the work scheduled from the current context, usually a brief.
+
+    Threads started from this context only inherit it if they are submitted with
+    `bigdata_briefs.utils.submit_with_context`.
+    """
+    return _scheduling_context.set(SchedulingContext(flow_id, priority, share))
+
+
+def reset_scheduling_context(token: Token):
+    _scheduling_context.reset(token)
+
+
+def get_scheduling_context() -> SchedulingContext:
+    return _scheduling_context.get() or SchedulingContext()
+
+
+@dataclass(order=True)
+class _Ticket:
+    priority: int
+    finish_tag: float
+    seq: int
+    start_tag: float = field(compare=False)
+    weight: int = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+    # Called holding the condition when the weight is granted, to wake up async waiters
+    on_granted: Callable[[], None] | None = field(default=None, compare=False)
+
+
+class FairShareScheduler(WeightedSemaphore):
+    def __init__(self, weight_available: int):
+        """Weighted semaphore that grants the weight by priority class and fair share
+
+        Waiters of a higher priority class are always served first. Within a class, waiters are
+        served with start-time fair queueing: every flow (brief) gets a share of the capacity
+        proportional to its `share`, regardless of how much work it has queued, so a small brief
+        is not starved by a big one. The flow and priority are read from the scheduling context.
+        """
+        super().__init__(weight_available)
+        self._queue: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._finish_tags: dict[str, float] = {}
+        self._pending: dict[str, int] = {}
+
+    @contextmanager
+    def __call__(self, weight: int):
+        context = get_scheduling_context()
+        with self._condition:
+            ticket = self._enqueue(context, weight)
+            self._dispatch()
+            while not ticket.granted:
+                self._condition.wait()
+        try:
+            yield
+        finally:
+            self._release(context, ticket)
+
+    @asynccontextmanager
+    async def acquire_async(self, weight: int):
+        """Same as calling the scheduler, but waits without blocking the event loop, so
+        coroutines and threads share the same capacity and fair share"""
+        context = get_scheduling_context()
+        loop = asyncio.get_running_loop()
+        granted = asyncio.Event()
+        with self._condition:
+            ticket = self._enqueue(
+                context,
+                weight,
+                on_granted=lambda: loop.call_soon_threadsafe(granted.set),
+            )
+            self._dispatch()
+        try:
+            await granted.wait()
+        except asyncio.CancelledError:
+            self._cancel(context, ticket)
+            raise
+        try:
+            yield
+        finally:
+            self._release(context, ticket)
+
+    def _release(self, context: SchedulingContext, ticket: _Ticket):
+        with self._condition:
+            self._weight_available += ticket.weight
+            self._forget_if_idle(context.flow_id)
+            self._dispatch()
+
+    def _cancel(self, context: SchedulingContext, ticket: _Ticket):
+        """Give up a ticket whose waiter was cancelled, it may have been granted meanwhile"""
+        with self._condition:
+            if ticket.granted:
+                self._weight_available += ticket.weight
+            else:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+            self._forget_if_idle(context.flow_id)
+            self._dispatch()
+
+    def _forget_if_idle(self, flow_id: str):
+        """Account the end of a ticket of the flow, must hold the condition"""
+        self._pending[flow_id] -= 1
+        if (
+            not self._pending[flow_id]
+            and self._finish_tags[flow_id] <= self._virtual_time
+        ):
+            # The flow is idle and has not used more than its share, forget it
+            del self._pending[flow_id]
+            del self._finish_tags[flow_id]
+
+    def try_acquire(self, weight: int) -> int | None:
+        # Acquiring outside of the queue would overtake the waiters and skip the accounting
+        # of the flow, and `release` would not know which ticket to give back
+        raise NotImplementedError(
+            "FairShareScheduler is only acquired by calling it or with `acquire_async`"
+        )
+
+    def release(self, acquired: int):
+        raise NotImplementedError(
+            "FairShareScheduler is only acquired by calling it or with `acquire_async`"
+        )
+
+    def resize(self, capacity: int):
+        with self._condition:
+            self._weight_available += capacity - self._capacity
+            self._capacity = capacity
+            self._dispatch()
+
+    def queued(self) -> int:
+        with self._condition:
+            return len(self._queue)
+
+    def _enqueue(
+        self,
+        context: SchedulingContext,
+        weight: int,
+        on_granted: Callable[[], None] | None = None,
+    ) -> _Ticket:
+        start_tag = max(self._virtual_time, self._finish_tags.get(context.flow_id, 0.0))
+        finish_tag = start_tag + weight / context.share
+        self._finish_tags[context.flow_id] = finish_tag
+        self._pending[context.flow_id] = self._pending.get(context.flow_id, 0) + 1
+
+        ticket = _Ticket(
+            priority=PRIORITY_ORDER[context.priority],
+            finish_tag=finish_tag,
+            seq=next(self._seq),
+            start_tag=start_tag,
+            weight=weight,
+            on_granted=on_granted,
+        )
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _dispatch(self):
+        """Grant the weight to the waiters at the head of the queue, must hold the condition"""
+        granted = False
+        while self._queue:
+            ticket = self._queue[0]
+            weight = min(ticket.weight, self._capacity)
+            if self._weight_available < weight:
+                # Do not let smaller waiters overtake the head, it would never be served
+                break
+            heapq.heappop(self._queue)
+            ticket.weight = weight
+            self._weight_available -= weight
+            self._virtual_time = max(self._virtual_time, ticket.start_tag)
+            ticket.granted = True
+            granted = True
+            if ticket.on_granted is not None:
+                ticket.on_granted()
+        if granted:
+            self._condition.notify_all()
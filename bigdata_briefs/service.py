@@ -1,11 +1,17 @@
+from collections import Counter
 from concurrent.futures import as_completed
 from concurrent.futures.thread import ThreadPoolExecutor
+from contextvars import Token
 from datetime import datetime
+from functools import partial
 from hashlib import sha256
 from importlib.metadata import version
 from threading import Lock
 from uuid import UUID
 
+import httpx
+from sqlalchemy.exc import SQLAlchemyError
+
 from bigdata_briefs import logger
 from bigdata_briefs.api.models import BriefCreationRequest, WorkflowStatus
 from bigdata_briefs.api.storage import StorageManager
@@ -15,9 +21,29 @@ from bigdata_briefs.attribution.sources import (
     process_topic_collection,
     replace_references_in_topic_collection,
 )
+from bigdata_briefs.budget import (
+    DegradationLevel,
+    QueryUnitBudget,
+    get_degradation_level,
+    get_query_unit_budget,
+    reset_query_unit_budget,
+    set_query_unit_budget,
+)
+from bigdata_briefs.cache import Cache
+from bigdata_briefs.concurrency_limiter import AdaptiveConcurrencyLimiter
 from bigdata_briefs.exceptions import (
+    CircuitOpenError,
     EmtpyWatchlistError,
     FailedBriefGenerationError,
+    QueryUnitBudgetExceededError,
+    TooManyAPIRetriesError,
+)
+from bigdata_briefs.llm_batch import (
+    LLMBatchClient,
+    LLMBatchCollector,
+    get_llm_batch_collector,
+    reset_llm_batch_collector,
+    set_llm_batch_collector,
 )
 from bigdata_briefs.llm_client import (
     LLMClient,
@@ -28,7 +54,10 @@ from bigdata_briefs.metrics import (
     ContentMetrics,
     EmbeddingsMetrics,
     LLMMetrics,
+    PrescreenMetrics,
+    PromptBudgetMetrics,
     QueryUnitMetrics,
+    RateLimitMetrics,
 )
 from bigdata_briefs.models import (
     BriefReport,
@@ -38,6 +67,7 @@ from bigdata_briefs.models import (
     IntroSection,
     NoInfoReportGenerationStep,
     QAPairs,
+    QuestionAnswer,
     ReportDates,
     ReportTitle,
     Result,
@@ -53,6 +83,7 @@ from bigdata_briefs.novelty.embedding_client import EmbeddingClient
 from bigdata_briefs.novelty.novelty_service import NoveltyFilteringService
 from bigdata_briefs.novelty.storage import EmbeddingStorage
 from bigdata_briefs.prompts.prompt_loader import get_prompt_keys
+from bigdata_briefs.prompts.token_budget import PromptTokenBudget
 from bigdata_briefs.prompts.user_prompts import (
     get_followup_questions_user_prompt,
     get_report_title_user_prompt,
@@ -60,11 +91,25 @@ from bigdata_briefs.prompts.user_prompts import (
     get_single_bullet_user_prompt,
 )
 from bigdata_briefs.query_service.base import BaseQueryService
+from bigdata_briefs.scheduler import (
+    FairShareScheduler,
+    reset_scheduling_context,
+    set_scheduling_context,
+)
 from bigdata_briefs.settings import settings
 from bigdata_briefs.storage import write_report_with_sources
+from bigdata_briefs.topic_yield import (
+    TopicPruner,
+    TopicYieldStorage,
+    topic_yields_from_trackers,
+)
 from bigdata_briefs.tracing.service import TraceEventName, TracingService
-from bigdata_briefs.utils import log_performance, log_time, raise_warning_from
-from bigdata_briefs.weighted_semaphore import WeightedSemaphore
+from bigdata_briefs.utils import (
+    log_performance,
+    log_time,
+    raise_warning_from,
+    submit_with_context,
+)
 
 MIN_TOPICS_FOR_INTRO = 1
 # We just want a number big enough to handle all connections, the limit is applied by SDK
@@ -79,12 +124,24 @@ class BriefPipelineService:
         query_service: BaseQueryService,
         tracing_service: TracingService,
         novelty_filter_service: NoveltyFilteringService,
+        concurrency_limiter: AdaptiveConcurrencyLimiter | None = None,
+        topic_yield_storage: TopicYieldStorage | None = None,
+        llm_batch_client: LLMBatchClient | None = None,
     ):
         self.novelty_filter_service = novelty_filter_service
-        self.weighted_semaphore = WeightedSemaphore(settings.API_SIMULTANEOUS_REQUESTS)
+        # Share the limiter with the query service so the searches admitted by the pipeline
+        # follow the same adaptive limit as the requests sent to the API
+        self.weighted_semaphore = (
+            concurrency_limiter.new_gate()
+            if concurrency_limiter is not None
+            else FairShareScheduler(settings.API_SIMULTANEOUS_REQUESTS)
+        )
         self.llm_client = llm_client
         self.query_service = query_service
         self.tracing_service = tracing_service
+        self.topic_yield_storage = topic_yield_storage
+        self.topic_pruner = TopicPruner.from_settings(topic_yield_storage)
+        self.llm_batch_client = llm_batch_client
         self.lock = Lock()
         self.no_info_reports = []
 
@@ -104,6 +161,9 @@ class BriefPipelineService:
             user_template=prompt_keys.user_template,
             topics=topics,
             response_format=f"{FollowUpAnalysis.model_json_schema()}",
+            token_budget=PromptTokenBudget.for_prompt(
+                "follow_up_questions", prompt_keys
+            ),
         )
         # user_prompt += f"\n\nYour response should be a JSON object that matches the following schema:\n\n{FollowUpAnalysis.model_json_schema()}"
         messages = [
@@ -111,7 +171,7 @@ class BriefPipelineService:
             {"role": "assistant", "content": "```json\n{"},
         ]
 
-        follow_up_questions = self.llm_client.call_with_response_format(
+        follow_up_questions = self.batchable_llm_client().call_with_response_format(
             system=[{"role": "assistant", "content": prompt_keys.system_prompt}],
             messages=messages,
             text_format=FollowUpAnalysis,
@@ -139,13 +199,14 @@ class BriefPipelineService:
             response_format=f"{TopicCollection.model_json_schema()}",
             report_sources=report_sources,
             topics=topics,
+            token_budget=PromptTokenBudget.for_prompt("entity_update", prompt_keys),
         )
         messages = [
             {"role": "user", "content": user_prompt},
             {"role": "assistant", "content": "```json\n{"},
         ]
 
-        collection = self.llm_client.call_with_response_format(
+        collection = self.batchable_llm_client().call_with_response_format(
             system=[{"role": "assistant", "content": prompt_keys.system_prompt}],
             messages=messages,
             text_format=TopicCollection,
@@ -169,6 +230,58 @@ class BriefPipelineService:
             report_sources,
         )
 
+    def batchable_llm_client(self) -> LLMClient | LLMBatchCollector:
+        """Client of the LLM calls made for every entity, the batch collector of the brief when
+        it runs in batch mode"""
+        return get_llm_batch_collector() or self.llm_client
+
+    def run_follow_up_questions(
+        self,
+        entity: Entity,
+        follow_up_questions: list[str],
+        exploratory_search_results: list[Result],
+        source_filter: list[str] | None,
+        categories: list[str] | None,
+        report_dates: ReportDates,
+        source_rank_boost: int | None,
+        freshness_boost: int | None,
+        executor: ThreadPoolExecutor,
+    ) -> QAPairs:
+        """Answer the follow-up questions with a search each, asking fewer questions, or none
+        at all, when the query unit budget of the brief runs low"""
+        budget = get_query_unit_budget()
+        level = get_degradation_level()
+        if level >= DegradationLevel.PRE_SCREEN_ONLY:
+            budget.record_shed(follow_up_questions=len(follow_up_questions))
+            return answer_with_results(entity, exploratory_search_results)
+        if level >= DegradationLevel.FEWER_FOLLOW_UP_QUESTIONS:
+            kept = follow_up_questions[
+                : settings.QUERY_UNIT_BUDGET_DEGRADED_FOLLOW_UP_QUESTIONS
+            ]
+            budget.record_shed(follow_up_questions=len(follow_up_questions) - len(kept))
+            follow_up_questions = kept
+
+        try:
+            with self.weighted_semaphore(len(follow_up_questions)):
+                return self.query_service.run_query_with_follow_up_questions(
+                    entity=entity,
+                    follow_up_questions=follow_up_questions,
+                    report_dates=report_dates,
+                    executor=executor,
+                    enable_metric=True,
+                    metric_name="Run follow up questions",
+                    source_filter=source_filter,
+                    categories=categories,
+                    source_rank_boost=source_rank_boost,
+                    freshness_boost=freshness_boost,
+                )
+        except QueryUnitBudgetExceededError:
+            logger.debug(
+                f"Query unit budget exhausted, skipping follow-ups for {entity}"
+            )
+            budget.record_shed(follow_up_questions=len(follow_up_questions))
+            return answer_with_results(entity, exploratory_search_results)
+
     def create_no_info_report(self, entity: Entity, message: str, generation_step: str):
         with self.lock:
             self.no_info_reports.append((entity, generation_step))
@@ -195,16 +308,25 @@ class BriefPipelineService:
         source_rank_boost: int | None,
         freshness_boost: int | None,
         executor: ThreadPoolExecutor,
+        initial_results: list[Result] | None = None,
     ) -> tuple[SingleEntityReport, RetrievedSources]:
         logger.debug(f"Starting report on {entity}")
 
-        # Quick initial search to check if there are any results
-        initial_results = self.query_service.check_if_entity_has_results(
-            entity_id=entity.id,
-            report_dates=report_dates,
-            source_filter=source_filter,
-            categories=categories,
-        )
+        if initial_results is None:
+            # Quick initial search to check if there are any results
+            try:
+                initial_results = self.query_service.check_if_entity_has_results(
+                    entity_id=entity.id,
+                    report_dates=report_dates,
+                    source_filter=source_filter,
+                    categories=categories,
+                )
+            except QueryUnitBudgetExceededError:
+                return self.create_no_info_report(
+                    entity,
+                    message=f"No information retrieved on {entity.name}, the query unit budget of the brief is exhausted.",
+                    generation_step=NoInfoReportGenerationStep.BEFORE_EXPLORATORY_SEARCH,
+                )
 
         if not initial_results:
             logger.debug(f"No results found in initial search for {entity}")
@@ -214,60 +336,94 @@ class BriefPipelineService:
                 generation_step=NoInfoReportGenerationStep.BEFORE_EXPLORATORY_SEARCH,
             )
 
-        # If we found results, proceed with full exploratory search
-        with self.weighted_semaphore(len(topics) + 1):
-            exploratory_search_results = self.query_service.run_exploratory_search(
-                entity=entity,
-                topics=topics,
-                report_dates=report_dates,
-                executor=executor,
-                enable_metric=True,
-                metric_name="Exploratory search. All entities",
-                source_filter=source_filter,
-                categories=categories,
-                source_rank_boost=source_rank_boost,
-                freshness_boost=freshness_boost,
+        budget = get_query_unit_budget()
+        if get_degradation_level() >= DegradationLevel.PRE_SCREEN_ONLY:
+            logger.debug(
+                f"Query unit budget almost exhausted, pre-screen only for {entity}"
             )
-        if not exploratory_search_results:
-            logger.debug(f"No new information found for {entity}")
-            return self.create_no_info_report(
-                entity,
-                message=f"No new information to report on {entity.name}. Sadge.",
-                generation_step=NoInfoReportGenerationStep.EXPLORATORY_SEARCH,
+            budget.record_shed(
+                topics=len(topics),
+                follow_up_questions=settings.LLM_FOLLOW_UP_QUESTIONS,
+                pre_screen_only_entities=1,
             )
+            qa_pairs = answer_with_results(entity, initial_results)
+        else:
+            search_topics = topics
+            if get_degradation_level() >= DegradationLevel.FEWER_TOPICS:
+                search_topics = topics[: settings.QUERY_UNIT_BUDGET_DEGRADED_TOPICS]
+                budget.record_shed(topics=len(topics) - len(search_topics))
 
-        follow_up_questions = self.generate_follow_up_questions(
-            entity,
-            topics,
-            report_dates,
-            exploratory_search_results,
-            enable_metric=True,
-            metric_name="Generate follow up questions",
-        )
-        if not follow_up_questions:
-            logger.debug(f"No follow-up questions generated for {entity}")
-            return self.create_no_info_report(
-                entity,
-                message=f"No new information to report on {entity.name}. Sadge.",
-                generation_step=NoInfoReportGenerationStep.FOLLOW_UP_QUESTIONS,
-            )
+            # If we found results, proceed with full exploratory search
+            try:
+                with self.weighted_semaphore(len(search_topics) + 1):
+                    exploratory_search_results = (
+                        self.query_service.run_exploratory_search(
+                            entity=entity,
+                            topics=search_topics,
+                            report_dates=report_dates,
+                            executor=executor,
+                            enable_metric=True,
+                            metric_name="Exploratory search. All entities",
+                            source_filter=source_filter,
+                            categories=categories,
+                            source_rank_boost=source_rank_boost,
+                            freshness_boost=freshness_boost,
+                            seed_results=initial_results,
+                        )
+                    )
+            except QueryUnitBudgetExceededError:
+                logger.debug(
+                    f"Query unit budget exhausted, pre-screen only for {entity}"
+                )
+                budget.record_shed(
+                    follow_up_questions=settings.LLM_FOLLOW_UP_QUESTIONS,
+                    pre_screen_only_entities=1,
+                )
+                exploratory_search_results = None
+                qa_pairs = answer_with_results(entity, initial_results)
+
+            if exploratory_search_results is not None:
+                if not exploratory_search_results:
+                    logger.debug(f"No new information found for {entity}")
+                    return self.create_no_info_report(
+                        entity,
+                        message=f"No new information to report on {entity.name}. Sadge.",
+                        generation_step=NoInfoReportGenerationStep.EXPLORATORY_SEARCH,
+                    )
 
-        if len(follow_up_questions) != settings.LLM_FOLLOW_UP_QUESTIONS:
-            logger.debug(f"Number of followup questions: {len(follow_up_questions)}")
+                follow_up_questions = self.generate_follow_up_questions(
+                    entity,
+                    topics,
+                    report_dates,
+                    exploratory_search_results,
+                    enable_metric=True,
+                    metric_name="Generate follow up questions",
+                )
+                if not follow_up_questions:
+                    logger.debug(f"No follow-up questions generated for {entity}")
+                    return self.create_no_info_report(
+                        entity,
+                        message=f"No new information to report on {entity.name}. Sadge.",
+                        generation_step=NoInfoReportGenerationStep.FOLLOW_UP_QUESTIONS,
+                    )
+
+                if len(follow_up_questions) != settings.LLM_FOLLOW_UP_QUESTIONS:
+                    logger.debug(
+                        f"Number of followup questions: {len(follow_up_questions)}"
+                    )
+
+                qa_pairs = self.run_follow_up_questions(
+                    entity,
+                    follow_up_questions,
+                    exploratory_search_results,
+                    source_filter,
+                    categories,
+                    report_dates,
+                    source_rank_boost,
+                    freshness_boost,
+                    executor,
+                )
 
-        with self.weighted_semaphore(len(follow_up_questions)):
-            qa_pairs = self.query_service.run_query_with_follow_up_questions(
-                entity=entity,
-                follow_up_questions=follow_up_questions,
-                report_dates=report_dates,
-                executor=executor,
-                enable_metric=True,
-                metric_name="Run follow up questions",
-                source_filter=source_filter,
-                categories=categories,
-                source_rank_boost=source_rank_boost,
-                freshness_boost=freshness_boost,
-            )
         if not any(pair.answer for pair in qa_pairs.pairs):
             logger.debug(f"No qa-pairs generated for {entity}")
             return self.create_no_info_report(
@@ -406,7 +562,8 @@ class BriefPipelineService:
 
         # Generate bullet points in parallel
         futures_to_entity = {
-            executor.submit(
+            submit_with_context(
+                executor,
                 self.generate_intro_section_single_bullet_point,
                 entity_report,
                 report_dates,
@@ -496,18 +653,51 @@ class BriefPipelineService:
         storage_manager: StorageManager,
     ) -> tuple[WatchlistReport, RetrievedSources]:
         storage_manager.log_message(request_id, "Generating report per entity")
+        topics_per_entity = self.select_topics(
+            entities, topics, request_id, storage_manager
+        )
+        entity_pipeline = self.execute_entity_report_pipeline
+        collector = get_llm_batch_collector()
+        if collector is not None:
+            # Every entity pipeline takes part in the LLM batches until it's done
+            entity_pipeline = partial(collector.participate, entity_pipeline)
         with ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS) as executor:
+            initial_results_per_entity = {}
+            if settings.API_BULK_PRESCREEN_ENABLED:
+                try:
+                    initial_results_per_entity = (
+                        self.query_service.check_if_entities_have_results(
+                            entity_ids=[entity.id for entity in entities],
+                            report_dates=report_dates,
+                            executor=executor,
+                            source_filter=source_filter,
+                            categories=categories,
+                        )
+                    )
+                except (
+                    TooManyAPIRetriesError,
+                    CircuitOpenError,
+                    QueryUnitBudgetExceededError,
+                    httpx.HTTPError,
+                ) as e:
+                    # Not fatal, every entity pipeline checks its own entity instead
+                    logger.warning(
+                        f"Bulk pre-screen failed, checking entities individually: {e}"
+                    )
+
             futures_to_entity = {
-                executor.submit(
-                    self.execute_entity_report_pipeline,
+                submit_with_context(
+                    executor,
+                    entity_pipeline,
                     entity,
-                    topics,
+                    topics_per_entity[entity.id],
                     source_filter,
                     categories,
                     report_dates,
                     source_rank_boost,
                     freshness_boost,
                     executor,
+                    initial_results_per_entity.get(entity.id),
                 ): entity
                 for entity in entities
             }
@@ -588,20 +778,83 @@ class BriefPipelineService:
             source_metadata,
         )
 
+    def select_topics(
+        self,
+        entities: list[Entity],
+        topics: list[str],
+        request_id: UUID,
+        storage_manager: StorageManager,
+    ) -> dict[str, list[str]]:
+        """Topics to search for each entity, without the ones that historically return nothing
+        when topic pruning is enabled"""
+        topics_per_entity = {entity.id: topics for entity in entities}
+        if self.topic_pruner is None:
+            return topics_per_entity
+        try:
+            selections = self.topic_pruner.select_topics(entities, topics)
+        except SQLAlchemyError as e:
+            logger.warning(f"Topic pruning failed, searching every topic: {e}")
+            return topics_per_entity
+
+        skipped = Counter(
+            topic for selection in selections.values() for topic in selection.skipped
+        )
+        if skipped:
+            n_entities = sum(
+                1 for selection in selections.values() if selection.skipped
+            )
+            most_skipped = "; ".join(
+                f"{topic} ({count})" for topic, count in skipped.most_common(3)
+            )
+            storage_manager.log_message(
+                request_id,
+                f"Skipped {skipped.total()} low-yield topic searches for {n_entities} entities. Most skipped: {most_skipped}",
+            )
+            logger.info("Skipped low-yield topics", skipped_per_topic=dict(skipped))
+        return {
+            entity_id: selection.kept for entity_id, selection in selections.items()
+        }
+
+    def record_topic_yields(self, entities: list[Entity], topics: list[str]):
+        """Store how often every topic returned results for the entities of the brief"""
+        if self.topic_yield_storage is None:
+            return
+        try:
+            yields = topic_yields_from_trackers(
+                ContentMetrics.get_trackers(), entities, topics
+            )
+            for scope, scope_yields in yields.items():
+                self.topic_yield_storage.add(scope, scope_yields)
+        except SQLAlchemyError as e:
+            # Not fatal, the statistics are only used to prune topics
+            logger.warning(f"Failed to record topic yields: {e}")
+
     @classmethod
     def factory(
         cls,
         query_service: BaseQueryService,
         tracing_service: TracingService,
         embedding_storage: EmbeddingStorage,
+        concurrency_limiter: AdaptiveConcurrencyLimiter | None = None,
+        topic_yield_storage: TopicYieldStorage | None = None,
+        llm_cache: Cache | None = None,
+        llm_batch_client: LLMBatchClient | None = None,
     ):
         embedding_storage = embedding_storage
         embedding_client = EmbeddingClient(settings.NOVELTY_MODEL)
         novelty_filter_service = NoveltyFilteringService(
             embedding_client, embedding_storage
         )
-        llm_client = LLMClient()
-        return cls(llm_client, query_service, tracing_service, novelty_filter_service)
+        llm_client = LLMClient(cache=llm_cache)
+        return cls(
+            llm_client,
+            query_service,
+            tracing_service,
+            novelty_filter_service,
+            concurrency_limiter=concurrency_limiter,
+            topic_yield_storage=topic_yield_storage,
+            llm_batch_client=llm_batch_client,
+        )
 
     @log_time
     def generate_brief(
@@ -610,11 +863,21 @@ class BriefPipelineService:
         request_id: UUID,
         storage_manager: StorageManager,
     ) -> BriefReport:
+        # Searches of this brief are scheduled fairly against the ones of other briefs
+        scheduling_token = set_scheduling_context(str(request_id), record.priority)
+        # Searches of this brief are charged to its query unit budget
+        budget = QueryUnitBudget(record.query_unit_budget or settings.QUERY_UNIT_BUDGET)
+        budget_token = set_query_unit_budget(budget)
+        batch_token = None
         try:
             storage_manager.update_status(request_id, WorkflowStatus.IN_PROGRESS)
             workflow_execution_start = datetime.now()
             storage_manager.log_message(request_id, "Validating input parameters")
             record_data = self.parse_and_validate(record, request_id, storage_manager)
+            if record.llm_batch:
+                batch_token = self.start_llm_batches(
+                    record, len(record_data.entities), request_id, storage_manager
+                )
 
             (
                 watchlist_report,
@@ -635,12 +898,18 @@ class BriefPipelineService:
                 storage_manager=storage_manager,
             )
 
+            self.record_topic_yields(record_data.entities, record_data.topics)
+
             n_watchlist_items = len(record_data.entities)
             n_no_info_reports = len(self.no_info_reports)
             llm_metrics = LLMMetrics.get_total_usage()
             bp_metrics = BulletPointMetrics.get_total_usage()
             embedding_metrics = EmbeddingsMetrics.get_total_usage()
             content_metrics = ContentMetrics.get_total_usage()
+            cache_metrics = CacheMetrics.get_total_usage()
+            rate_limit_metrics = RateLimitMetrics.get_total_usage()
+            prompt_budget_metrics = PromptBudgetMetrics.get_total_usage()
+            prescreen_metrics = PrescreenMetrics.get_total_usage()
 
             document_aggregation = {
                 f"documents_for_topic_{k.replace(' ', '_')}": v.total_documents
@@ -665,6 +934,11 @@ class BriefPipelineService:
                 total_completion_tokens=llm_metrics.completion_tokens,
                 total_tokens=llm_metrics.total_tokens,
                 total_llm_calls=llm_metrics.n_calls,
+                total_llm_cached_calls=llm_metrics.cached_calls,
+                prompt_tokens_before_budget=prompt_budget_metrics.tokens_before,
+                prompt_tokens_after_budget=prompt_budget_metrics.tokens_after,
+                prompts_trimmed_to_budget=prompt_budget_metrics.trimmed_prompts,
+                prompt_chunks_dropped=prompt_budget_metrics.dropped_chunks,
                 total_embedding_tokens=embedding_metrics.tokens,
                 n_watchlist_items=n_watchlist_items,
                 n_entity_reports=n_watchlist_items - n_no_info_reports,
@@ -675,8 +949,15 @@ class BriefPipelineService:
                 total_bp_stored=bp_metrics.bullet_points_stored,
                 brief_date_range=record_data.report_dates.get_lookback_days(),
                 novelty_date_range=novelty_date_range,
-                retrieved_from_cache=CacheMetrics.get_total_usage(),
+                retrieved_from_cache=cache_metrics.hits,
+                cache_misses=cache_metrics.misses,
                 query_units_consumed=QueryUnitMetrics.get_total_usage(),
+                api_requests_per_minute=rate_limit_metrics.requests_per_minute,
+                api_rate_limited_responses=rate_limit_metrics.rate_limited_responses,
+                prescreen_batches=prescreen_metrics.batches,
+                prescreen_inconclusive_batches=prescreen_metrics.inconclusive_batches,
+                prescreen_entities_checked_individually=prescreen_metrics.entities_checked_individually,
+                **budget.usage().model_dump(),
                 **document_aggregation,
                 **chunk_aggregation,
             )
@@ -686,6 +967,7 @@ class BriefPipelineService:
                 source_metadata,
                 novelty=record_data.report_dates.novelty,
             )
+            pipeline_output.query_unit_budget = budget.usage()
 
             if pipeline_output.is_empty:
                 logger.debug(f"No new news for {record_data.watchlist.id}.")
@@ -718,6 +1000,37 @@ class BriefPipelineService:
             storage_manager.update_status(request_id, WorkflowStatus.FAILED)
             storage_manager.log_message(request_id, str(e))
             raise
+        finally:
+            if batch_token is not None:
+                reset_llm_batch_collector(batch_token)
+                self.llm_batch_client.storage.remove_brief(request_id)
+            reset_query_unit_budget(budget_token)
+            reset_scheduling_context(scheduling_token)
+
+    def start_llm_batches(
+        self,
+        record: BriefCreationRequest,
+        n_entities: int,
+        request_id: UUID,
+        storage_manager: StorageManager,
+    ) -> Token | None:
+        """Send the LLM calls of the entity pipelines of the brief in batches. The brief is
+        stored until it's done, to resume it if the service restarts while it waits on a batch"""
+        if self.llm_batch_client is None:
+            logger.warning("LLM batches are disabled, running the brief online")
+            storage_manager.log_message(
+                request_id, "LLM batches are disabled, running the brief online"
+            )
+            return None
+        self.llm_batch_client.storage.add_brief(
+            request_id, record.model_dump(mode="json")
+        )
+        storage_manager.log_message(
+            request_id, "Sending the LLM calls of the entities in batches"
+        )
+        return set_llm_batch_collector(
+            LLMBatchCollector(self.llm_batch_client, participants=n_entities)
+        )
 
     def parse_and_validate(
         self,
@@ -727,8 +1040,8 @@ class BriefPipelineService:
     ) -> ValidatedInput:
         logger.debug(record)
 
-        # Ensure all topics include the placeholder {entity}
-        topics = record.topics or settings.TOPICS
+        # Ensure all topics include the placeholder {entity}, identical topics are searched once
+        topics = list(dict.fromkeys(record.topics or settings.TOPICS))
 
         for topic in topics:
             if "{entity}" not in topic:
@@ -808,6 +1121,19 @@ class BriefPipelineService:
         )
 
 
+def answer_with_results(entity: Entity, results: list[Result]) -> QAPairs:
+    """Use results already retrieved as the single answer of the entity report, used when the
+    query unit budget does not allow more searches"""
+    return QAPairs(
+        pairs=[
+            QuestionAnswer(
+                question=f"What are the latest developments about {entity.name}?",
+                answer=results,
+            )
+        ]
+    )
+
+
 def calculate_relevance_score(score_values: list[int]) -> float:
     """
     Calculate a relevance score using strict-dominance geometric weighting algorithm.
@@ -21,7 +21,6 @@ DEFAULT_TOPICS = [
     "What cost-cutting measures or expense management initiatives has {entity} recently disclosed?",
     "What notable market share shifts has {entity} experienced recently?",
     "How is {entity} responding to new competitive threats or significant competitor actions?",
-    "What significant new product launches or pipeline developments has {entity} announced?",
     "What specific regulatory developments are materially affecting {entity}?",
     "How are current macroeconomic factors affecting {entity}'s performance and outlook?",
     "What material litigation developments involve {entity} currently?",
@@ -79,6 +78,10 @@ class Settings(BaseSettings):
 
     # Search configuration
     API_SIMULTANEOUS_REQUESTS: int = 40  # Reduced to prevent rate limit bursts
+    # The concurrency limit starts at API_SIMULTANEOUS_REQUESTS and adapts to the API latency
+    API_ADAPTIVE_CONCURRENCY_ENABLED: bool = True
+    API_MIN_SIMULTANEOUS_REQUESTS: int = 10
+    API_MAX_SIMULTANEOUS_REQUESTS: int = 100
     API_BASE_URL: str = "https://api.bigdata.com"
     API_CHUNKS_LIMIT_EXPLORATORY: int = 15
     API_RERANK_EXPLORATORY: float = 0.8
@@ -90,10 +93,108 @@ class Settings(BaseSettings):
     API_FRESHNESS_BOOST: int = 8
     API_RETRIES: int = 3
     API_TIMEOUT_SECONDS: int = 15
+    # Adaptive rate limiting, the rate starts at API_REQUESTS_PER_MINUTE and adapts to 429 responses
+    API_REQUESTS_PER_MINUTE: int = 460
+    API_MIN_REQUESTS_PER_MINUTE: int = 30
+    API_MAX_REQUESTS_PER_MINUTE: int = 500  # Backend rate limit
+    API_RATE_LIMIT_DECREASE_FACTOR: float = 0.5
+    API_RATE_LIMIT_INCREASE_PER_MINUTE: float = 20
+
+    # After API_CIRCUIT_BREAKER_FAILURE_THRESHOLD consecutive server errors or timeouts, requests
+    # fail fast for API_CIRCUIT_BREAKER_RESET_SECONDS before probing the API again
+    API_CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 20
+    API_CIRCUIT_BREAKER_RESET_SECONDS: float = 30
+    # Every request earns API_RETRY_BUDGET_RATIO retries, shared by the whole process
+    API_RETRY_BUDGET_RATIO: float = 0.2
+    API_RETRY_BUDGET_MAX_TOKENS: float = 20
+
+    # Hedge slow requests: once a request runs longer than the API_HEDGING_PERCENTILE latency of its
+    # endpoint, send a duplicate and keep the first response. Capped to API_HEDGING_MAX_RATIO of requests
+    API_HEDGING_ENABLED: bool = False
+    API_HEDGING_PERCENTILE: float = 95
+    API_HEDGING_MAX_RATIO: float = 0.05
+    API_HEDGING_MIN_SAMPLES: int = 20
+
+    # Pre-screen entities in bulk, searching several entities per query to skip the ones without results.
+    # It relies on the entity detections of every chunk, without them every entity is also checked alone
+    API_BULK_PRESCREEN_ENABLED: bool = False
+    API_PRESCREEN_BATCH_SIZE: int = 50
+    API_PRESCREEN_CHUNKS_PER_ENTITY: int = 2
+    # Search cache configuration
+    SEARCH_CACHE_ENABLED: bool = False
+    SEARCH_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    SEARCH_CACHE_MAX_SIZE_MB: int = 512
+    # Split the searches in one search per day, so the days that are over are cached for
+    # SEARCH_CLOSED_SLICE_TTL_SECONDS and only the current day is searched live. Needs the search
+    # cache. A day is over SEARCH_SLICE_SETTLE_SECONDS after midnight, to index late documents
+    SEARCH_TIME_SLICING_ENABLED: bool = False
+    SEARCH_CLOSED_SLICE_TTL_SECONDS: int = 7 * 24 * 60 * 60
+    SEARCH_SLICE_SETTLE_SECONDS: int = 60 * 60
+    SEARCH_TIME_SLICING_MAX_DAYS: int = 31
+    # Entity metadata almost never changes, it's cached by default
+    ENTITY_CACHE_ENABLED: bool = True
+    ENTITY_CACHE_TTL_SECONDS: int = 7 * 24 * 60 * 60
+    ENTITY_CACHE_MAX_SIZE_MB: int = 64
+    # Cached watchlists are used as they are for WATCHLIST_REVALIDATE_AFTER_SECONDS, then revalidated
+    WATCHLIST_CACHE_ENABLED: bool = True
+    WATCHLIST_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    WATCHLIST_CACHE_MAX_SIZE_MB: int = 16
+    WATCHLIST_REVALIDATE_AFTER_SECONDS: int = 5 * 60
+    # Responses of identical LLM calls, e.g. when a failed brief is run again or the intro of the
+    # same entity reports is generated again. Keyed on the model, prompt and parameters
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 60 * 60
+    LLM_CACHE_MAX_SIZE_MB: int = 256
+
+    # Record how often each topic returns results per entity and per sector after every brief
+    TOPIC_YIELD_STATS_ENABLED: bool = True
+    # Skip the topics whose hit rate is below TOPIC_PRUNING_MIN_HIT_RATE for the entity, or its sector
+    # when the entity has less than TOPIC_PRUNING_MIN_SEARCHES searches. A skipped topic is still
+    # searched TOPIC_PRUNING_EXPLORE_RATIO of the time, so its statistics stay up to date
+    TOPIC_PRUNING_ENABLED: bool = False
+    TOPIC_PRUNING_MIN_SEARCHES: int = 5
+    TOPIC_PRUNING_MIN_HIT_RATE: float = 0.05
+    TOPIC_PRUNING_EXPLORE_RATIO: float = 0.1
+
+    # Query units a brief can consume, None for no limit. It can be overridden per brief.
+    # The pipeline sheds work once the used fraction of the budget crosses these thresholds
+    QUERY_UNIT_BUDGET: float | None = None
+    QUERY_UNIT_BUDGET_FEWER_TOPICS_AT: float = 0.5
+    QUERY_UNIT_BUDGET_FEWER_FOLLOW_UP_QUESTIONS_AT: float = 0.7
+    QUERY_UNIT_BUDGET_PRE_SCREEN_ONLY_AT: float = 0.85
+    QUERY_UNIT_BUDGET_DEGRADED_TOPICS: int = 5
+    QUERY_UNIT_BUDGET_DEGRADED_FOLLOW_UP_QUESTIONS: int = 2
+
+    # Record the HTTP interactions of the search API, LLM and embeddings to a cassette file, or
+    # replay them without network. The watchlists are retrieved with the SDK and are not recorded
+    CASSETTE_PATH: str | None = None
+    CASSETTE_MODE: Literal["record", "replay"] = "replay"
+    CASSETTE_REPLAY_LATENCY: bool = False
 
     # LLM configuration
     LLM_FOLLOW_UP_QUESTIONS: int = 5
     LLM_RETRIES: int = 3
+    # Limits of the LLM provider, the LLM clients queue their calls to stay under them. The tokens
+    # of a call are estimated as the size of its prompt plus its max tokens. The limits per model
+    # override the default ones, e.g. LLM_MODEL_TOKENS_PER_MINUTE='{"gpt-4o-mini": 2000000}'
+    LLM_RATE_LIMIT_ENABLED: bool = True
+    LLM_REQUESTS_PER_MINUTE: int = 5000
+    LLM_TOKENS_PER_MINUTE: int = 800_000
+    LLM_MODEL_REQUESTS_PER_MINUTE: dict[str, int] = {}
+    LLM_MODEL_TOKENS_PER_MINUTE: dict[str, int] = {}
+    # Briefs created with `llm_batch` send the follow-up questions and entity update calls of all
+    # their entities through the batch API of the provider, cheaper and with separate limits, and
+    # check the batches every LLM_BATCH_POLL_INTERVAL_SECONDS. Briefs waiting on a batch are
+    # resumed when the service restarts
+    LLM_BATCH_ENABLED: bool = False
+    LLM_BATCH_POLL_INTERVAL_SECONDS: float = 30
+    LLM_BATCH_COMPLETION_WINDOW: str = "24h"
+
+    # The least relevant chunks are dropped from the prompts with a `token_budget` in prompts.yaml
+    # until they fit it. Tokens are counted with tiktoken when installed, estimated otherwise.
+    # The budgets per prompt override the ones of prompts.yaml, e.g. PROMPT_TOKEN_BUDGETS='{"entity_update": 32000}'
+    PROMPT_TOKEN_BUDGET_ENABLED: bool = True
+    PROMPT_TOKEN_BUDGETS: dict[str, int] = {}
 
     # Server configuration
     HOST: str = "0.0.0.0"
@@ -13,3 +13,36 @@ class SQLBriefReport(SQLModel, table=True):
     report_period_end: datetime
     novelty_enabled: bool = Field(default=True)
     brief_report: dict = Field(sa_column=Column(JSON))
+
+
+class SQLCacheEntry(SQLModel, table=True):
+    namespace: str = Field(primary_key=True)
+    key: str = Field(primary_key=True)
+    value: dict | list = Field(sa_column=Column(JSON))
+    size_bytes: int
+    created_at: float  # Unix timestamps, used to compute expiration and eviction order
+    expires_at: float = Field(index=True)
+    last_accessed_at: float = Field(index=True)
+
+
+class SQLTopicYield(SQLModel, table=True):
+    scope: str = Field(primary_key=True)  # "entity" or "sector"
+    key: str = Field(primary_key=True)  # Entity ID or sector name
+    topic: str = Field(primary_key=True)
+    searches: int = 0
+    hits: int = 0
+    updated_at: float  # Unix timestamp
+
+
+class SQLLLMBatchCall(SQLModel, table=True):
+    key: str = Field(primary_key=True)  # Hash of the body of the call
+    batch_id: str = Field(index=True)
+    output: dict | None = Field(default=None, sa_column=Column(JSON))
+    error: str | None = None
+    created_at: float  # Unix timestamp
+
+
+class SQLLLMBatchBrief(SQLModel, table=True):
+    request_id: uuid.UUID = Field(primary_key=True)
+    request: dict = Field(sa_column=Column(JSON))
+    created_at: float  # Unix timestamp
@@ -0,0 +1,184 @@
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import NamedTuple
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, col, select
+
+from bigdata_briefs.models import Entity, TopicContentTracker, TopicYield
+from bigdata_briefs.settings import settings
+from bigdata_briefs.sql_models import SQLTopicYield
+
+ENTITY_SCOPE = "entity"
+SECTOR_SCOPE = "sector"
+
+
+class TopicYieldStorage(ABC):
+    @abstractmethod
+    def retrieve(
+        self, scope: str, keys: list[str]
+    ) -> dict[tuple[str, str], TopicYield]: ...
+
+    @abstractmethod
+    def add(self, scope: str, yields: dict[tuple[str, str], TopicYield]): ...
+
+
+class SQLiteTopicYieldStorage(TopicYieldStorage):
+    def __init__(self, engine: Engine):
+        """Topic yields stored in the service database, keyed on (key, topic) for each scope"""
+        self.engine = engine
+
+    def retrieve(
+        self, scope: str, keys: list[str]
+    ) -> dict[tuple[str, str], TopicYield]:
+        if not keys:
+            return {}
+        with Session(self.engine) as session:
+            rows = session.exec(
+                select(SQLTopicYield).where(
+                    col(SQLTopicYield.scope) == scope,
+                    col(SQLTopicYield.key).in_(keys),
+                )
+            ).all()
+            return {
+                (row.key, row.topic): TopicYield(searches=row.searches, hits=row.hits)
+                for row in rows
+            }
+
+    def add(self, scope: str, yields: dict[tuple[str, str], TopicYield]):
+        """Add the searches and hits of `yields` to the stored ones, in a single transaction"""
+        if not yields:
+            return
+        now = time.time()
+        with Session(self.engine) as session:
+            rows = session.exec(
+                select(SQLTopicYield).where(
+                    col(SQLTopicYield.scope) == scope,
+                    col(SQLTopicYield.key).in_({key for key, _ in yields}),
+                )
+            ).all()
+            existing = {(row.key, row.topic): row for row in rows}
+            for (key, topic), topic_yield in yields.items():
+                row = existing.get((key, topic))
+                if row is None:
+                    row = SQLTopicYield(
+                        scope=scope, key=key, topic=topic, updated_at=now
+                    )
+                row.searches += topic_yield.searches
+                row.hits += topic_yield.hits
+                row.updated_at = now
+                session.add(row)
+            session.commit()
+
+
+def entity_sector(entity: Entity) -> str | None:
+    raw = entity.get_raw()
+    return raw.get("sector") if raw else None
+
+
+def topic_yields_from_trackers(
+    trackers: list[TopicContentTracker], entities: list[Entity], topics: list[str]
+) -> dict[str, dict[tuple[str, str], TopicYield]]:
+    """Yield of every topic searched for the entities, per entity and per sector
+
+    Trackers of other entities or topics, e.g. of another brief, are ignored.
+    """
+    entities_by_id = {entity.id: entity for entity in entities}
+    topics = set(topics)
+    yields = {
+        ENTITY_SCOPE: defaultdict(TopicYield),
+        SECTOR_SCOPE: defaultdict(TopicYield),
+    }
+    for tracker in trackers:
+        entity = entities_by_id.get(tracker.entity_id)
+        if entity is None or tracker.topic not in topics:
+            continue
+        topic_yield = TopicYield(searches=1, hits=int(bool(tracker.retrieval)))
+        yields[ENTITY_SCOPE][(entity.id, tracker.topic)] += topic_yield
+        if sector := entity_sector(entity):
+            yields[SECTOR_SCOPE][(sector, tracker.topic)] += topic_yield
+    return {scope: dict(scope_yields) for scope, scope_yields in yields.items()}
+
+
+class TopicSelection(NamedTuple):
+    kept: list[str]
+    skipped: list[str]
+
+
+class TopicPruner:
+    def __init__(
+        self,
+        storage: TopicYieldStorage,
+        *,
+        min_searches: int,
+        min_hit_rate: float,
+        explore_ratio: float,
+        rng: random.Random | None = None,
+    ):
+        """Select the topics worth searching for each entity, from their historical yield
+
+        The hit rate of a topic is taken from the searches of the entity, or from the ones of its
+        sector when the entity has less than `min_searches`. Topics without enough history are
+        always kept. Topics with a hit rate below `min_hit_rate` are skipped, except for
+        `explore_ratio` of the time so their yield is measured again. The topics kept are
+        ordered by decreasing hit rate, so the degraded mode of the query unit budget keeps the
+        most productive ones.
+        """
+        self.storage = storage
+        self.min_searches = min_searches
+        self.min_hit_rate = min_hit_rate
+        self.explore_ratio = explore_ratio
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def from_settings(cls, storage: TopicYieldStorage | None) -> "TopicPruner | None":
+        if storage is None or not settings.TOPIC_PRUNING_ENABLED:
+            return None
+        return cls(
+            storage,
+            min_searches=settings.TOPIC_PRUNING_MIN_SEARCHES,
+            min_hit_rate=settings.TOPIC_PRUNING_MIN_HIT_RATE,
+            explore_ratio=settings.TOPIC_PRUNING_EXPLORE_RATIO,
+        )
+
+    def select_topics(
+        self, entities: list[Entity], topics: list[str]
+    ) -> dict[str, TopicSelection]:
+        entity_yields = self.storage.retrieve(
+            ENTITY_SCOPE, [entity.id for entity in entities]
+        )
+        sectors = {entity.id: entity_sector(entity) for entity in entities}
+        sector_yields = self.storage.retrieve(
+            SECTOR_SCOPE, list({s for s in sectors.values() if s})
+        )
+
+        selections = {}
+        for entity in entities:
+            hit_rates = {}
+            for topic in topics:
+                topic_yield = entity_yields.get((entity.id, topic))
+                if topic_yield is None or topic_yield.searches < self.min_searches:
+                    topic_yield = sector_yields.get((sectors[entity.id], topic))
+                if (
+                    topic_yield is not None
+                    and topic_yield.searches >= self.min_searches
+                ):
+                    hit_rates[topic] = topic_yield.hit_rate
+
+            kept, skipped = [], []
+            for topic in topics:
+                hit_rate = hit_rates.get(topic)
+                if (
+                    hit_rate is not None
+                    and hit_rate < self.min_hit_rate
+                    and self.rng.random() >= self.explore_ratio
+                ):
+                    skipped.append(topic)
+                else:
+                    kept.append(topic)
+            # Topics without history first, they may be productive
+            kept.sort(key=lambda topic: -hit_rates.get(topic, 1.0))
+            selections[entity.id] = TopicSelection(kept=kept, skipped=skipped)
+        return selections
@@ -1,9 +1,15 @@
+import asyncio
+import contextvars
+import inspect
+import json
 import random
 import time
 import traceback
 import warnings
+from concurrent.futures import Executor, Future
 from datetime import datetime
 from functools import wraps
+from hashlib import sha256
 from time import perf_counter
 from typing import Type
 
@@ -14,6 +20,18 @@ from bigdata_briefs import logger
 
 
 def log_time(func):
+    if inspect.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                logger.debug(f"{func.__name__} executed in {perf_counter() - start}s")
+
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         start = perf_counter()
@@ -26,6 +44,15 @@ def log_time(func):
 
 
 def log_args(func):
+    if inspect.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            logger.debug(f"{func.__name__} executed with {args=} and {kwargs=}")
+            return await func(*args, **kwargs)
+
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         logger.debug(f"{func.__name__} executed with {args=} and {kwargs=}")
@@ -35,6 +62,16 @@ def log_args(func):
 
 
 def log_return_value(func):
+    if inspect.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            value = await func(*args, **kwargs)
+            logger.debug(f"{func.__name__} returned {value=}")
+            return value
+
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         value = func(*args, **kwargs)
@@ -44,7 +81,27 @@ def log_return_value(func):
     return wrapper
 
 
+def _log_metric(metric_name: str, start: float):
+    timing = datetime.now()
+    msg = f"{timing.strftime('%I:%M:%S')}.{timing.microsecond // 10000:02d} - {metric_name} - {round(time.perf_counter() - start, 2)}"
+    logger.debug(msg)
+
+
 def log_performance(func):
+    if inspect.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def async_wrapper(
+            *args, enable_metric: bool = False, metric_name: str = "Undefined", **kwargs
+        ):
+            start = perf_counter()
+            value = await func(*args, **kwargs)
+            if enable_metric:
+                _log_metric(metric_name, start)
+            return value
+
+        return async_wrapper
+
     @wraps(func)
     def wrapper(
         *args, enable_metric: bool = False, metric_name: str = "Undefined", **kwargs
@@ -52,9 +109,7 @@ def log_performance(func):
         start = perf_counter()
         value = func(*args, **kwargs)
         if enable_metric:
-            timing = datetime.now()
-            msg = f"{timing.strftime('%I:%M:%S')}.{timing.microsecond // 10000:02d} - {metric_name} - {round(time.perf_counter() - start, 2)}"
-            logger.debug(msg)
+            _log_metric(metric_name, start)
         return value
 
     return wrapper
@@ -89,14 +144,56 @@ def sleep_with_backoff(*, base: int = 1, attempt: int):
     @attempt starts at 0
 
     """
+    sleep_time = _backoff_time(base=base, attempt=attempt)
+
+    logger.debug(f"Sleeping for {sleep_time}")
+
+    time.sleep(sleep_time)
+
+
+async def async_sleep_with_backoff(*, base: int = 1, attempt: int):
+    """Same as `sleep_with_backoff` but without blocking the event loop."""
+    sleep_time = _backoff_time(base=base, attempt=attempt)
+
+    logger.debug(f"Sleeping for {sleep_time}")
+
+    await asyncio.sleep(sleep_time)
+
+
+async def gather_bounded(aws, limit: int) -> list:
+    """`asyncio.gather` running at most `limit` of the awaitables at the same time"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(bounded(aw) for aw in aws))
+
+
+def _backoff_time(*, base: int, attempt: int) -> float:
     max_sleep = 20
 
     rnd_upper_bound = min(max_sleep, base * 2**attempt)
-    sleep_time = round(random.uniform(0.5, rnd_upper_bound), 2)
+    return round(random.uniform(0.5, rnd_upper_bound), 2)
 
-    logger.debug(f"Sleeping for {sleep_time}")
 
-    time.sleep(sleep_time)
+def canonical_hash(payload) -> str:
+    """Hash a JSON serializable payload, independently of the order of its keys.
+
+    >>> canonical_hash({"a": 1, "b": 2}) == canonical_hash({"b": 2, "a": 1})
+    True
+    """
+    canonical = json.dumps(
+        payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return sha256(canonical.encode()).hexdigest()
+
+
+def submit_with_context(executor: Executor, fn, /, *args, **kwargs) -> Future:
+    """Submit a task to an executor running it in a copy of the current context, so the
+    task sees the context variables set by the caller (e.g. the brief it belongs to)"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
 
 
 def raise_warning_from(e, category=RuntimeWarning):
@@ -5,21 +5,49 @@ from contextlib import contextmanager
 class WeightedSemaphore:
     def __init__(self, weight_available: int):
         self._condition = threading.Condition()
+        self._capacity = weight_available
         self._weight_available = weight_available
 
     @contextmanager
     def __call__(self, weight: int):
         with self._condition:
-            while self._weight_available < weight:
+            while (acquired := self.try_acquire(weight)) is None:
                 self._condition.wait()
-            self._weight_available -= weight
         try:
             yield
         finally:
-            with self._condition:
-                self._weight_available += weight
-                self._condition.notify_all()
+            self.release(acquired)
+
+    def try_acquire(self, weight: int) -> int | None:
+        """Acquire the weight only if it is available right now, without waiting
+
+        Returns the weight acquired, to be given back with `release`, or None.
+        """
+        with self._condition:
+            # A weight bigger than the capacity would never be acquired, take the whole
+            # capacity instead so it runs alone
+            acquired = min(weight, self._capacity)
+            if self._weight_available < acquired:
+                return None
+            self._weight_available -= acquired
+            return acquired
+
+    def release(self, acquired: int):
+        with self._condition:
+            self._weight_available += acquired
+            self._condition.notify_all()
 
     def weight_available(self) -> int:
         with self._condition:
             return self._weight_available
+
+    def weight_in_use(self) -> int:
+        with self._condition:
+            return self._capacity - self._weight_available
+
+    def resize(self, capacity: int):
+        """Change the capacity, weight already acquired is not affected"""
+        with self._condition:
+            self._weight_available += capacity - self._capacity
+            self._capacity = capacity
+            self._condition.notify_all()
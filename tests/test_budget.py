@@ -0,0 +1,81 @@
+import pytest
+
+from bigdata_briefs.budget import (
+    DegradationLevel,
+    QueryUnitBudget,
+    get_degradation_level,
+    reset_query_unit_budget,
+    set_query_unit_budget,
+)
+from bigdata_briefs.exceptions import QueryUnitBudgetExceededError
+
+
+def make_budget(limit: float | None) -> QueryUnitBudget:
+    return QueryUnitBudget(
+        limit,
+        fewer_topics_at=0.5,
+        fewer_follow_up_questions_at=0.7,
+        pre_screen_only_at=0.9,
+    )
+
+
+@pytest.mark.parametrize(
+    "used, level",
+    [
+        (0, DegradationLevel.NONE),
+        (49, DegradationLevel.NONE),
+        (50, DegradationLevel.FEWER_TOPICS),
+        (70, DegradationLevel.FEWER_FOLLOW_UP_QUESTIONS),
+        (95, DegradationLevel.PRE_SCREEN_ONLY),
+    ],
+)
+def test_degradation_level_follows_used_fraction(used, level):
+    budget = make_budget(100)
+    budget.consume(used)
+
+    assert budget.degradation_level() == level
+
+
+def test_exhausted_budget_rejects_searches():
+    budget = make_budget(10)
+    budget.check()
+    budget.consume(10)
+
+    with pytest.raises(QueryUnitBudgetExceededError):
+        budget.check()
+
+    usage = budget.usage()
+    assert usage.query_units_used == 10
+    assert usage.rejected_searches == 1
+
+
+def test_budget_without_limit_only_tracks_usage():
+    budget = make_budget(None)
+    budget.consume(1_000)
+    budget.check()
+
+    assert budget.degradation_level() == DegradationLevel.NONE
+    assert budget.usage().query_units_used == 1_000
+
+
+def test_shed_work_is_recorded():
+    budget = make_budget(100)
+    budget.record_shed(topics=3)
+    budget.record_shed(follow_up_questions=2, pre_screen_only_entities=1)
+
+    usage = budget.usage()
+    assert usage.topics_shed == 3
+    assert usage.follow_up_questions_shed == 2
+    assert usage.pre_screen_only_entities == 1
+
+
+def test_degradation_level_of_the_current_context():
+    assert get_degradation_level() == DegradationLevel.NONE
+
+    budget = make_budget(100)
+    budget.consume(80)
+    token = set_query_unit_budget(budget)
+    try:
+        assert get_degradation_level() == DegradationLevel.FEWER_FOLLOW_UP_QUESTIONS
+    finally:
+        reset_query_unit_budget(token)
@@ -0,0 +1,117 @@
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+from bigdata_briefs import cache as cache_module
+from bigdata_briefs.cache import ACCESS_TIME_RESOLUTION_SECONDS, SQLiteCache
+from bigdata_briefs.sql_models import SQLCacheEntry
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    class FakeClock:
+        now = 1_000.0
+
+        def time(self):
+            return self.now
+
+    fake_clock = FakeClock()
+    monkeypatch.setattr(cache_module.time, "time", fake_clock.time)
+    return fake_clock
+
+
+def last_accessed_at(engine, key: str) -> float:
+    with Session(engine) as session:
+        return session.get(SQLCacheEntry, ("test", key)).last_accessed_at
+
+
+def test_get_returns_stored_value(engine):
+    cache = SQLiteCache(engine, namespace="test", ttl_seconds=60, max_size_bytes=10_000)
+
+    cache.set("key", {"results": [1, 2, 3]})
+
+    assert cache.get("key") == {"results": [1, 2, 3]}
+    assert cache.get("missing") is None
+
+
+def test_namespaces_are_isolated(engine):
+    cache_a = SQLiteCache(engine, namespace="a", ttl_seconds=60, max_size_bytes=10_000)
+    cache_b = SQLiteCache(engine, namespace="b", ttl_seconds=60, max_size_bytes=10_000)
+
+    cache_a.set("key", {"value": "a"})
+
+    assert cache_b.get("key") is None
+
+
+def test_expired_entries_are_ignored(engine, clock):
+    cache = SQLiteCache(engine, namespace="test", ttl_seconds=60, max_size_bytes=10_000)
+    cache.set("key", {"value": 1})
+    cache.set("long_lived", {"value": 2}, ttl_seconds=600)
+
+    clock.now += 61
+
+    assert cache.get("key") is None
+    assert cache.get("long_lived") == {"value": 2}
+
+
+def test_least_recently_accessed_entries_are_evicted(engine, clock):
+    value = {"value": "x" * 100}
+    # Room for only two entries
+    cache = SQLiteCache(engine, namespace="test", ttl_seconds=3600, max_size_bytes=250)
+
+    cache.set("first", value)
+    clock.now += 1
+    cache.set("second", value)
+    clock.now += ACCESS_TIME_RESOLUTION_SECONDS
+    # Accessing the first entry makes the second one the least recently used
+    assert cache.get("first") == value
+    clock.now += 1
+    cache.set("third", value)
+
+    assert cache.get("first") == value
+    assert cache.get("second") is None
+    assert cache.get("third") == value
+
+
+def test_recent_access_time_is_not_rewritten(engine, clock):
+    cache = SQLiteCache(
+        engine, namespace="test", ttl_seconds=3600, max_size_bytes=10_000
+    )
+    cache.set("key", 1)
+
+    clock.now += ACCESS_TIME_RESOLUTION_SECONDS - 1
+    cache.get("key")
+    assert last_accessed_at(engine, "key") == 1_000.0
+
+    clock.now += 1
+    cache.get_many(["key"])
+    assert last_accessed_at(engine, "key") == 1_000.0 + ACCESS_TIME_RESOLUTION_SECONDS
+
+
+def test_overwriting_an_entry_does_not_grow_the_size(engine):
+    value = {"value": "x" * 100}
+    cache = SQLiteCache(engine, namespace="test", ttl_seconds=60, max_size_bytes=250)
+    cache.set("first", value)
+    cache.set("second", value)
+
+    for _ in range(5):
+        cache.set("second", value)
+
+    assert cache.get("first") == value
+    assert cache.get("second") == value
+
+
+def test_get_many_returns_only_fresh_values(engine, clock):
+    cache = SQLiteCache(engine, namespace="test", ttl_seconds=60, max_size_bytes=10_000)
+    cache.set("old", 1)
+    clock.now += 50
+    cache.set_many({"new": 2, "other": 3})
+    clock.now += 20
+
+    assert cache.get_many(["old", "new", "other", "missing"]) == {"new": 2, "other": 3}
@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from bigdata_briefs import cassette
+from bigdata_briefs.cassette import (
+    AsyncCassetteTransport,
+    Cassette,
+    CassetteMode,
+    CassetteTransport,
+)
+from bigdata_briefs.exceptions import CassetteMissError
+
+
+@pytest.fixture
+def cassette_path(tmp_path):
+    return tmp_path / "cassette.jsonl"
+
+
+def counting_handler(calls: list):
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(json.loads(request.content))
+        return httpx.Response(200, json={"call": len(calls)})
+
+    return handler
+
+
+def record(cassette_path, payloads: list[dict]) -> list[dict]:
+    calls = []
+    cassette = Cassette(cassette_path, CassetteMode.RECORD, replay_latency=False)
+    transport = CassetteTransport(
+        cassette, httpx.MockTransport(counting_handler(calls))
+    )
+    with httpx.Client(base_url="https://api.test", transport=transport) as client:
+        for payload in payloads:
+            client.post("/v1/search", json=payload, headers={"X-API-KEY": "secret"})
+    return calls
+
+
+def replay_client(cassette_path, base_url="https://api.test") -> httpx.Client:
+    cassette = Cassette(cassette_path, CassetteMode.REPLAY, replay_latency=False)
+    return httpx.Client(base_url=base_url, transport=CassetteTransport(cassette))
+
+
+def test_replays_recorded_responses_by_canonical_payload(cassette_path):
+    record(cassette_path, [{"a": 1, "b": 2}, {"a": 2}])
+
+    with replay_client(cassette_path, base_url="https://other.test") as client:
+        response = client.post("/v1/search", json={"b": 2, "a": 1})
+
+    assert response.json() == {"call": 1}
+    # Credentials are not part of the cassette
+    assert "secret" not in cassette_path.read_text()
+
+
+def test_repeated_requests_are_replayed_in_order(cassette_path):
+    record(cassette_path, [{"a": 1}, {"a": 1}])
+
+    with replay_client(cassette_path) as client:
+        calls = [client.post("/v1/search", json={"a": 1}).json() for _ in range(3)]
+
+    assert calls == [{"call": 1}, {"call": 2}, {"call": 2}]
+
+
+def test_missing_recording_raises(cassette_path):
+    record(cassette_path, [{"a": 1}])
+
+    with replay_client(cassette_path) as client, pytest.raises(CassetteMissError):
+        client.post("/v1/search", json={"a": 2})
+
+
+def test_async_transport_replays(cassette_path):
+    record(cassette_path, [{"a": 1}])
+    cassette = Cassette(cassette_path, CassetteMode.REPLAY, replay_latency=True)
+
+    async def replay():
+        async with httpx.AsyncClient(
+            base_url="https://api.test", transport=AsyncCassetteTransport(cassette)
+        ) as client:
+            return (await client.post("/v1/search", json={"a": 1})).json()
+
+    assert asyncio.run(replay()) == {"call": 1}
+
+
+def test_openai_client_replays_embeddings(cassette_path, monkeypatch):
+    embedding_response = {
+        "object": "list",
+        "data": [{"object": "embedding", "index": 0, "embedding": [0.1, 0.2]}],
+        "model": "text-embedding-3-large",
+        "usage": {"prompt_tokens": 3, "total_tokens": 3},
+    }
+    cassette_path.write_text(
+        json.dumps(
+            {
+                "key": Cassette.request_key(
+                    httpx.Request(
+                        "POST",
+                        "https://api.openai.com/v1/embeddings",
+                        json={
+                            "input": ["text"],
+                            "model": "text-embedding-3-large",
+                            "encoding_format": "float",
+                        },
+                    )
+                ),
+                "status_code": 200,
+                "headers": {"content-type": "application/json"},
+                "content": json.dumps(embedding_response),
+                "latency": 0.1,
+            }
+        )
+        + "\n"
+    )
+    monkeypatch.setattr(
+        cassette,
+        "get_cassette",
+        lambda: Cassette(cassette_path, CassetteMode.REPLAY, replay_latency=False),
+    )
+
+    client = cassette.build_openai_client()
+    response = client.embeddings.create(
+        input=["text"], model="text-embedding-3-large", encoding_format="float"
+    )
+
+    assert response.data[0].embedding == [0.1, 0.2]
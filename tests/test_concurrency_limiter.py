@@ -0,0 +1,75 @@
+import pytest
+
+from bigdata_briefs.concurrency_limiter import AdaptiveConcurrencyLimiter
+from bigdata_briefs.settings import settings
+
+
+@pytest.fixture
+def limiter():
+    return AdaptiveConcurrencyLimiter(
+        initial_limit=20, min_limit=5, max_limit=40, window_size=10
+    )
+
+
+def record_window(limiter, latency, in_flight):
+    for _ in range(limiter.window_size):
+        limiter.record_latency(latency, in_flight)
+
+
+def test_limit_grows_while_latency_is_flat(limiter):
+    for _ in range(5):
+        record_window(limiter, latency=0.5, in_flight=limiter.limit)
+
+    assert limiter.limit > 20
+
+
+def test_limit_does_not_grow_if_not_used(limiter):
+    for _ in range(5):
+        record_window(limiter, latency=0.5, in_flight=1)
+
+    assert limiter.limit == 20
+
+
+def test_limit_shrinks_when_latency_rises(limiter):
+    record_window(limiter, latency=0.5, in_flight=20)
+    limit = limiter.limit
+
+    for _ in range(3):
+        record_window(limiter, latency=2.0, in_flight=20)
+
+    assert limiter.limit < limit
+
+
+def test_limit_is_clamped(limiter):
+    for _ in range(50):
+        record_window(limiter, latency=0.5, in_flight=40)
+    assert limiter.limit == 40
+
+    for _ in range(50):
+        limiter.on_dropped()
+    assert limiter.limit == 5
+
+
+def test_gates_follow_the_limit(limiter):
+    gate = limiter.new_gate()
+    assert gate.weight_available() == 20
+
+    with gate(3):
+        for _ in range(50):
+            limiter.on_dropped()
+
+        assert gate.weight_in_use() == 3
+        assert gate.weight_available() == 2
+
+    assert gate.weight_available() == 5
+
+
+def test_static_limiter_from_settings(monkeypatch):
+    monkeypatch.setattr(settings, "API_ADAPTIVE_CONCURRENCY_ENABLED", False)
+    limiter = AdaptiveConcurrencyLimiter.from_settings()
+
+    for _ in range(5):
+        record_window(limiter, latency=0.1, in_flight=limiter.limit)
+    limiter.on_dropped()
+
+    assert limiter.limit == settings.API_SIMULTANEOUS_REQUESTS
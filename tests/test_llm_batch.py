@@ -0,0 +1,145 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel, create_engine
+
+from bigdata_briefs.cassette import openai_http_module
+from bigdata_briefs.exceptions import LLMBatchError
+from bigdata_briefs.llm_batch import (
+    LLMBatchClient,
+    LLMBatchCollector,
+    SQLiteLLMBatchStorage,
+)
+from bigdata_briefs.loadtest.fake_servers import (
+    EndpointBehaviour,
+    FakeServerConfig,
+    create_fake_server,
+)
+from bigdata_briefs.models import FollowUpAnalysis
+
+
+@pytest.fixture
+def storage(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'briefs.db'}")
+    SQLModel.metadata.create_all(engine)
+    return SQLiteLLMBatchStorage(engine)
+
+
+def make_fake_api(**kwargs) -> TestClient:
+    config = FakeServerConfig(
+        llm=EndpointBehaviour(latency_median=0, **kwargs),
+        batch_polls_before_completion=2,
+        seed=0,
+    )
+    return TestClient(create_fake_server(config))
+
+
+@pytest.fixture
+def fake_api() -> TestClient:
+    return make_fake_api()
+
+
+def make_batch_client(storage, fake_api: TestClient) -> LLMBatchClient:
+    http = openai_http_module()
+
+    def handler(request):
+        response = fake_api.request(
+            request.method,
+            request.url.raw_path.decode(),
+            content=request.read(),
+            headers={"content-type": request.headers.get("content-type", "")},
+        )
+        return http.Response(
+            response.status_code,
+            headers={"content-type": response.headers["content-type"]},
+            content=response.content,
+        )
+
+    client = openai.OpenAI(
+        api_key="test",
+        base_url="https://api.test/v1",
+        max_retries=0,
+        http_client=openai.DefaultHttpxClient(transport=http.MockTransport(handler)),
+    )
+    return LLMBatchClient(storage, client, poll_interval_seconds=0)
+
+
+def follow_up_questions(collector: LLMBatchCollector, entity: str):
+    return collector.participate(
+        collector.call_with_response_format,
+        system=[{"role": "system", "content": "You are a helpful assistant"}],
+        messages=[{"role": "user", "content": f"Follow-up questions on {entity}"}],
+        model="gpt-4o-mini",
+        max_tokens=100,
+        text_format=FollowUpAnalysis,
+    )
+
+
+def test_calls_of_all_participants_are_sent_in_one_batch(storage, fake_api):
+    collector = LLMBatchCollector(make_batch_client(storage, fake_api), participants=3)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        outputs = list(
+            executor.map(
+                lambda entity: follow_up_questions(collector, entity), ["A", "B", "C"]
+            )
+        )
+
+    assert all(isinstance(output, FollowUpAnalysis) for output in outputs)
+    stats = fake_api.get("/stats").json()
+    assert stats["batch_calls"] == 3
+    # Created once, then polled until it completes
+    assert stats["batches_requests"] == 1 + 3
+
+
+def test_participants_that_leave_are_not_waited_on(storage, fake_api):
+    collector = LLMBatchCollector(make_batch_client(storage, fake_api), participants=2)
+
+    collector.leave()
+    output = follow_up_questions(collector, "A")
+
+    assert isinstance(output, FollowUpAnalysis)
+
+
+def test_calls_already_sent_are_resumed(storage, fake_api):
+    client = make_batch_client(storage, fake_api)
+    bodies = {"call-1": {"model": "gpt-4o-mini", "input": "Hi"}}
+    client.submit(bodies)
+
+    # The service restarts while the batch is running
+    results = make_batch_client(storage, fake_api).run(bodies)
+    assert results["call-1"].output["status"] == "completed"
+    assert fake_api.get("/stats").json()["batch_calls"] == 1
+
+    # Once finished, the results are read from the storage
+    files_requests = fake_api.get("/stats").json()["files_requests"]
+    assert make_batch_client(storage, fake_api).run(bodies) == results
+    assert fake_api.get("/stats").json()["files_requests"] == files_requests
+
+
+def test_failed_calls_raise(storage):
+    collector = LLMBatchCollector(
+        make_batch_client(storage, make_fake_api(server_error_ratio=1.0)),
+        participants=1,
+    )
+
+    with pytest.raises(LLMBatchError, match="LLM call failed in batch"):
+        follow_up_questions(collector, "A")
+
+
+def test_failed_batches_raise_for_every_call():
+    class ExpiredBatchClient:
+        def run(self, bodies):
+            raise LLMBatchError("LLM batch batch_1 is expired")
+
+    collector = LLMBatchCollector(ExpiredBatchClient(), participants=2)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(follow_up_questions, collector, name) for name in "AB"
+        ]
+        for future in futures:
+            with pytest.raises(LLMBatchError, match="expired"):
+                future.result(timeout=10)
@@ -2,13 +2,16 @@ from unittest.mock import MagicMock
 
 import pytest
 from pydantic import BaseModel
+from sqlmodel import SQLModel, create_engine
 
+from bigdata_briefs.cache import SQLiteCache
 from bigdata_briefs.llm_client import (
     LLMClient,
 )
 from bigdata_briefs.llm_client import (
     openai as llm_client_openai,
 )
+from bigdata_briefs.metrics import LLMMetrics
 from bigdata_briefs.utils import time as utils_time
 
 
@@ -156,3 +159,71 @@ def test_call_with_retries_but_failure(
     assert mock_llm_client.client.responses.parse.call_count == 3, (
         "Expected 3 retries but got a different count"
     )
+
+
+@pytest.fixture
+def llm_cache(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    SQLModel.metadata.create_all(engine)
+    return SQLiteCache(
+        engine, namespace="llm", ttl_seconds=60, max_size_bytes=1_000_000
+    )
+
+
+@pytest.fixture
+def reset_llm_metrics():
+    LLMMetrics.reset_usage()
+    yield
+    LLMMetrics.reset_usage()
+
+
+def test_identical_calls_are_answered_from_cache(
+    mock_openai_client, llm_cache, reset_llm_metrics, mock_system_message
+):
+    mock_response = MagicMock()
+    mock_response.usage.input_tokens = 100
+    mock_response.usage.output_tokens = 50
+    mock_response.usage.total_tokens = 150
+    mock_response.output_parsed = DummyResponseFormat(result="test result")
+    mock_openai_client.responses.parse.return_value = mock_response
+    llm_client = LLMClient(client=mock_openai_client, cache=llm_cache)
+
+    results = [
+        llm_client.call_with_response_format(
+            system=mock_system_message,
+            messages=[{"role": "user", "content": content}],
+            model="gpt-4",
+            max_tokens=1000,
+            text_format=DummyResponseFormat,
+        )
+        for content in ["Test message", "Test message", "Another message"]
+    ]
+
+    assert results == [DummyResponseFormat(result="test result")] * 3
+    assert mock_openai_client.responses.parse.call_count == 2
+    usage = LLMMetrics.get_total_usage()
+    assert usage.n_calls == 2
+    assert usage.cached_calls == 1
+
+
+def test_call_without_response_format_is_cached(
+    mock_openai_client, llm_cache, reset_llm_metrics, mock_messages
+):
+    mock_openai_client.chat.completions.create.return_value = {
+        "usage": {"inputTokens": 100, "outputTokens": 50, "totalTokens": 150},
+        "output": {"message": {"content": [{"text": "test response"}]}},
+    }
+    llm_client = LLMClient(client=mock_openai_client, cache=llm_cache)
+
+    for temperature in [0.0, 0.0, 0.7]:
+        result = llm_client.call_without_response_format(
+            messages=mock_messages,
+            model="gpt-4",
+            max_tokens=1000,
+            temperature=temperature,
+        )
+        assert result == "test response"
+
+    # A different parameter is a different call
+    assert mock_openai_client.chat.completions.create.call_count == 2
+    assert LLMMetrics.get_total_usage().cached_calls == 1
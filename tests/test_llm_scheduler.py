@@ -0,0 +1,155 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import openai
+import pytest
+from pydantic import BaseModel
+
+from bigdata_briefs.cassette import openai_http_module
+from bigdata_briefs.llm_client import AsyncLLMClient
+from bigdata_briefs.llm_scheduler import (
+    LLMScheduler,
+    estimate_tokens,
+    rate_limited_retry_after,
+)
+from bigdata_briefs.utils import asyncio as utils_asyncio
+
+
+class DummyResponseFormat(BaseModel):
+    result: str
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_rate_limit_error(headers: dict) -> openai.RateLimitError:
+    http = openai_http_module()
+    response = http.Response(
+        429,
+        headers=headers,
+        request=http.Request("POST", "https://api.openai.com/v1/responses"),
+    )
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def test_calls_wait_for_the_tokens_per_minute():
+    clock = FakeClock()
+    # 10 tokens per second, the bucket holds 5 seconds of tokens
+    scheduler = LLMScheduler(
+        requests_per_minute=6000, tokens_per_minute=600, clock=clock
+    )
+
+    assert scheduler.reserve("gpt", 40) == 0
+    assert scheduler.reserve("gpt", 40) == pytest.approx(3)
+    # The calls queued behind wait for their own tokens too
+    assert scheduler.reserve("gpt", 10) == pytest.approx(4)
+
+    clock.now = 10
+    assert scheduler.reserve("gpt", 40) == 0
+
+
+def test_calls_wait_for_the_requests_per_minute():
+    clock = FakeClock()
+    scheduler = LLMScheduler(
+        requests_per_minute=12, tokens_per_minute=1_000_000, clock=clock
+    )
+
+    # A single request every 5 seconds
+    assert [scheduler.reserve("gpt", 1) for _ in range(3)] == [
+        0,
+        pytest.approx(5),
+        pytest.approx(10),
+    ]
+
+
+def test_models_have_their_own_limits():
+    clock = FakeClock()
+    scheduler = LLMScheduler(
+        requests_per_minute=6000,
+        tokens_per_minute=600,
+        model_tokens_per_minute={"large": 6000},
+        clock=clock,
+    )
+
+    scheduler.reserve("small", 50)
+    assert scheduler.reserve("small", 50) == pytest.approx(5)
+    assert scheduler.reserve("large", 500) == 0
+
+
+def test_rate_limited_response_pauses_the_model():
+    clock = FakeClock()
+    scheduler = LLMScheduler(
+        requests_per_minute=6000, tokens_per_minute=600_000, clock=clock
+    )
+
+    scheduler.on_rate_limited("gpt", retry_after=2)
+
+    assert scheduler.reserve("gpt", 1) == pytest.approx(2)
+    assert scheduler.reserve("other", 1) == 0
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"retry-after-ms": "250"}, 0.25),
+        ({"retry-after": "3"}, 3),
+        ({}, 1.0),
+    ],
+)
+def test_rate_limited_retry_after(headers, expected):
+    assert rate_limited_retry_after(make_rate_limit_error(headers)) == expected
+
+
+def test_rate_limited_retry_after_ignores_other_errors():
+    assert rate_limited_retry_after(Exception("API Error")) is None
+
+
+def test_estimate_tokens_grows_with_the_prompt():
+    short = estimate_tokens([{"role": "user", "content": "Hello"}])
+    long = estimate_tokens([{"role": "user", "content": "Hello " * 100}])
+
+    assert 0 < short < long
+    assert long == pytest.approx(600 / 4, rel=0.1)
+
+
+def test_async_client_retries_rate_limited_calls_through_the_scheduler(monkeypatch):
+    scheduler = MagicMock(wait_async=AsyncMock())
+    response = MagicMock()
+    response.usage.input_tokens = 100
+    response.usage.output_tokens = 50
+    response.usage.total_tokens = 150
+    response.output_parsed = DummyResponseFormat(result="test result")
+    client = MagicMock()
+    client.responses.parse = AsyncMock(
+        side_effect=[make_rate_limit_error({"retry-after": "2"}), response]
+    )
+
+    async def fail_on_backoff(*args, **kwargs):
+        raise AssertionError("Rate limited calls must not use the blind backoff")
+
+    monkeypatch.setattr(utils_asyncio, "sleep", fail_on_backoff)
+    llm_client = AsyncLLMClient(client=client, scheduler=scheduler)
+
+    result = asyncio.run(
+        llm_client.call_with_response_format(
+            system=[{"role": "system", "content": "You are a helpful assistant"}],
+            messages=[{"role": "user", "content": "Test message"}],
+            model="gpt-4",
+            max_tokens=1000,
+            text_format=DummyResponseFormat,
+        )
+    )
+
+    assert result.result == "test result"
+    assert client.responses.parse.await_count == 2
+    scheduler.on_rate_limited.assert_called_once_with("gpt-4", 2)
+    # Every attempt reserves the prompt and the max tokens of the response
+    (model, tokens), _ = scheduler.wait_async.await_args
+    assert model == "gpt-4"
+    assert tokens > 1000
+    assert scheduler.wait_async.await_count == 2
@@ -0,0 +1,167 @@
+import math
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bigdata_briefs.loadtest.driver import BriefRun, LoadTestReport, percentiles
+from bigdata_briefs.loadtest.fake_servers import (
+    EMBEDDING_DIMENSIONS,
+    EndpointBehaviour,
+    FakeServerConfig,
+    create_fake_server,
+)
+from bigdata_briefs.models import (
+    Entity,
+    FollowUpAnalysis,
+    ReportTitle,
+    SingleBulletPoint,
+    TopicCollection,
+)
+from bigdata_briefs.query_service.api import decode_search_response
+
+
+def instant(**kwargs) -> EndpointBehaviour:
+    return EndpointBehaviour(latency_median=0, **kwargs)
+
+
+@pytest.fixture
+def fake_api() -> TestClient:
+    config = FakeServerConfig(
+        search=instant(),
+        knowledge_graph=instant(),
+        llm=instant(),
+        embeddings=instant(),
+        seed=0,
+    )
+    return TestClient(create_fake_server(config))
+
+
+def test_fake_search_is_decoded_by_the_query_service(fake_api):
+    response = fake_api.post(
+        "/v1/search",
+        json={
+            "query": {
+                "text": "earnings",
+                "filters": {"entity": {"any_of": ["AAAAA1", "AAAAA2"]}},
+                "max_chunks": 4,
+            }
+        },
+    )
+
+    results = decode_search_response(response.text)
+
+    assert len(results) == 4
+    assert {chunk.text.split()[-2] for r in results for chunk in r.chunks} == {
+        "AAAAA1.",
+        "AAAAA2.",
+    }
+
+
+def test_fake_entities_are_parsed(fake_api):
+    response = fake_api.post(
+        "/v1/knowledge-graph/entities/id", json={"values": ["AAAAA1", "AAAAA2"]}
+    )
+
+    entities = [Entity.from_api(e) for e in response.json()["results"].values()]
+
+    assert [e.id for e in entities] == ["AAAAA1", "AAAAA2"]
+    assert entities[0].to_entity_info().entity_type == "Companies"
+
+
+@pytest.mark.parametrize(
+    "model", [FollowUpAnalysis, TopicCollection, SingleBulletPoint, ReportTitle]
+)
+def test_fake_llm_follows_the_response_format(fake_api, model):
+    response = fake_api.post(
+        "/v1/responses",
+        json={
+            "model": "gpt-4o-mini",
+            "input": [{"role": "user", "content": "Hi"}],
+            "text": {
+                "format": {
+                    "type": "json_schema",
+                    "name": model.__name__,
+                    "schema": model.model_json_schema(),
+                    "strict": True,
+                }
+            },
+        },
+    )
+
+    body = response.json()
+    model.model_validate_json(body["output"][0]["content"][0]["text"])
+    assert body["usage"]["total_tokens"] > 0
+
+
+def test_fake_embeddings_are_deterministic(fake_api):
+    def embed(texts):
+        response = fake_api.post(
+            "/v1/embeddings", json={"model": "text-embedding-3-small", "input": texts}
+        )
+        return [item["embedding"] for item in response.json()["data"]]
+
+    first, second = embed(["a", "b"])
+    assert len(first) == EMBEDDING_DIMENSIONS
+    assert math.isclose(sum(v * v for v in first), 1)
+    assert first != second
+    assert embed(["a"]) == [first]
+
+
+def test_fake_server_injects_errors():
+    config = FakeServerConfig(
+        knowledge_graph=instant(rate_limited_ratio=0.5, server_error_ratio=0.5),
+        seed=0,
+    )
+    client = TestClient(create_fake_server(config))
+
+    statuses = {
+        client.post(
+            "/v1/knowledge-graph/entities/id", json={"values": ["AAAAA1"]}
+        ).status_code
+        for _ in range(20)
+    }
+
+    assert statuses == {429, 500}
+    stats = client.get("/stats").json()
+    assert stats["knowledge_graph_requests"] == 20
+    assert (
+        stats["knowledge_graph_rate_limited"] + stats["knowledge_graph_server_errors"]
+        == 20
+    )
+
+
+def test_stage_durations_follow_the_status_logs():
+    run = BriefRun(
+        request_id="1",
+        submitted_at=10.0,
+        status="completed",
+        finished_at=20.0,
+        logs_seen_at=[
+            ("Validating input parameters", 11.0),
+            ("Generated reports for 3 entities", 17.0),
+        ],
+    )
+
+    assert run.duration == 10.0
+    assert run.stage_durations() == {
+        "Queued": 1.0,
+        "Validating input parameters": 6.0,
+        "Generated reports for N entities": 3.0,
+    }
+
+
+def test_report_only_aggregates_completed_briefs():
+    runs = [
+        BriefRun("1", submitted_at=0.0, status="completed", finished_at=30.0),
+        BriefRun("2", submitted_at=0.0, status="completed", finished_at=60.0),
+        BriefRun("3", submitted_at=0.0, status="failed", finished_at=5.0),
+    ]
+    report = LoadTestReport(runs=runs, wall_time=60.0)
+
+    assert report.briefs_per_minute == 2.0
+    assert report.end_to_end_percentiles()[50] == 45.0
+    assert "2 completed" in report.format()
+
+
+def test_percentiles_of_no_values_are_nan():
+    assert all(math.isnan(v) for v in percentiles([]).values())
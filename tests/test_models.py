@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from test_query_service.conftest import make_result
+
+from bigdata_briefs.models import Result, ResultBatch
+
+
+@pytest.fixture
+def results() -> list[Result]:
+    return [
+        make_result("doc1", [(1, 0.2), (2, 0.9)]),
+        make_result(
+            "doc2",
+            [(1, 0.5)],
+            source_rank=None,
+            timestamp="2023-01-16T12:00:00+02:00",
+        ),
+        make_result("doc1", [(2, 0.9), (3, 0.7)]),
+    ]
+
+
+def test_result_batch_columns(results):
+    batch = ResultBatch.from_results(results)
+
+    assert len(batch) == 5
+    assert batch.document_ids.tolist() == ["doc1", "doc1", "doc2", "doc1", "doc1"]
+    assert batch.chunk_ids.tolist() == [1, 2, 1, 2, 3]
+    np.testing.assert_array_equal(batch.relevance, [0.2, 0.9, 0.5, 0.9, 0.7])
+    np.testing.assert_array_equal(batch.source_rank, [1, 1, np.nan, 1, 1])
+    assert batch.timestamp[2] == np.datetime64("2023-01-16T10:00:00")
+
+
+def test_result_batch_round_trip(results):
+    assert ResultBatch.from_results(results).to_results() == results
+
+
+def test_result_batch_dedup(results):
+    batch = ResultBatch.from_results(results).dedup()
+
+    assert list(zip(batch.document_ids, batch.chunk_ids)) == [
+        ("doc1", 1),
+        ("doc1", 2),
+        ("doc2", 1),
+        ("doc1", 3),
+    ]
+
+
+def test_result_batch_top_k(results):
+    batch = ResultBatch.from_results(results[:2]).top_k(2)
+
+    np.testing.assert_array_equal(batch.relevance, [0.9, 0.5])
+    assert [
+        (r.document_id, [c.chunk for c in r.chunks]) for r in batch.to_results()
+    ] == [
+        ("doc1", [2]),
+        ("doc2", [1]),
+    ]
+
+
+def test_result_batch_select_mask(results):
+    batch = ResultBatch.from_results(results)
+
+    selected = batch.select(batch.relevance >= 0.5).to_results()
+
+    assert [(r.document_id, [c.chunk for c in r.chunks]) for r in selected] == [
+        ("doc1", [2]),
+        ("doc2", [1]),
+        ("doc1", [2, 3]),
+    ]
+
+
+def test_result_batch_empty():
+    batch = ResultBatch.from_results([])
+
+    assert len(batch.dedup().top_k(3)) == 0
+    assert batch.to_results() == []
@@ -0,0 +1,145 @@
+import json
+
+import httpx
+import pytest
+from sqlmodel import SQLModel, create_engine
+
+from bigdata_briefs.cache import SQLiteCache
+from bigdata_briefs.models import Result
+from bigdata_briefs.query_service.api import APIQueryService, AsyncAPIQueryService
+from bigdata_briefs.query_service.circuit_breaker import (
+    get_circuit_breaker,
+    get_retry_budget,
+)
+
+
+def make_api_document(document_id: str, chunks: list[tuple[int, str]]) -> dict:
+    """Build a document as returned by the `/v1/search` endpoint"""
+    return {
+        "id": document_id,
+        "headline": f"Headline {document_id}",
+        "timestamp": "2023-01-15T00:00:00Z",
+        "source": {"id": "source1", "name": "Source 1", "rank": "RANK_1"},
+        "url": f"https://example.com/{document_id}",
+        "document_type": "news",
+        "language": "en",
+        "chunks": [
+            {"cnum": cnum, "text": text, "relevance": 0.9, "sentiment": 0.5}
+            for cnum, text in chunks
+        ],
+    }
+
+
+def make_result(
+    document_id: str,
+    chunks: list[tuple[int, float]],
+    *,
+    text: str = "{document_id} chunk {cnum}",
+    source_rank: str | None = "RANK_1",
+    timestamp: str = "2023-01-15T00:00:00Z",
+) -> Result:
+    """Build a `Result` from an API document, `chunks` are `(cnum, relevance)` pairs and
+    `text` is formatted with the `document_id` and `cnum` of every chunk"""
+    document = make_api_document(
+        document_id,
+        [(cnum, text.format(document_id=document_id, cnum=cnum)) for cnum, _ in chunks],
+    )
+    for api_chunk, (_, relevance) in zip(document["chunks"], chunks):
+        api_chunk["relevance"] = relevance
+    document["timestamp"] = timestamp
+    if source_rank is None:
+        del document["source"]["rank"]
+    else:
+        document["source"]["rank"] = source_rank
+    return Result.from_api(document)
+
+
+def make_search_response(documents: list[dict], query_units: float = 1.0) -> dict:
+    return {"results": documents, "usage": {"api_query_units": query_units}}
+
+
+def make_service(handler, **kwargs) -> APIQueryService:
+    """Query service sending its requests to `handler`, `kwargs` go to the constructor"""
+    return APIQueryService(transport=httpx.MockTransport(handler), **kwargs)
+
+
+def make_async_service(handler, **kwargs) -> AsyncAPIQueryService:
+    """Same as `make_service` for the asyncio query service"""
+    return AsyncAPIQueryService(transport=httpx.MockTransport(handler), **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breaker():
+    """The circuit breaker and retry budget are shared by the process, isolate every test"""
+    get_circuit_breaker.cache_clear()
+    get_retry_budget.cache_clear()
+    yield
+    get_circuit_breaker.cache_clear()
+    get_retry_budget.cache_clear()
+
+
+@pytest.fixture
+def search_cache(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    SQLModel.metadata.create_all(engine)
+    return SQLiteCache(
+        engine, namespace="search", ttl_seconds=60, max_size_bytes=1_000_000
+    )
+
+
+@pytest.fixture
+def api_document() -> dict:
+    """A document of the `/v1/search` response, with its chunks out of order"""
+    return make_api_document("doc-1", [(2, "second"), (1, "first")])
+
+
+@pytest.fixture
+def search_requests() -> list[dict]:
+    """Payloads received by the fake search API"""
+    return []
+
+
+@pytest.fixture
+def search_handler(search_requests):
+    """Fake `/v1/search` endpoint returning one document per request, keyed on the query text"""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        search_requests.append(payload)
+        text = payload["query"].get("text", "no-text")
+        return httpx.Response(
+            200,
+            json=make_search_response(
+                [make_api_document(f"doc-{text}", [(1, f"chunk about {text}")])]
+            ),
+        )
+
+    return handler
+
+
+@pytest.fixture
+def prescreen_handler(search_requests):
+    """Build a fake `/v1/search` endpoint returning `hits[entity_id]` chunks detecting each
+    of the entities in the query, one document per chunk"""
+
+    def build(hits: dict[str, int]):
+        def handler(request: httpx.Request) -> httpx.Response:
+            payload = json.loads(request.content)
+            search_requests.append(payload)
+            documents = []
+            for entity_id in payload["query"]["filters"]["entity"]["any_of"]:
+                for cnum in range(hits.get(entity_id, 0)):
+                    text = f"chunk {cnum} about {entity_id}"
+                    document = make_api_document(f"doc-{text}", [(cnum, text)])
+                    document["chunks"][0]["detections"] = [
+                        {"id": entity_id, "type": "entity"}
+                    ]
+                    documents.append(document)
+            return httpx.Response(
+                200,
+                json=make_search_response(documents[: payload["query"]["max_chunks"]]),
+            )
+
+        return handler
+
+    return build
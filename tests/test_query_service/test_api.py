@@ -0,0 +1,305 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import httpx
+import pytest
+from pydantic import ValidationError
+from sqlmodel import SQLModel, create_engine
+
+from bigdata_briefs.budget import (
+    QueryUnitBudget,
+    reset_query_unit_budget,
+    set_query_unit_budget,
+)
+from bigdata_briefs.cache import SQLiteCache
+from bigdata_briefs.exceptions import QueryUnitBudgetExceededError
+from bigdata_briefs.metrics import (
+    CacheMetrics,
+    PrescreenMetrics,
+    QueryUnitMetrics,
+    RateLimitMetrics,
+)
+from bigdata_briefs.models import CacheUsage, ReportDates, Result
+from bigdata_briefs.query_service import api
+from bigdata_briefs.query_service.api import APIQueryService
+from bigdata_briefs.scheduler import (
+    Priority,
+    get_scheduling_context,
+    reset_scheduling_context,
+    set_scheduling_context,
+)
+
+from .conftest import make_service
+
+
+@pytest.fixture
+def report_dates():
+    return ReportDates(
+        start=datetime(2023, 1, 1), end=datetime(2023, 1, 31), novelty=False
+    )
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    CacheMetrics.reset_usage()
+    PrescreenMetrics.reset_usage()
+    QueryUnitMetrics.reset_usage()
+    RateLimitMetrics.reset_usage()
+    yield
+    CacheMetrics.reset_usage()
+    PrescreenMetrics.reset_usage()
+    QueryUnitMetrics.reset_usage()
+    RateLimitMetrics.reset_usage()
+
+
+def test_search_cache_avoids_repeated_api_calls(
+    search_handler, search_requests, search_cache, report_dates
+):
+    service = make_service(search_handler, search_cache=search_cache)
+
+    first = service.check_if_entity_has_results(
+        entity_id="ABC123", report_dates=report_dates
+    )
+    second = service.check_if_entity_has_results(
+        entity_id="ABC123", report_dates=report_dates
+    )
+
+    assert first == second
+    assert len(search_requests) == 1
+    assert CacheMetrics.get_total_usage() == CacheUsage(hits=1, misses=1)
+    # Query units are only spent on the request that reached the API
+    assert QueryUnitMetrics.get_total_usage() == 1
+
+
+def test_search_without_cache_always_calls_api(
+    search_handler, search_requests, report_dates
+):
+    service = make_service(search_handler)
+
+    for _ in range(2):
+        service.check_if_entity_has_results(
+            entity_id="ABC123", report_dates=report_dates
+        )
+
+    assert len(search_requests) == 2
+    assert CacheMetrics.get_total_usage() == CacheUsage()
+
+
+def test_rate_limited_response_slows_down_instead_of_backing_off(
+    search_handler, search_requests, report_dates, monkeypatch
+):
+    responses = iter([httpx.Response(429, headers={"Retry-After": "0"})])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return next(responses, None) or search_handler(request)
+
+    def fail_on_backoff(*args, **kwargs):
+        raise AssertionError("Rate limited requests must not use the blind backoff")
+
+    monkeypatch.setattr(api, "sleep_with_backoff", fail_on_backoff)
+    service = make_service(handler)
+    initial_rate = service.rate_limit_controller.max_requests_per_min
+
+    assert service.check_if_entity_has_results(
+        entity_id="ABC123", report_dates=report_dates
+    )
+
+    assert len(search_requests) == 1
+    usage = RateLimitMetrics.get_total_usage()
+    assert usage.rate_limited_responses == 1
+    assert usage.requests_per_minute < initial_rate
+
+
+def test_bulk_prescreen_rules_out_quiet_entities_in_one_call(
+    prescreen_handler, search_requests, report_dates, monkeypatch
+):
+    monkeypatch.setattr(api.settings, "API_PRESCREEN_BATCH_SIZE", 10)
+    entity_ids = [f"ENT{i:03d}" for i in range(10)]
+    service = make_service(prescreen_handler({"ENT001": 1, "ENT005": 1}))
+
+    with ThreadPoolExecutor() as executor:
+        results = service.check_if_entities_have_results(
+            entity_ids, report_dates, executor
+        )
+
+    assert len(search_requests) == 1
+    assert {e for e, r in results.items() if r} == {"ENT001", "ENT005"}
+    assert set(results) == set(entity_ids)
+    assert results["ENT001"][0].chunks[0].text == "chunk 0 about ENT001"
+
+
+def test_bulk_prescreen_checks_individually_when_batch_is_saturated(
+    prescreen_handler, search_requests, report_dates, monkeypatch
+):
+    monkeypatch.setattr(api.settings, "API_PRESCREEN_BATCH_SIZE", 2)
+    monkeypatch.setattr(api.settings, "API_PRESCREEN_CHUNKS_PER_ENTITY", 1)
+    service = make_service(prescreen_handler({"ENT001": 2, "ENT002": 1}))
+
+    with ThreadPoolExecutor() as executor:
+        results = service.check_if_entities_have_results(
+            ["ENT001", "ENT002"], report_dates, executor
+        )
+
+    # The batch is full with chunks of ENT001, ENT002 can't be ruled out without its own search
+    assert len(search_requests) == 2
+    assert search_requests[1]["query"]["filters"]["entity"]["any_of"] == ["ENT002"]
+    assert results["ENT001"] and results["ENT002"]
+
+
+def test_bulk_prescreen_tracks_batches_without_detections(
+    search_handler, search_requests, report_dates
+):
+    service = make_service(search_handler)
+
+    with ThreadPoolExecutor() as executor:
+        results = service.check_if_entities_have_results(
+            ["ENT001", "ENT002"], report_dates, executor
+        )
+
+    # The chunks can't be assigned, so both entities are also checked alone
+    assert len(search_requests) == 3
+    assert results["ENT001"] and results["ENT002"]
+    usage = PrescreenMetrics.get_total_usage()
+    assert usage.batches == 1
+    assert usage.inconclusive_batches == 1
+    assert usage.entities_checked_individually == 2
+
+
+def test_demultiplex_is_inconclusive_without_detections():
+    chunk = {"cnum": 1, "text": "No detections", "relevance": 0.9, "sentiment": 0.5}
+    response = {"results": [{"id": "doc-1", "chunks": [chunk]}]}
+
+    results_per_entity, conclusive = api.demultiplex_search_response(
+        response, ["ENT001"]
+    )
+
+    assert results_per_entity == {}
+    assert not conclusive
+
+
+def test_get_entities_fetches_batches_and_uses_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "MAX_ENTITIES_PER_KG_ENTITY_BY_ID_REQUEST", 2)
+    requested_batches = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        batch = json.loads(request.content)["values"]
+        requested_batches.append(batch)
+        return httpx.Response(
+            200,
+            json={
+                "results": {
+                    entity_id: {"id": entity_id, "name": entity_id, "category": "COMP"}
+                    for entity_id in batch
+                }
+            },
+        )
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    SQLModel.metadata.create_all(engine)
+    entity_cache = SQLiteCache(
+        engine, namespace="entities", ttl_seconds=60, max_size_bytes=1_000_000
+    )
+    service = make_service(handler, entity_cache=entity_cache)
+
+    entities = service.get_entities(["ENT001", "ENT002", "ENT003"])
+    assert [e.id for e in entities] == ["ENT001", "ENT002", "ENT003"]
+    assert sorted(requested_batches) == [["ENT001", "ENT002"], ["ENT003"]]
+
+    requested_batches.clear()
+    entities = service.get_entities(["ENT003", "ENT004"])
+    assert [e.id for e in entities] == ["ENT003", "ENT004"]
+    # Only the entity that was not cached is requested
+    assert requested_batches == [["ENT004"]]
+
+
+def test_get_entities_keeps_the_scheduling_context(monkeypatch):
+    service = APIQueryService()
+    flow_ids = []
+
+    def get_entities_batch(entity_ids):
+        flow_ids.append(get_scheduling_context().flow_id)
+        return {}
+
+    monkeypatch.setattr(service, "_get_entities_batch", get_entities_batch)
+    token = set_scheduling_context("brief-1", Priority.INTERACTIVE)
+    try:
+        service.get_entities(["ENT001"])
+    finally:
+        reset_scheduling_context(token)
+    service.cleanup()
+
+    assert flow_ids == ["brief-1"]
+
+
+def test_decode_search_response_maps_api_fields(api_document):
+    api_document["source"]["rank"] = "RANK_3"
+    content = json.dumps({"results": [api_document], "usage": {"api_query_units": 1}})
+
+    (result,) = api.decode_search_response(content)
+
+    assert result.document_id == "doc-1"
+    assert result.source_key == "source1"
+    assert result.source_rank == 3
+    assert result.ts == result.timestamp == "2023-01-15T00:00:00Z"
+    assert result.document_scope == "news"
+    assert [chunk.chunk for chunk in result.chunks] == [1, 2]
+    # Validating the dumped model gives the same result, so both paths stay compatible
+    assert Result.model_validate(result.model_dump()) == result
+
+
+def test_decode_search_response_rejects_unknown_source_rank(api_document):
+    api_document["source"]["rank"] = "RANK_9"
+    content = json.dumps({"results": [api_document], "usage": {"api_query_units": 1}})
+
+    with pytest.raises(ValidationError):
+        api.decode_search_response(content)
+
+
+def test_merge_results_joins_chunks_by_document(api_document):
+    first = Result.from_api({**api_document, "chunks": api_document["chunks"][:1]})
+    second = Result.from_api(api_document)
+    other = Result.from_api({**api_document, "id": "doc-2"})
+
+    merged = api.merge_results([first, other], [second])
+
+    assert [result.document_id for result in merged] == ["doc-1", "doc-2"]
+    assert [chunk.chunk for chunk in merged[0].chunks] == [1, 2]
+    assert merged[1] is other
+
+
+def test_merge_results_keeps_most_relevant_chunks(api_document, monkeypatch):
+    monkeypatch.setattr(api, "MAX_CHUNKS_PER_DOCUMENT", 2)
+    api_document["chunks"] = [
+        {"cnum": cnum, "text": f"chunk {cnum}", "relevance": relevance, "sentiment": 0}
+        for cnum, relevance in [(1, 0.1), (2, 0.9), (3, 0.5)]
+    ]
+    results = [
+        Result.from_api({**api_document, "chunks": [chunk]})
+        for chunk in api_document["chunks"]
+    ]
+
+    (merged,) = api.merge_results(results)
+
+    assert [chunk.chunk for chunk in merged.chunks] == [2, 3]
+
+
+def test_searches_are_charged_to_the_query_unit_budget(
+    search_handler, search_requests, report_dates
+):
+    service = make_service(search_handler)
+    budget = QueryUnitBudget(1)
+    token = set_query_unit_budget(budget)
+    try:
+        service.check_if_entity_has_results(
+            entity_id="ABC123", report_dates=report_dates
+        )
+        with pytest.raises(QueryUnitBudgetExceededError):
+            service.check_if_entity_has_results(
+                entity_id="DEF456", report_dates=report_dates
+            )
+    finally:
+        reset_query_unit_budget(token)
+
+    assert len(search_requests) == 1
+    assert budget.usage().query_units_used == 1
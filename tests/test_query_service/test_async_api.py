@@ -0,0 +1,217 @@
+import asyncio
+import json
+from datetime import datetime
+
+import httpx
+import pytest
+from sqlmodel import SQLModel, create_engine
+
+from bigdata_briefs.cache import SQLiteCache
+from bigdata_briefs.models import Entity, ReportDates
+from bigdata_briefs.query_service import api
+from bigdata_briefs.query_service.api import APIQueryService
+
+from .conftest import make_async_service
+
+
+@pytest.fixture
+def report_dates():
+    return ReportDates(
+        start=datetime(2023, 1, 1), end=datetime(2023, 1, 31), novelty=False
+    )
+
+
+@pytest.fixture
+def entity():
+    return Entity(id="ABC123", name="Test Entity", entity_type="COMP")
+
+
+def test_run_exploratory_search_fans_out_on_event_loop(
+    search_handler, search_requests, entity, report_dates
+):
+    service = make_async_service(search_handler)
+    topics = ["What about {entity}?", "Anything new on {entity}?"]
+
+    results = asyncio.run(
+        service.run_exploratory_search(
+            entity=entity, topics=topics, report_dates=report_dates
+        )
+    )
+
+    # One search per topic plus the one with only the entity
+    assert len(search_requests) == len(topics) + 1
+    assert {r.document_id for r in results} == {
+        "doc-What about Test Entity?",
+        "doc-Anything new on Test Entity?",
+        "doc-no-text",
+    }
+    assert all(
+        r["query"]["filters"]["entity"] == {"any_of": [entity.id]}
+        for r in search_requests
+    )
+
+
+def test_run_exploratory_search_keeps_seed_results(
+    search_handler, entity, report_dates
+):
+    service = make_async_service(search_handler)
+    seed_results = asyncio.run(
+        service.check_if_entity_has_results(
+            entity_id=entity.id, report_dates=report_dates, similarity_text="seed"
+        )
+    )
+
+    results = asyncio.run(
+        service.run_exploratory_search(
+            entity=entity,
+            topics=[],
+            report_dates=report_dates,
+            use_topics=False,
+            seed_results=seed_results,
+        )
+    )
+
+    assert [r.document_id for r in results] == ["doc-seed", "doc-no-text"]
+
+
+def test_run_query_with_follow_up_questions(search_handler, entity, report_dates):
+    service = make_async_service(search_handler)
+
+    qa_pairs = asyncio.run(
+        service.run_query_with_follow_up_questions(
+            entity=entity,
+            follow_up_questions=["Q1", "Q2"],
+            report_dates=report_dates,
+            source_filter=None,
+            categories=None,
+        )
+    )
+
+    assert [pair.question for pair in qa_pairs.pairs] == ["Q1", "Q2"]
+    assert [pair.answer[0].document_id for pair in qa_pairs.pairs] == [
+        "doc-Q1",
+        "doc-Q2",
+    ]
+
+
+def test_get_entities_fetches_batches_concurrently():
+    requested_batches = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        batch = json.loads(request.content)["values"]
+        requested_batches.append(batch)
+        return httpx.Response(
+            200,
+            json={
+                "results": {
+                    entity_id: {"id": entity_id, "name": entity_id, "category": "COMP"}
+                    for entity_id in batch
+                }
+            },
+        )
+
+    service = make_async_service(handler)
+    entity_ids = [f"{i:06d}" for i in range(250)]
+
+    entities = asyncio.run(service.get_entities(entity_ids))
+
+    assert len(requested_batches) == 3
+    assert [e.id for e in entities] == entity_ids
+
+
+def test_get_entities_uses_cache(tmp_path):
+    requested_batches = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        batch = json.loads(request.content)["values"]
+        requested_batches.append(batch)
+        return httpx.Response(
+            200,
+            json={
+                "results": {
+                    entity_id: {"id": entity_id, "name": entity_id, "category": "COMP"}
+                    for entity_id in batch
+                }
+            },
+        )
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    SQLModel.metadata.create_all(engine)
+    entity_cache = SQLiteCache(
+        engine, namespace="entities", ttl_seconds=60, max_size_bytes=1_000_000
+    )
+    service = make_async_service(handler, entity_cache=entity_cache)
+
+    asyncio.run(service.get_entities(["ENT001", "ENT002"]))
+    entities = asyncio.run(service.get_entities(["ENT002", "ENT003"]))
+
+    assert [e.id for e in entities] == ["ENT002", "ENT003"]
+    # Only the entity that was not cached is requested the second time
+    assert requested_batches == [["ENT001", "ENT002"], ["ENT003"]]
+
+
+def test_call_api_retries_on_server_errors(monkeypatch, entity, report_dates):
+    calls = []
+
+    async def no_backoff(attempt):
+        return None
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(500, json={"error": "boom"})
+        return httpx.Response(
+            200, json={"results": [], "usage": {"api_query_units": 0}}
+        )
+
+    monkeypatch.setattr(api, "async_sleep_with_backoff", no_backoff)
+    service = make_async_service(handler)
+
+    results = asyncio.run(
+        service.check_if_entity_has_results(
+            entity_id=entity.id, report_dates=report_dates
+        )
+    )
+
+    assert results == []
+    assert len(calls) == 2
+
+
+def test_shares_connections_with_the_sync_service(search_handler, entity, report_dates):
+    sync_service = APIQueryService()
+    service = make_async_service(
+        search_handler,
+        concurrency_limiter=sync_service.concurrency_limiter,
+        semaphore=sync_service.semaphore,
+    )
+
+    async def main():
+        # Requests of the sync service hold every connection
+        limit = sync_service.concurrency_limiter.limit
+        with sync_service.semaphore(limit):
+            search = asyncio.create_task(
+                service.check_if_entity_has_results(
+                    entity_id=entity.id, report_dates=report_dates
+                )
+            )
+            while sync_service.semaphore.queued() < 1:
+                await asyncio.sleep(0)
+            assert not search.done()
+        return await search
+
+    assert asyncio.run(main())
+    sync_service.cleanup()
+
+
+def test_bulk_prescreen(prescreen_handler, search_requests, report_dates, monkeypatch):
+    monkeypatch.setattr(api.settings, "API_PRESCREEN_BATCH_SIZE", 10)
+    entity_ids = [f"ENT{i:03d}" for i in range(10)]
+    service = make_async_service(prescreen_handler({"ENT001": 1, "ENT005": 1}))
+
+    results = asyncio.run(
+        service.check_if_entities_have_results(entity_ids, report_dates)
+    )
+
+    assert len(search_requests) == 1
+    assert {e for e, r in results.items() if r} == {"ENT001", "ENT005"}
+    assert set(results) == set(entity_ids)
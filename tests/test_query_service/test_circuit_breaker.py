@@ -0,0 +1,137 @@
+import time
+
+import httpx
+import pytest
+
+from bigdata_briefs.exceptions import CircuitOpenError, TooManyAPIRetriesError
+from bigdata_briefs.query_service import api
+from bigdata_briefs.query_service.circuit_breaker import (
+    CircuitBreaker,
+    CircuitState,
+    RetryBudget,
+)
+
+from .conftest import make_service
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(api, "sleep_with_backoff", lambda attempt: None)
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.on_failure()
+    breaker.on_success()
+    breaker.on_failure()
+    breaker.before_call()
+
+    breaker.on_failure()
+
+    assert breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_circuit_lets_a_single_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.on_failure()
+    time.sleep(0.06)
+
+    breaker.before_call()
+
+    assert breaker.state == CircuitState.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.on_success()
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_failed_probe_opens_the_circuit_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.on_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+
+    breaker.on_failure()
+
+    assert breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_retry_budget_caps_retries_to_a_fraction_of_requests():
+    budget = RetryBudget(ratio=0.5, max_tokens=1)
+    assert budget.try_retry()
+    assert not budget.try_retry()
+
+    budget.on_request()
+    budget.on_request()
+
+    assert budget.try_retry()
+
+
+def test_read_timeout_is_retried():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ReadTimeout("timed out", request=request)
+        return httpx.Response(200, json={"ok": True})
+
+    service = make_service(handler)
+
+    assert service._call_api("/v1/search", "POST", {}, service.headers) == {"ok": True}
+    assert len(calls) == 2
+
+
+def test_open_circuit_fails_fast():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(503)
+
+    service = make_service(
+        handler,
+        circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+    )
+
+    with pytest.raises(CircuitOpenError):
+        service._call_api("/v1/search", "POST", {}, service.headers)
+    with pytest.raises(CircuitOpenError):
+        service._call_api("/v1/search", "POST", {}, service.headers)
+
+    assert len(calls) == 2
+
+
+def test_exhausted_retry_budget_stops_retrying():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(500)
+
+    service = make_service(handler, retry_budget=RetryBudget(ratio=0, max_tokens=0))
+
+    with pytest.raises(TooManyAPIRetriesError):
+        service._call_api("/v1/search", "POST", {}, service.headers)
+
+    assert len(calls) == 1
+
+
+def test_slot_is_released_while_backing_off(monkeypatch):
+    service = None
+    weight_in_use_during_backoff = []
+
+    def backoff(attempt):
+        weight_in_use_during_backoff.append(service.semaphore.weight_in_use())
+
+    monkeypatch.setattr(api, "sleep_with_backoff", backoff)
+    responses = iter([httpx.Response(500), httpx.Response(200, json={})])
+    service = make_service(lambda request: next(responses))
+
+    service._call_api("/v1/search", "POST", {}, service.headers)
+
+    assert weight_in_use_during_backoff == [0]
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+import httpx
+import pytest
+
+from bigdata_briefs.query_service.hedging import HedgingPolicy, first_successful
+
+from .conftest import make_async_service, make_service
+
+ENDPOINT = "/v1/search"
+
+
+def make_policy(max_hedge_ratio: float = 1.0) -> HedgingPolicy:
+    policy = HedgingPolicy(
+        percentile=95, max_hedge_ratio=max_hedge_ratio, min_samples=5
+    )
+    for _ in range(5):
+        policy.record_latency(ENDPOINT, 0.01)
+    return policy
+
+
+def slow_first_handler(calls: list[int]):
+    """The first request takes a long time, the duplicate answers straight away"""
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        with lock:
+            calls.append(len(calls))
+            attempt = len(calls)
+        if attempt == 1:
+            time.sleep(1)
+        return httpx.Response(200, json={"attempt": attempt})
+
+    return handler
+
+
+def test_no_hedge_until_endpoint_has_enough_samples():
+    policy = HedgingPolicy(percentile=95, max_hedge_ratio=1.0, min_samples=5)
+    policy.record_latency(ENDPOINT, 0.01)
+
+    assert policy.on_request(ENDPOINT) is None
+
+
+def test_hedge_after_percentile_latency():
+    policy = HedgingPolicy(percentile=50, max_hedge_ratio=1.0, min_samples=3)
+    for latency in [0.1, 0.2, 0.3]:
+        policy.record_latency(ENDPOINT, latency)
+
+    assert policy.on_request(ENDPOINT) == pytest.approx(0.2)
+
+
+def test_hedges_are_capped_to_a_fraction_of_requests():
+    policy = make_policy(max_hedge_ratio=0.25)
+
+    hedges = 0
+    for _ in range(20):
+        policy.on_request(ENDPOINT)
+        hedges += policy.try_hedge()
+
+    assert hedges == 5
+
+
+def test_slow_request_is_hedged():
+    calls = []
+    service = make_service(slow_first_handler(calls))
+    service.hedging = make_policy()
+
+    start = time.perf_counter()
+    response = service._call_api(ENDPOINT, "POST", {}, service.headers)
+
+    assert response == {"attempt": 2}
+    assert time.perf_counter() - start < 0.5
+    assert len(calls) == 2
+    service.cleanup()
+
+
+def test_slow_request_is_not_hedged_over_the_cap():
+    calls = []
+    service = make_service(slow_first_handler(calls))
+    service.hedging = make_policy(max_hedge_ratio=0.1)
+
+    response = service._call_api(ENDPOINT, "POST", {}, service.headers)
+
+    assert response == {"attempt": 1}
+    assert len(calls) == 1
+    service.cleanup()
+
+
+def test_slow_request_is_hedged_async():
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(len(calls))
+        attempt = len(calls)
+        if attempt == 1:
+            await asyncio.sleep(1)
+        return httpx.Response(200, json={"attempt": attempt})
+
+    service = make_async_service(handler)
+    service.hedging = make_policy()
+
+    start = time.perf_counter()
+    response = asyncio.run(service._call_api(ENDPOINT, "POST", {}, service.headers))
+
+    assert response == {"attempt": 2}
+    # The slower request is cancelled instead of waited for
+    assert time.perf_counter() - start < 0.5
+
+
+def test_first_successful_skips_request_errors_but_not_bugs():
+    failed, succeeded, broken = Future(), Future(), Future()
+    failed.set_exception(httpx.ConnectError("boom"))
+    succeeded.set_result("response")
+    broken.set_exception(KeyError("bug"))
+
+    assert first_successful([failed, succeeded]) == "response"
+    with pytest.raises(KeyError):
+        first_successful([broken])
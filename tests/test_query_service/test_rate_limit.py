@@ -85,3 +85,138 @@ def test_rpmc_safely_avoids_infinite_loops():
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             rpmc(lambda: True)
+
+
+def test_rpmc_computes_exact_wait_for_next_permit():
+    refresh_period = 0.2
+    rpmc = rate_limit.RequestsPerMinuteController(
+        max_requests_per_min=300,  # One request per refresh
+        seconds_before_retry=0.1,
+        rate_limit_refresh_frequency=refresh_period,
+    )
+
+    waits = [rpmc.reserve() for _ in range(3)]
+
+    # The first permit is free, the next ones are spaced by exactly one refresh period
+    assert waits[0] == 0
+    assert waits[1] == pytest.approx(refresh_period, abs=0.01)
+    assert waits[2] == pytest.approx(2 * refresh_period, abs=0.01)
+
+
+def test_rpmc_follows_the_injected_clock():
+    now = 0.0
+    rpmc = rate_limit.RequestsPerMinuteController(
+        max_requests_per_min=60,
+        seconds_before_retry=1,
+        rate_limit_refresh_frequency=60,  # Bucket of 60 requests
+        clock=lambda: now,
+    )
+
+    waits = [rpmc.reserve() for _ in range(61)]
+    assert waits[59] == 0
+    assert waits[60] == pytest.approx(1)
+
+    now = 30.0
+    # 30 tokens refilled, one of them already reserved
+    assert [rpmc.reserve() for _ in range(29)][-1] == 0
+    assert rpmc.reserve() == pytest.approx(1)
+
+
+def test_rpmc_releases_waiters_in_fifo_order():
+    rpmc = rate_limit.RequestsPerMinuteController(
+        max_requests_per_min=1200,  # One request per refresh
+        seconds_before_retry=0.1,
+        rate_limit_refresh_frequency=0.05,
+    )
+    order = []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        futures = []
+        for idx in range(5):
+            futures.append(executor.submit(rpmc, order.append, idx))
+            time.sleep(0.005)  # Ensure the requests arrive in order
+        concurrent.futures.wait(futures)
+
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_rpmc_failed_reservation_does_not_consume_permit():
+    rpmc = rate_limit.RequestsPerMinuteController(
+        max_requests_per_min=1,
+        seconds_before_retry=0,
+        rate_limit_refresh_frequency=60,
+    )
+    rpmc(lambda: True)
+    tokens = rpmc._tokens
+
+    with pytest.raises(TooManyAPIRetriesError):
+        rpmc(lambda: True)
+
+    assert rpmc._tokens == pytest.approx(tokens, abs=0.01)
+
+
+def make_adaptive_rpmc(**kwargs) -> rate_limit.AdaptiveRequestsPerMinuteController:
+    params = {
+        "max_requests_per_min": 120,
+        "min_requests_per_min": 10,
+        "ceiling_requests_per_min": 150,
+        "seconds_before_retry": 0.1,
+        "rate_limit_refresh_frequency": 1,
+        "decrease_factor": 0.5,
+        "increase_per_min": 60,
+    }
+    return rate_limit.AdaptiveRequestsPerMinuteController(**(params | kwargs))
+
+
+def test_adaptive_rpmc_decreases_once_per_refresh_period():
+    rpmc = make_adaptive_rpmc()
+
+    # A burst of 429s for requests sent at the old rate only halves the rate once
+    for _ in range(5):
+        rpmc.on_rate_limited()
+
+    assert rpmc.max_requests_per_min == 60
+    assert rpmc.refill_rate == 1
+
+
+def test_adaptive_rpmc_respects_min_and_ceiling():
+    rpmc = make_adaptive_rpmc(max_requests_per_min=12, increase_per_min=10_000)
+
+    rpmc.on_rate_limited()
+    assert rpmc.max_requests_per_min == 10
+
+    rpmc.on_success()
+    assert rpmc.max_requests_per_min == 150
+
+
+def test_adaptive_rpmc_increases_additively_on_success():
+    rpmc = make_adaptive_rpmc()
+
+    # One minute worth of successful requests adds `increase_per_min` to the rate
+    for _ in range(120):
+        rpmc.on_success()
+
+    assert rpmc.max_requests_per_min == pytest.approx(150)
+
+
+def test_adaptive_rpmc_waits_for_retry_after():
+    rpmc = make_adaptive_rpmc(max_requests_per_min=600, min_requests_per_min=600)
+
+    rpmc.on_rate_limited(retry_after=0.5)
+
+    assert rpmc.reserve() == pytest.approx(0.5, abs=0.01)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("2", 2.0),
+        ("0.5", 0.5),
+        ("-3", 0.0),
+        ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),  # Date in the past
+        ("not a date", None),
+        (None, None),
+    ],
+)
+def test_parse_retry_after(value, expected):
+    assert rate_limit.parse_retry_after(value) == expected
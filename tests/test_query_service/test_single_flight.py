@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bigdata_briefs.query_service.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_with_same_key_are_coalesced():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait(timeout=5)
+        return ["result"]
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [
+            executor.submit(single_flight.do, "key", slow_call) for _ in range(5)
+        ]
+        # Give every caller the chance to join the in-flight call before releasing it
+        started.wait(timeout=5)
+        time.sleep(0.05)
+        release.set()
+        outcomes = [f.result() for f in futures]
+
+    assert len(calls) == 1
+    assert all(result == ["result"] for result, _ in outcomes)
+    assert sorted(shared for _, shared in outcomes) == [False, True, True, True, True]
+
+
+def test_exceptions_are_shared_and_key_is_released():
+    single_flight = SingleFlight()
+
+    def failing_call():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        single_flight.do("key", failing_call)
+
+    # The failed call is not remembered
+    assert single_flight.do("key", lambda: 42) == (42, False)
+
+
+def test_sequential_calls_are_not_coalesced():
+    single_flight = SingleFlight()
+    calls = []
+
+    def call():
+        calls.append(1)
+        return len(calls)
+
+    assert single_flight.do("key", call) == (1, False)
+    assert single_flight.do("key", call) == (2, False)
+
+
+def test_async_concurrent_calls_with_same_key_are_coalesced():
+    single_flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow_call(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def run():
+        return await asyncio.gather(
+            single_flight.do("a", slow_call, "a"),
+            single_flight.do("a", slow_call, "a"),
+            single_flight.do("b", slow_call, "b"),
+        )
+
+    outcomes = asyncio.run(run())
+
+    assert calls == ["a", "b"]
+    assert outcomes == [("a", False), ("a", True), ("b", False)]
+    assert single_flight._in_flight == {}
@@ -0,0 +1,110 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from bigdata_briefs.models import ReportDates
+from bigdata_briefs.query_service import api
+from bigdata_briefs.query_service.time_slices import (
+    TimeSlice,
+    TimeSlicing,
+    day_slices,
+    merge_slices,
+)
+
+from .conftest import make_result, make_service
+
+
+def make_payload(start: datetime, end: datetime) -> dict:
+    return {
+        "query": {
+            "filters": {
+                "timestamp": {"start": start.isoformat(), "end": end.isoformat()},
+                "entity": {"any_of": ["ABC123"]},
+            },
+            "max_chunks": 2,
+        }
+    }
+
+
+def test_day_slices_split_at_midnight():
+    slices = day_slices(
+        datetime(2023, 1, 1, 9),
+        datetime(2023, 1, 3, 9),
+        closed_before=datetime(2023, 1, 3),
+    )
+
+    assert slices == [
+        TimeSlice(datetime(2023, 1, 1, 9), datetime(2023, 1, 2), closed=True),
+        TimeSlice(datetime(2023, 1, 2), datetime(2023, 1, 3), closed=True),
+        TimeSlice(datetime(2023, 1, 3), datetime(2023, 1, 3, 9), closed=False),
+    ]
+
+
+def test_closed_slices_are_cached_longer():
+    time_slicing = TimeSlicing(closed_ttl_seconds=1000, settle_seconds=3600, max_days=7)
+
+    searches = time_slicing.split(
+        make_payload(datetime(2023, 1, 1), datetime(2023, 1, 4)),
+        now=datetime(2023, 1, 3, 0, 30),
+    )
+
+    assert [s.payload["query"]["filters"]["timestamp"] for s in searches] == [
+        {"start": "2023-01-01T00:00:00", "end": "2023-01-02T00:00:00"},
+        {"start": "2023-01-02T00:00:00", "end": "2023-01-03T00:00:00"},
+        {"start": "2023-01-03T00:00:00", "end": "2023-01-04T00:00:00"},
+    ]
+    # The previous day is still settling
+    assert [s.ttl_seconds for s in searches] == [1000, None, None]
+    assert searches[0].payload["query"]["filters"]["entity"] == {"any_of": ["ABC123"]}
+
+
+@pytest.mark.parametrize(
+    "start, end",
+    [
+        (datetime(2023, 1, 1, 8), datetime(2023, 1, 1, 20)),  # A single day
+        (datetime(2023, 1, 1), datetime(2023, 2, 1)),  # More than max_days
+    ],
+)
+def test_searches_not_worth_splitting(start, end):
+    time_slicing = TimeSlicing(closed_ttl_seconds=1000, settle_seconds=0, max_days=7)
+
+    assert time_slicing.split(make_payload(start, end)) == []
+
+
+def test_merge_slices_keeps_the_most_relevant_chunks():
+    merged = merge_slices(
+        [
+            [make_result("doc-1", [(0, 0.1), (1, 0.8)])],
+            [
+                make_result("doc-2", [(0, 0.9)]),
+                make_result("doc-1", [(0, 0.1), (1, 0.8)]),
+            ],
+        ],
+        max_chunks=2,
+    )
+
+    assert [(r.document_id, [c.relevance for c in r.chunks]) for r in merged] == [
+        ("doc-2", [0.9]),
+        ("doc-1", [0.8]),
+    ]
+
+
+def test_rolling_window_only_searches_the_open_day(
+    search_handler, search_requests, search_cache, monkeypatch
+):
+    monkeypatch.setattr(api.settings, "SEARCH_TIME_SLICING_ENABLED", True)
+    monkeypatch.setattr(api.settings, "SEARCH_SLICE_SETTLE_SECONDS", 0)
+    service = make_service(search_handler, search_cache=search_cache)
+    # Both ends fall on the current day whatever the time of the run
+    today = datetime.combine(datetime.now(UTC).date(), datetime.min.time())
+    start = today - timedelta(days=3)
+
+    for end in [today + timedelta(hours=12), today + timedelta(hours=12, minutes=1)]:
+        results = service.check_if_entity_has_results(
+            entity_id="ABC123",
+            report_dates=ReportDates(start=start, end=end, novelty=False),
+        )
+        assert [r.document_id for r in results] == ["doc-no-text"]
+
+    # 3 past days and today, then today again
+    assert len(search_requests) == 5
@@ -0,0 +1,83 @@
+from datetime import UTC, datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from sqlmodel import SQLModel, create_engine
+
+from bigdata_briefs.cache import SQLiteCache
+from bigdata_briefs.query_service import watchlists as watchlists_module
+from bigdata_briefs.query_service.watchlists import WatchlistProvider
+
+LAST_UPDATED = datetime(2024, 1, 1, tzinfo=UTC)
+
+
+@pytest.fixture
+def sdk_client(monkeypatch):
+    client = MagicMock()
+    client.watchlists.get.return_value = SimpleNamespace(
+        id="wl1", name="Watchlist", last_updated=LAST_UPDATED, items=["ENT001"]
+    )
+    client.watchlists.list.return_value = [
+        SimpleNamespace(id="wl1", last_updated=LAST_UPDATED)
+    ]
+    monkeypatch.setattr(watchlists_module, "get_sdk_client", lambda: client)
+    return client
+
+
+@pytest.fixture
+def watchlist_cache(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    SQLModel.metadata.create_all(engine)
+    return SQLiteCache(
+        engine, namespace="watchlists", ttl_seconds=60, max_size_bytes=1_000_000
+    )
+
+
+def test_fresh_watchlist_is_served_from_cache(sdk_client, watchlist_cache):
+    provider = WatchlistProvider(watchlist_cache, revalidate_after_seconds=60)
+
+    first = provider.get("wl1")
+    second = provider.get("wl1")
+
+    assert first == second
+    assert second.items == ["ENT001"]
+    assert sdk_client.watchlists.get.call_count == 1
+    sdk_client.watchlists.list.assert_not_called()
+
+
+def test_stale_watchlist_is_revalidated(sdk_client, watchlist_cache):
+    provider = WatchlistProvider(watchlist_cache, revalidate_after_seconds=0)
+    provider.get("wl1")
+
+    provider.get("wl1")
+    # Unchanged, the items are not requested again
+    assert sdk_client.watchlists.get.call_count == 1
+    assert sdk_client.watchlists.list.call_count == 1
+
+    sdk_client.watchlists.list.return_value = [
+        SimpleNamespace(id="wl1", last_updated=datetime.now(UTC))
+    ]
+    provider.get("wl1")
+    # Updated since it was cached, fetched again
+    assert sdk_client.watchlists.get.call_count == 2
+
+
+def test_without_cache_always_fetches(sdk_client):
+    provider = WatchlistProvider()
+
+    provider.get("wl1")
+    provider.get("wl1")
+
+    assert sdk_client.watchlists.get.call_count == 2
+
+
+def test_failed_revalidation_fetches_again(sdk_client, watchlist_cache):
+    provider = WatchlistProvider(watchlist_cache, revalidate_after_seconds=0)
+    provider.get("wl1")
+
+    sdk_client.watchlists.list.side_effect = requests.ConnectionError("boom")
+    provider.get("wl1")
+
+    assert sdk_client.watchlists.get.call_count == 2
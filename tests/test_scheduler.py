@@ -0,0 +1,167 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bigdata_briefs.scheduler import (
+    FairShareScheduler,
+    Priority,
+    get_scheduling_context,
+    reset_scheduling_context,
+    set_scheduling_context,
+)
+from bigdata_briefs.utils import submit_with_context
+
+
+def start_flow(scheduler, flow_id, priority, n_tasks, order) -> list[threading.Thread]:
+    """Start `n_tasks` threads acquiring the scheduler on behalf of `flow_id`"""
+
+    def task():
+        with scheduler(1):
+            order.append(flow_id)
+
+    token = set_scheduling_context(flow_id, priority)
+    try:
+        threads = [
+            threading.Thread(target=contextvars.copy_context().run, args=(task,))
+            for _ in range(n_tasks)
+        ]
+    finally:
+        reset_scheduling_context(token)
+
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def wait_until_queued(scheduler, n):
+    deadline = time.time() + 2
+    while scheduler.queued() < n and time.time() < deadline:
+        time.sleep(0.001)
+    assert scheduler.queued() == n
+
+
+def test_flows_share_capacity_fairly():
+    scheduler = FairShareScheduler(1)
+    order = []
+
+    with scheduler(1):
+        big = start_flow(scheduler, "big", Priority.INTERACTIVE, 6, order)
+        wait_until_queued(scheduler, 6)
+        small = start_flow(scheduler, "small", Priority.INTERACTIVE, 2, order)
+        wait_until_queued(scheduler, 8)
+
+    for thread in big + small:
+        thread.join()
+
+    # The small flow is interleaved with the big one instead of waiting for all of it
+    assert order[:4].count("small") == 2
+    assert order.count("big") == 6
+
+
+def test_interactive_is_served_before_batch():
+    scheduler = FairShareScheduler(1)
+    order = []
+
+    with scheduler(1):
+        batch = start_flow(scheduler, "batch", Priority.BATCH, 3, order)
+        wait_until_queued(scheduler, 3)
+        interactive = start_flow(
+            scheduler, "interactive", Priority.INTERACTIVE, 2, order
+        )
+        wait_until_queued(scheduler, 5)
+
+    for thread in batch + interactive:
+        thread.join()
+
+    assert order == ["interactive"] * 2 + ["batch"] * 3
+
+
+def test_resize_admits_waiters():
+    scheduler = FairShareScheduler(1)
+    acquired = threading.Event()
+
+    def task():
+        with scheduler(1):
+            acquired.set()
+
+    with scheduler(1):
+        thread = threading.Thread(target=task)
+        thread.start()
+        wait_until_queued(scheduler, 1)
+
+        scheduler.resize(2)
+        assert acquired.wait(1)
+    thread.join()
+
+    assert scheduler.weight_available() == 2
+
+
+def test_async_waiters_share_capacity_with_threads():
+    scheduler = FairShareScheduler(1)
+    order = []
+
+    async def task(name):
+        async with scheduler.acquire_async(1):
+            order.append(name)
+
+    async def main():
+        with scheduler(1):
+            tasks = [asyncio.create_task(task(i)) for i in range(3)]
+            while scheduler.queued() < 3:
+                await asyncio.sleep(0)
+            assert order == []
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+    assert order == [0, 1, 2]
+    assert scheduler.weight_available() == 1
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    scheduler = FairShareScheduler(1)
+
+    async def task():
+        async with scheduler.acquire_async(1):
+            pass
+
+    async def main():
+        with scheduler(1):
+            waiter = asyncio.create_task(task())
+            while scheduler.queued() < 1:
+                await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert scheduler.queued() == 0
+
+    asyncio.run(main())
+
+    assert scheduler.weight_available() == 1
+
+
+def test_acquiring_outside_of_the_queue_is_rejected():
+    scheduler = FairShareScheduler(1)
+
+    with pytest.raises(NotImplementedError):
+        scheduler.try_acquire(1)
+    with pytest.raises(NotImplementedError):
+        scheduler.release(1)
+    assert scheduler.weight_available() == 1
+
+
+def test_submit_with_context_propagates_scheduling_context():
+    token = set_scheduling_context("brief-1", Priority.BATCH)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            context = submit_with_context(executor, get_scheduling_context).result()
+    finally:
+        reset_scheduling_context(token)
+
+    assert context.flow_id == "brief-1"
+    assert context.priority == Priority.BATCH
+    assert get_scheduling_context().flow_id != "brief-1"
@@ -3,8 +3,18 @@ from unittest.mock import MagicMock
 from uuid import UUID
 
 import pytest
+from sqlalchemy.exc import OperationalError
 
 from bigdata_briefs.api.models import BriefCreationRequest
+from bigdata_briefs.budget import (
+    QueryUnitBudget,
+    reset_query_unit_budget,
+    set_query_unit_budget,
+)
+from bigdata_briefs.llm_batch import (
+    reset_llm_batch_collector,
+    set_llm_batch_collector,
+)
 from bigdata_briefs.models import (
     Chunk,
     ChunkHighlight,
@@ -18,6 +28,7 @@ from bigdata_briefs.models import (
     TopicMetadata,
 )
 from bigdata_briefs.service import BriefPipelineService
+from bigdata_briefs.topic_yield import TopicSelection
 
 
 @pytest.fixture
@@ -152,6 +163,27 @@ def test_generate_follow_up_questions(
     llm_client.call_with_response_format.assert_called()
 
 
+def test_follow_up_questions_go_through_the_batch_collector_of_the_brief(
+    mock_service, mock_topics, mock_entity, mock_report_dates, mock_results
+):
+    service, llm_client, _, _, _ = mock_service
+    collector = MagicMock()
+    collector.call_with_response_format.return_value = FollowUpAnalysis(
+        questions=["Q1"]
+    )
+
+    token = set_llm_batch_collector(collector)
+    try:
+        questions = service.generate_follow_up_questions(
+            mock_entity, mock_topics, mock_report_dates, mock_results
+        )
+    finally:
+        reset_llm_batch_collector(token)
+
+    assert questions == ["Q1"]
+    llm_client.call_with_response_format.assert_not_called()
+
+
 def test_generate_new_report(
     mock_service, mock_entity, mock_report_dates, mock_qa_pairs
 ):
@@ -217,3 +249,102 @@ def test_correctly_checks_for_entity_placeholder_in_topics(mock_service):
 
     assert "Invalid topic" in str(exc_info.value)
     assert "'{entity}'" in str(exc_info.value)
+
+
+def test_follow_up_questions_are_shed_when_budget_runs_low(
+    mock_service, mock_entity, mock_report_dates, mock_results, mock_qa_pairs
+):
+    service, _, query_service, _, _ = mock_service
+    query_service.run_query_with_follow_up_questions.return_value = mock_qa_pairs
+    budget = QueryUnitBudget(100)
+    budget.consume(75)
+    token = set_query_unit_budget(budget)
+    try:
+        service.run_follow_up_questions(
+            mock_entity,
+            ["Q1", "Q2", "Q3", "Q4", "Q5"],
+            mock_results,
+            None,
+            None,
+            mock_report_dates,
+            None,
+            None,
+            MagicMock(),
+        )
+        budget.consume(20)
+        qa_pairs = service.run_follow_up_questions(
+            mock_entity,
+            ["Q1", "Q2"],
+            mock_results,
+            None,
+            None,
+            mock_report_dates,
+            None,
+            None,
+            MagicMock(),
+        )
+    finally:
+        reset_query_unit_budget(token)
+
+    (call,) = query_service.run_query_with_follow_up_questions.call_args_list
+    assert len(call.kwargs["follow_up_questions"]) == 2
+    # Once the budget is almost exhausted the exploratory results answer the report
+    assert qa_pairs.pairs[0].answer == mock_results
+    assert budget.usage().follow_up_questions_shed == 5
+
+
+def test_parse_and_validate_searches_identical_topics_once(mock_service, mock_entity):
+    service, _, query_service, _, _ = mock_service
+    query_service.get_entities.return_value = [mock_entity]
+
+    request = BriefCreationRequest(
+        entities=["test"],
+        report_start_date=datetime(2023, 1, 1),
+        report_end_date=datetime(2023, 1, 31),
+        topics=[
+            "What is new for {entity}?",
+            "Risks of {entity}?",
+            "What is new for {entity}?",
+        ],
+    )
+
+    validated = service.parse_and_validate(
+        request, UUID("12345678-1234-5678-1234-567812345678"), MagicMock()
+    )
+
+    assert validated.topics == ["What is new for {entity}?", "Risks of {entity}?"]
+
+
+def test_select_topics_logs_the_skipped_topics(mock_service, mock_entity):
+    service, _, _, _, _ = mock_service
+    service.topic_pruner = MagicMock()
+    service.topic_pruner.select_topics.return_value = {
+        "test": TopicSelection(kept=["T1"], skipped=["T2", "T3"]),
+    }
+    storage_manager = MagicMock()
+    request_id = UUID("12345678-1234-5678-1234-567812345678")
+
+    topics = service.select_topics(
+        [mock_entity], ["T1", "T2", "T3"], request_id, storage_manager
+    )
+
+    assert topics == {"test": ["T1"]}
+    (call,) = storage_manager.log_message.call_args_list
+    assert call.args[0] == request_id
+    assert "Skipped 2 low-yield topic searches for 1 entities" in call.args[1]
+
+
+def test_select_topics_searches_every_topic_when_pruning_fails(
+    mock_service, mock_entity
+):
+    service, _, _, _, _ = mock_service
+    service.topic_pruner = MagicMock()
+    service.topic_pruner.select_topics.side_effect = OperationalError(
+        "SELECT", {}, Exception("database is locked")
+    )
+
+    topics = service.select_topics(
+        [mock_entity], ["T1", "T2"], UUID(int=0), MagicMock()
+    )
+
+    assert topics == {"test": ["T1", "T2"]}
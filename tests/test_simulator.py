@@ -0,0 +1,129 @@
+import pytest
+
+from bigdata_briefs.loadtest.simulator import (
+    DEFAULT_LATENCIES,
+    Delay,
+    EventLoop,
+    LatencyDistribution,
+    LatencySource,
+    SimulationConfig,
+    Stage,
+    latencies_from_logs,
+    simulate,
+)
+
+
+def constant_latencies(**latencies: float) -> dict[LatencySource, LatencyDistribution]:
+    return {
+        source: LatencyDistribution.from_samples([latencies.get(source, 1.0)])
+        for source in LatencySource
+    }
+
+
+def make_config(**kwargs) -> SimulationConfig:
+    params = {
+        "n_entities": 1,
+        "topics": 3,
+        "follow_up_questions": 2,
+        "simultaneous_requests": 40,
+        "requests_per_minute": 6000,
+        "max_requests_per_minute": 6000,
+        "bulk_prescreen": False,
+        "novelty": False,
+        "disable_introduction": True,
+    }
+    return SimulationConfig(**(params | kwargs))
+
+
+def test_event_loop_advances_virtual_time():
+    loop = EventLoop()
+    finished_at = []
+
+    def process(delay):
+        yield Delay(delay)
+        finished_at.append(loop.now)
+
+    loop.start(process(5))
+    loop.start(process(2))
+
+    assert loop.run() == 5
+    assert finished_at == [2, 5]
+
+
+def test_single_entity_runs_the_stages_in_sequence():
+    latencies = constant_latencies(
+        search=1.0, follow_up_llm=5.0, report_llm=10.0, embeddings=0.5
+    )
+
+    result = simulate(make_config(novelty=True), latencies)
+
+    # Pre-check, exploratory fan-out, follow-up LLM, follow-up searches, report, novelty
+    assert result.wall_time == pytest.approx(1 + 1 + 5 + 1 + 10 + 0.5)
+    assert result.n_searches == 1 + 4 + 2
+    assert result.n_llm_calls == 2
+    assert result.stage_durations[Stage.EXPLORATORY_SEARCH] == [pytest.approx(1)]
+
+
+def test_searches_are_bounded_by_the_simultaneous_requests():
+    result = simulate(
+        make_config(simultaneous_requests=1), constant_latencies(search=1.0)
+    )
+
+    # The 4 exploratory searches and 2 follow-up searches run one after the other
+    assert result.stage_durations[Stage.EXPLORATORY_SEARCH] == [pytest.approx(4)]
+    assert result.stage_durations[Stage.FOLLOW_UP_SEARCH] == [pytest.approx(2)]
+
+
+def test_searches_are_bounded_by_the_rate_limit():
+    config = make_config(
+        topics=119,
+        simultaneous_requests=200,
+        requests_per_minute=60,
+        max_requests_per_minute=60,
+    )
+
+    result = simulate(config, constant_latencies(search=0.1))
+
+    # The bucket holds 5 requests, the other 115 exploratory searches wait one second each
+    assert result.stage_durations[Stage.EXPLORATORY_SEARCH][0] == pytest.approx(
+        115.1, abs=1
+    )
+
+
+def test_intro_is_generated_for_the_entities_with_reports():
+    config = make_config(n_entities=3, disable_introduction=False, no_info_ratio=0.0)
+
+    result = simulate(config, constant_latencies(intro_llm=2.0))
+
+    # Bullet points in parallel, then the title
+    assert result.stage_durations[Stage.INTRO] == [pytest.approx(4)]
+    assert result.n_llm_calls == 3 * 2 + 3 + 1
+
+
+def test_entities_without_results_skip_the_pipeline():
+    result = simulate(make_config(n_entities=5, no_info_ratio=1.0))
+
+    assert result.n_reports == 0
+    assert result.n_searches == 5
+    assert Stage.EXPLORATORY_SEARCH not in result.stage_durations
+
+
+def test_latencies_from_logs():
+    lines = [
+        "2025-01-01 [debug] 10:00:01.25 - Generate follow up questions - 4.5",
+        "2025-01-01 [debug] 10:00:03.00 - Generating report - 9.25",
+        "2025-01-01 [debug] api_search executed in 0.75s",
+        "2025-01-01 [debug] api_search executed in 1.25s",
+        "2025-01-01 [debug] Exploratory search. Entity AAAAA1 - something else",
+    ]
+
+    latencies = latencies_from_logs(lines)
+
+    assert latencies[LatencySource.SEARCH].samples == [0.75, 1.25]
+    assert latencies[LatencySource.SEARCH].median == 1.0
+    assert latencies[LatencySource.FOLLOW_UP_LLM].samples == [4.5]
+    assert latencies[LatencySource.REPORT_LLM].samples == [9.25]
+    assert (
+        latencies[LatencySource.EMBEDDINGS]
+        is DEFAULT_LATENCIES[LatencySource.EMBEDDINGS]
+    )
@@ -0,0 +1,105 @@
+import pytest
+from test_query_service.conftest import make_result
+
+from bigdata_briefs.metrics import PromptBudgetMetrics
+from bigdata_briefs.models import Result
+from bigdata_briefs.prompts import token_budget
+from bigdata_briefs.prompts.prompt_loader import get_prompt_keys
+from bigdata_briefs.prompts.token_budget import (
+    PromptTokenBudget,
+    count_tokens,
+    most_relevant_chunks,
+)
+
+MODEL = "gpt-4o-mini"
+# Long enough for a few chunks to go over the budgets of the tests
+CHUNK_TEXT = "Chunk {cnum} of {document_id}. " * 20
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    PromptBudgetMetrics.reset_usage()
+    yield
+    PromptBudgetMetrics.reset_usage()
+
+
+def render(result_lists: list[list[Result]]) -> str:
+    return "\n".join(
+        chunk.text
+        for results in result_lists
+        for result in results
+        for chunk in result.chunks
+    )
+
+
+def chunk_relevances(result_lists: list[list[Result]]) -> list[list[list[float]]]:
+    return [
+        [[chunk.relevance for chunk in result.chunks] for result in results]
+        for results in result_lists
+    ]
+
+
+def test_prompts_under_the_budget_are_kept_whole():
+    results = [[make_result("doc-1", [(0, 0.5), (1, 0.2)], text=CHUNK_TEXT)]]
+    budget = PromptTokenBudget("test", max_tokens=10_000, model=MODEL)
+
+    assert budget.fit(results, render) == render(results)
+    usage = PromptBudgetMetrics.get_total_usage()
+    assert usage.prompts == 1
+    assert usage.trimmed_prompts == 0
+    assert usage.tokens_before == usage.tokens_after > 0
+
+
+def test_least_relevant_chunks_are_dropped_to_fit_the_budget():
+    results = [
+        [
+            make_result("doc-1", [(0, 0.9), (1, 0.1)], text=CHUNK_TEXT),
+            make_result("doc-2", [(0, 0.2)], text=CHUNK_TEXT),
+        ],
+        [make_result("doc-3", [(0, 0.8), (1, 0.7)], text=CHUNK_TEXT)],
+    ]
+    chunk_tokens = count_tokens(results[0][0].chunks[0].text, MODEL)
+    budget = PromptTokenBudget("test", max_tokens=3 * chunk_tokens + 2, model=MODEL)
+
+    prompt = budget.fit(results, render)
+
+    assert prompt == render(most_relevant_chunks(results, 3))
+    assert count_tokens(prompt, MODEL) <= budget.max_tokens
+    usage = PromptBudgetMetrics.get_total_usage()
+    assert usage.trimmed_prompts == 1
+    assert usage.dropped_chunks == 2
+    assert usage.tokens_after < usage.tokens_before
+
+
+def test_most_relevant_chunks_keep_the_order_of_the_results():
+    results = [
+        [
+            make_result("doc-1", [(0, 0.1), (1, 0.9)], text=CHUNK_TEXT),
+            make_result("doc-2", [(0, 0.2)], text=CHUNK_TEXT),
+        ],
+        [make_result("doc-3", [(0, 0.8)], text=CHUNK_TEXT)],
+    ]
+
+    # Documents without chunks left are dropped
+    assert chunk_relevances(most_relevant_chunks(results, 2)) == [[[0.9]], [[0.8]]]
+    assert chunk_relevances(most_relevant_chunks(results, 0)) == [[], []]
+
+
+def test_count_tokens_is_estimated_without_tiktoken(monkeypatch):
+    monkeypatch.setattr(token_budget, "tiktoken", None)
+
+    assert count_tokens("a" * 400, MODEL) == 100
+
+
+def test_budgets_can_be_overridden_in_the_settings(monkeypatch):
+    prompt_keys = get_prompt_keys("follow_up_questions")
+    monkeypatch.setattr(
+        token_budget.settings, "PROMPT_TOKEN_BUDGETS", {"follow_up_questions": 1000}
+    )
+
+    budget = PromptTokenBudget.for_prompt("follow_up_questions", prompt_keys)
+    assert budget.max_tokens == 1000
+    assert budget.model == prompt_keys.llm_kwargs["model"]
+
+    monkeypatch.setattr(token_budget.settings, "PROMPT_TOKEN_BUDGET_ENABLED", False)
+    assert PromptTokenBudget.for_prompt("follow_up_questions", prompt_keys) is None
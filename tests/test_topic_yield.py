@@ -0,0 +1,131 @@
+import random
+
+import pytest
+from sqlmodel import SQLModel, create_engine
+
+from bigdata_briefs.models import Entity, TopicContentTracker, TopicYield
+from bigdata_briefs.topic_yield import (
+    ENTITY_SCOPE,
+    SECTOR_SCOPE,
+    SQLiteTopicYieldStorage,
+    TopicPruner,
+    topic_yields_from_trackers,
+)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'briefs.db'}")
+    SQLModel.metadata.create_all(engine)
+    return SQLiteTopicYieldStorage(engine)
+
+
+def make_entity(entity_id: str, sector: str | None = "Technology") -> Entity:
+    entity = Entity(id=entity_id, name=entity_id, entity_type="Companies")
+    entity._raw = {"id": entity_id, "category": "Companies", "sector": sector}
+    return entity
+
+
+def make_tracker(entity_id: str, topic: str, hit: bool) -> TopicContentTracker:
+    retrieval = []
+    if hit:
+        retrieval = [
+            {
+                "retrieval_timestamp": "2024-01-01T00:00:00",
+                "entity_id": entity_id,
+                "result": [],
+            }
+        ]
+    return TopicContentTracker(topic=topic, retrieval=retrieval, entity_id=entity_id)
+
+
+def make_pruner(storage, explore_ratio: float = 0.0) -> TopicPruner:
+    return TopicPruner(
+        storage,
+        min_searches=4,
+        min_hit_rate=0.1,
+        explore_ratio=explore_ratio,
+        rng=random.Random(0),
+    )
+
+
+def test_yields_are_aggregated_per_entity_and_sector():
+    entities = [make_entity("E1"), make_entity("E2"), make_entity("E3", sector=None)]
+    trackers = [
+        make_tracker("E1", "t1", hit=True),
+        make_tracker("E1", "t1", hit=False),
+        make_tracker("E2", "t1", hit=True),
+        make_tracker("E3", "t1", hit=True),
+        make_tracker("E1", "not a topic of the brief", hit=True),
+        make_tracker("OTHER", "t1", hit=True),
+    ]
+
+    yields = topic_yields_from_trackers(trackers, entities, ["t1"])
+
+    assert yields[ENTITY_SCOPE] == {
+        ("E1", "t1"): TopicYield(searches=2, hits=1),
+        ("E2", "t1"): TopicYield(searches=1, hits=1),
+        ("E3", "t1"): TopicYield(searches=1, hits=1),
+    }
+    assert yields[SECTOR_SCOPE] == {
+        ("Technology", "t1"): TopicYield(searches=3, hits=2)
+    }
+
+
+def test_storage_adds_to_the_stored_yields(storage):
+    storage.add(ENTITY_SCOPE, {("E1", "t1"): TopicYield(searches=2, hits=1)})
+    storage.add(
+        ENTITY_SCOPE,
+        {
+            ("E1", "t1"): TopicYield(searches=3, hits=0),
+            ("E1", "t2"): TopicYield(searches=1, hits=1),
+        },
+    )
+
+    assert storage.retrieve(ENTITY_SCOPE, ["E1"]) == {
+        ("E1", "t1"): TopicYield(searches=5, hits=1),
+        ("E1", "t2"): TopicYield(searches=1, hits=1),
+    }
+    assert storage.retrieve(SECTOR_SCOPE, ["E1"]) == {}
+
+
+def test_pruner_skips_topics_without_yield(storage):
+    storage.add(
+        ENTITY_SCOPE,
+        {
+            ("E1", "dry"): TopicYield(searches=10, hits=0),
+            ("E1", "good"): TopicYield(searches=10, hits=9),
+            ("E1", "fair"): TopicYield(searches=10, hits=5),
+        },
+    )
+
+    selection = make_pruner(storage).select_topics(
+        [make_entity("E1")], ["fair", "dry", "new", "good"]
+    )["E1"]
+
+    # Topics without history are kept first, then by decreasing hit rate
+    assert selection.kept == ["new", "good", "fair"]
+    assert selection.skipped == ["dry"]
+
+
+def test_pruner_falls_back_to_the_sector(storage):
+    storage.add(ENTITY_SCOPE, {("E1", "ratings"): TopicYield(searches=1, hits=1)})
+    storage.add(SECTOR_SCOPE, {("Private", "ratings"): TopicYield(searches=50, hits=0)})
+
+    selections = make_pruner(storage).select_topics(
+        [make_entity("E1", sector="Private"), make_entity("E2", sector="Banks")],
+        ["ratings"],
+    )
+
+    assert selections["E1"].skipped == ["ratings"]
+    assert selections["E2"].kept == ["ratings"]
+
+
+def test_pruner_explores_skipped_topics(storage):
+    storage.add(ENTITY_SCOPE, {("E1", "dry"): TopicYield(searches=10, hits=0)})
+
+    selection = make_pruner(storage, explore_ratio=1.0).select_topics(
+        [make_entity("E1")], ["dry"]
+    )["E1"]
+
+    assert selection.kept == ["dry"]
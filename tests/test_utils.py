@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 from pydantic import BaseModel, ValidationError
 
@@ -28,6 +30,18 @@ def test_decorator_does_not_affect_output(decorator):
     assert result == "bar"
 
 
+@pytest.mark.parametrize(
+    "decorator", [log_time, log_args, log_return_value, log_performance]
+)
+def test_decorator_does_not_affect_coroutine_output(decorator):
+    @decorator
+    async def foo():
+        return "bar"
+
+    result = asyncio.run(foo())
+    assert result == "bar"
+
+
 def test_validate_and_repair_model_valid():
     json_str = '{"x": 5}'
     result = validate_and_repair_model(json_str, DummyModel)
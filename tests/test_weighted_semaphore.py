@@ -81,3 +81,43 @@ def test_context_manager_releases_after_exception():
     assert sem.weight_available() == SEMAPHORE_WEIGHT, (
         "Semaphore should be released after exception"
     )
+
+
+def test_weight_bigger_than_capacity_runs_alone():
+    sem = WeightedSemaphore(2)
+
+    with sem(5):
+        assert sem.weight_available() == 0
+
+    assert sem.weight_available() == 2
+
+
+def test_resize_wakes_up_waiters():
+    sem = WeightedSemaphore(1)
+    acquired = threading.Event()
+
+    def worker():
+        with sem(1):
+            acquired.set()
+
+    with sem(1):
+        t = threading.Thread(target=worker)
+        t.start()
+        assert not acquired.wait(0.05)
+
+        sem.resize(2)
+        assert acquired.wait(1)
+    t.join()
+
+    assert sem.weight_available() == 2
+
+
+def test_try_acquire_does_not_wait():
+    sem = WeightedSemaphore(3)
+
+    acquired = sem.try_acquire(2)
+
+    assert acquired == 2
+    assert sem.try_acquire(2) is None
+    sem.release(acquired)
+    assert sem.weight_available() == 3